@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains a chunked recorder for long-running, row-wise data acquisition.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import queue
+import tempfile
+import threading
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ChunkedDataRecorder:
+    """ Columnar float64 recorder storing rows of (timestamp, value_1, ..., value_n).
+
+    Rows are copied into a preallocated chunk. Full chunks are handed over to a background thread
+    which appends them to a raw binary file (if a spill directory is given). Flushed chunks are
+    dropped from memory and read back via numpy.memmap on demand, so the RAM footprint is bounded
+    by a few chunks independent of the recording duration.
+
+    The recorder can be indexed and sliced like a 2D array along the row axis
+    (e.g. recorder[-100:]) and supports len(). The first column is expected to be a monotonically
+    increasing timestamp which allows to query rows by time range (see get_time_range).
+    """
+
+    def __init__(self, number_of_columns, chunk_size=65536, spill_path=None):
+        """
+        @param int number_of_columns: number of columns per row (including the timestamp column)
+        @param int chunk_size: number of rows per chunk
+        @param str spill_path: optional, directory to spill full chunks to. If None, all chunks are
+                               kept in memory.
+        """
+        self._number_of_columns = int(number_of_columns)
+        self._chunk_size = int(chunk_size)
+        self._spill_path = spill_path
+
+        self._lock = threading.RLock()
+        # Serializes access to the spill file. Always acquire before self._lock.
+        self._file_lock = threading.Lock()
+        self._current_chunk = np.empty((self._chunk_size, self._number_of_columns),
+                                       dtype='float64')
+        self._current_fill = 0
+        # Full chunks that are not (yet) written to disk, starting at chunk index _flushed_chunks
+        self._memory_chunks = list()
+        self._flushed_chunks = 0
+        # First timestamp of each full chunk for fast time range lookup
+        self._chunk_start_times = list()
+
+        self._spill_file = None
+        self._spill_file_name = None
+        self._flush_queue = None
+        self._flush_thread = None
+        if self._spill_path is not None:
+            os.makedirs(self._spill_path, exist_ok=True)
+            fd, self._spill_file_name = tempfile.mkstemp(prefix='qudi_recording_',
+                                                         suffix='.bin',
+                                                         dir=self._spill_path)
+            self._spill_file = os.fdopen(fd, 'w+b')
+            self._flush_queue = queue.Queue()
+            self._flush_thread = threading.Thread(target=self._flush_loop,
+                                                  name='ChunkedDataRecorderFlush',
+                                                  daemon=True)
+            self._flush_thread.start()
+        return
+
+    @property
+    def number_of_columns(self):
+        return self._number_of_columns
+
+    def __len__(self):
+        with self._lock:
+            return self._full_rows() + self._current_fill
+
+    def __getitem__(self, item):
+        """ Returns the selected rows as numpy array (always a copy).
+
+        @param int|slice item: row index or slice (step is supported)
+
+        @return numpy.ndarray: selected row(s)
+        """
+        with self._lock:
+            length = self._full_rows() + self._current_fill
+            if isinstance(item, slice):
+                start, stop, step = item.indices(length)
+                if step == 1:
+                    return self._get_rows(start, max(start, stop))
+                return self._get_rows(0, length)[item]
+            index = int(item)
+            if index < 0:
+                index += length
+            if not 0 <= index < length:
+                raise IndexError('Row index {0} out of range for recorder with {1:d} rows.'
+                                 ''.format(item, length))
+            return self._get_rows(index, index + 1)[0]
+
+    def append(self, rows):
+        """ Appends one or more rows to the recording.
+
+        @param numpy.ndarray rows: single row with shape (columns,) or rows with shape
+                                   (n, columns)
+        """
+        rows = np.asarray(rows, dtype='float64')
+        if rows.ndim == 1:
+            rows = rows[np.newaxis, :]
+        if rows.shape[1] != self._number_of_columns:
+            raise ValueError('Rows to record must have {0:d} columns but have {1:d}.'
+                             ''.format(self._number_of_columns, rows.shape[1]))
+        with self._lock:
+            written = 0
+            while written < rows.shape[0]:
+                to_write = min(rows.shape[0] - written, self._chunk_size - self._current_fill)
+                self._current_chunk[self._current_fill:self._current_fill + to_write] = \
+                    rows[written:written + to_write]
+                self._current_fill += to_write
+                written += to_write
+                if self._current_fill == self._chunk_size:
+                    self._finish_current_chunk()
+        return
+
+    def get_data(self):
+        """ Returns all recorded rows as a single numpy array.
+
+        @return numpy.ndarray: recorded data with shape (rows, columns)
+        """
+        return self[:]
+
+    def get_time_range(self, start_time=None, stop_time=None):
+        """ Returns all rows with start_time <= timestamp < stop_time.
+
+        Only the chunks containing the boundaries are searched, the rest of the recording is not
+        touched.
+
+        @param float start_time: optional, first timestamp to include (default: from the start)
+        @param float stop_time: optional, first timestamp to exclude (default: until the end)
+
+        @return numpy.ndarray: selected rows with shape (n, columns)
+        """
+        with self._lock:
+            length = self._full_rows() + self._current_fill
+            start = 0 if start_time is None else self._search_time(start_time)
+            stop = length if stop_time is None else self._search_time(stop_time)
+            return self._get_rows(start, max(start, stop))
+
+    def clear(self):
+        """ Removes all recorded rows (and truncates the spill file). The recorder stays usable.
+        """
+        with self._file_lock, self._lock:
+            self._current_fill = 0
+            self._memory_chunks = list()
+            self._flushed_chunks = 0
+            self._chunk_start_times = list()
+            if self._spill_file is not None:
+                self._spill_file.seek(0)
+                self._spill_file.truncate()
+        return
+
+    def close(self):
+        """ Stops the background flushing and deletes the spill file. All data is discarded.
+        """
+        if self._flush_thread is not None:
+            self._flush_queue.put(None)
+            self._flush_thread.join()
+            self._flush_thread = None
+        with self._file_lock, self._lock:
+            self._memory_chunks = list()
+            self._current_fill = 0
+            self._flushed_chunks = 0
+            self._chunk_start_times = list()
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+                try:
+                    os.remove(self._spill_file_name)
+                except OSError:
+                    logger.warning('Unable to remove recording spill file "{0}".'
+                                   ''.format(self._spill_file_name))
+        return
+
+    def _full_rows(self):
+        return (self._flushed_chunks + len(self._memory_chunks)) * self._chunk_size
+
+    def _finish_current_chunk(self):
+        """ Moves the full current chunk to the list of full chunks and queues it for flushing.
+        """
+        chunk = self._current_chunk
+        self._chunk_start_times.append(chunk[0, 0])
+        self._memory_chunks.append(chunk)
+        self._current_chunk = np.empty((self._chunk_size, self._number_of_columns),
+                                       dtype='float64')
+        self._current_fill = 0
+        if self._flush_queue is not None:
+            self._flush_queue.put(chunk)
+        return
+
+    def _flush_loop(self):
+        """ Background thread writing full chunks to the spill file.
+        """
+        while True:
+            chunk = self._flush_queue.get()
+            try:
+                if chunk is None:
+                    return
+                with self._file_lock:
+                    with self._lock:
+                        # The chunk might have been discarded by clear() in the meantime
+                        if not self._memory_chunks or self._memory_chunks[0] is not chunk:
+                            continue
+                        offset = self._flushed_chunks * chunk.nbytes
+                    # Appending rows is not blocked while writing to disk
+                    self._spill_file.seek(offset)
+                    self._spill_file.write(chunk.tobytes())
+                    self._spill_file.flush()
+                    with self._lock:
+                        del self._memory_chunks[0]
+                        self._flushed_chunks += 1
+            except Exception:
+                logger.exception('Writing recorded data chunk to spill file failed. The chunk is '
+                                 'kept in memory.')
+            finally:
+                self._flush_queue.task_done()
+
+    def _get_chunk(self, chunk_index):
+        """ Returns the full chunk with the given index (memory-mapped if flushed to disk).
+        """
+        if chunk_index < self._flushed_chunks:
+            return np.memmap(self._spill_file_name,
+                             dtype='float64',
+                             mode='r',
+                             offset=chunk_index * self._chunk_size * self._number_of_columns * 8,
+                             shape=(self._chunk_size, self._number_of_columns))
+        return self._memory_chunks[chunk_index - self._flushed_chunks]
+
+    def _get_rows(self, start, stop):
+        """ Returns a copy of the rows [start, stop). Both indices must be within range.
+        """
+        result = np.empty((max(stop - start, 0), self._number_of_columns), dtype='float64')
+        full_rows = self._full_rows()
+        position = start
+        while position < stop:
+            if position >= full_rows:
+                offset = position - full_rows
+                result[position - start:] = self._current_chunk[offset:offset + stop - position]
+                break
+            chunk_index, offset = divmod(position, self._chunk_size)
+            to_copy = min(stop - position, self._chunk_size - offset)
+            chunk = self._get_chunk(chunk_index)
+            result[position - start:position - start + to_copy] = chunk[offset:offset + to_copy]
+            position += to_copy
+        return result
+
+    def _search_time(self, timestamp):
+        """ Returns the first row index with a timestamp >= the given timestamp.
+        """
+        chunk_start_times = self._chunk_start_times
+        if self._current_fill > 0:
+            chunk_start_times = chunk_start_times + [self._current_chunk[0, 0]]
+        # The row is either in the last chunk starting before the timestamp or the first row of
+        # the chunk following it
+        chunk_index = int(np.searchsorted(chunk_start_times, timestamp, side='left')) - 1
+        if chunk_index < 0:
+            return 0
+        if chunk_index < len(self._chunk_start_times):
+            timestamps = self._get_chunk(chunk_index)[:, 0]
+        else:
+            timestamps = self._current_chunk[:self._current_fill, 0]
+        offset = np.searchsorted(timestamps, timestamp, side='left')
+        return chunk_index * self._chunk_size + int(offset)
@@ -20,7 +20,8 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 """
 
 import numpy as np
-from scipy.ndimage import minimum_filter1d, maximum_filter1d
+from scipy.ndimage import minimum_filter1d, maximum_filter1d, maximum_filter, uniform_filter
+from scipy.ndimage import grey_dilation, label, center_of_mass, sum as ndi_sum
 
 import logging
 logger = logging.getLogger(__name__)
@@ -62,3 +63,63 @@ def scan_blink_correction(image, axis=1):
         np.flip(filt_img, axis), size=2, axis=axis, mode='constant', cval=median)
     # Flip back the image to obtain original orientation and return result.
     return np.flip(filt_img, axis)
+
+
+def find_spots(image, spot_size, threshold, min_roundness=0.6):
+    """
+    Find bright and round spots (e.g. single emitters) in a 2D array.
+
+    A pixel is a spot candidate if it is the maximum within a window of spot_size pixels around
+    it, its value exceeds threshold and the mean of the window exceeds half the threshold.
+    Windows reaching over the image boundaries are ignored. Adjacent candidates (e.g. plateaus)
+    are merged into one spot. The sub-pixel position of each spot is the center of mass of the
+    image (minus its median) within the window. Spots whose second moments are elongated, i.e.
+    whose ratio of minor to major axis is smaller than min_roundness, are rejected.
+
+    @param numpy.ndarray image: A 2D numpy array to search for spots (e.g. image data)
+    @param int spot_size: The expected spot diameter in pixels
+    @param float threshold: The minimum value of the spot maximum
+    @param float min_roundness: The minimum ratio of minor to major axis of a spot (0..1)
+    @return numpy.ndarray: float[n][2] array containing the sub-pixel indices of the n spots found
+    """
+    image = np.asarray(image, dtype=float)
+    if image.ndim != 2:
+        logger.error('Image must be 2D numpy array.')
+        return np.empty((0, 2))
+
+    spot_size = max(int(spot_size), 3)
+    if min(image.shape) <= spot_size:
+        return np.empty((0, 2))
+
+    # Spot candidates are local maxima above threshold with a bright surrounding
+    candidates = maximum_filter(image, size=spot_size, mode='nearest') == image
+    candidates &= image > threshold
+    candidates &= uniform_filter(image, size=spot_size, mode='nearest') > threshold / 2
+    border = spot_size // 2
+    candidates[:border] = False
+    candidates[-border:] = False
+    candidates[:, :border] = False
+    candidates[:, -border:] = False
+
+    labels, spot_count = label(candidates)
+    if spot_count == 0:
+        return np.empty((0, 2))
+    # Extend each spot to the window around it
+    labels = grey_dilation(labels, size=spot_size)
+    index = np.arange(1, spot_count + 1)
+
+    weights = np.clip(image - np.median(image), 0, None)
+    rows, columns = np.indices(image.shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight_sum = ndi_sum(weights, labels, index)
+        positions = np.array(center_of_mass(weights, labels, index), dtype=float).reshape(-1, 2)
+        row_mean, column_mean = positions[:, 0], positions[:, 1]
+        var_row = ndi_sum(weights * rows**2, labels, index) / weight_sum - row_mean**2
+        var_column = ndi_sum(weights * columns**2, labels, index) / weight_sum - column_mean**2
+        covariance = ndi_sum(weights * rows * columns, labels, index) / weight_sum - \
+            row_mean * column_mean
+        # Eigenvalues of the covariance matrix give the squared major and minor axis
+        half_trace = (var_row + var_column) / 2
+        deviation = np.sqrt(((var_row - var_column) / 2)**2 + covariance**2)
+        roundness = np.sqrt(np.clip(half_trace - deviation, 0, None) / (half_trace + deviation))
+    return positions[(weight_sum > 0) & (roundness >= min_roundness)]
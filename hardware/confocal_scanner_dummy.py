@@ -22,6 +22,8 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 import numpy as np
 import time
 
+from scipy.spatial import cKDTree
+
 from core.module import Base
 from core.connector import Connector
 from core.configoption import ConfigOption
@@ -36,6 +38,8 @@ class ConfocalScannerDummy(Base, ConfocalScannerInterface):
     confocal_scanner_dummy:
         module.Class: 'confocal_scanner_dummy.ConfocalScannerDummy'
         clock_frequency: 100 # in Hz
+        num_points: 500 # optional, number of simulated emitters
+        benchmark_mode: False # optional, if True do not wait for the simulated scan time
         fitlogic: 'fitlogic' # name of the fitlogic module, see default config
 
     """
@@ -45,6 +49,11 @@ class ConfocalScannerDummy(Base, ConfocalScannerInterface):
 
     # config
     _clock_frequency = ConfigOption('clock_frequency', 100, missing='warn')
+    _num_points = ConfigOption('num_points', 500, missing='nothing')
+    _benchmark_mode = ConfigOption('benchmark_mode', False, missing='nothing')
+
+    # emitters further away from a pixel than this number of sigmas are not evaluated
+    _cutoff_sigmas = 6
 
     def __init__(self, config, **kwargs):
         super().__init__(config=config, **kwargs)
@@ -55,7 +64,6 @@ class ConfocalScannerDummy(Base, ConfocalScannerInterface):
 
         self._position_range = [[0, 100e-6], [0, 100e-6], [0, 100e-6], [0, 1e-6]]
         self._current_position = [0, 0, 0, 0][0:len(self.get_scanner_axes())]
-        self._num_points = 500
 
     def on_activate(self):
         """ Initialisation performed during activation of the module.
@@ -120,6 +128,8 @@ class ConfocalScannerDummy(Base, ConfocalScannerInterface):
         # offset
         self._points_z[:, 3] = 0
 
+        self._build_emitter_index()
+
     def on_deactivate(self):
         """ Deactivate properly the confocal scanner dummy.
         """
@@ -316,28 +326,134 @@ class ConfocalScannerDummy(Base, ConfocalScannerInterface):
         if np.shape(line_path)[1] != self._line_length:
             self._set_up_line(np.shape(line_path)[1])
 
-        count_data = np.random.uniform(0, 2e4, self._line_length)
-        z_data = line_path[2, :]
-
-        #TODO: Change the gaussian function here to the one from fitlogic and delete the local modules to calculate
-        #the gaussian functions
-        x_data = np.array(line_path[0, :])
-        y_data = np.array(line_path[1, :])
-        for i in range(self._num_points):
-            count_data += self.twoD_gaussian_function((x_data, y_data), *(self._points[i])
-                ) * self.gaussian_function(np.array(z_data), *(self._points_z[i]))
+        line_counts = self._simulate_lines([line_path])[0]
 
-        time.sleep(self._line_length * 1. / self._clock_frequency)
-        time.sleep(self._line_length * 1. / self._clock_frequency)
+        if not self._benchmark_mode:
+            time.sleep(self._line_length * 1. / self._clock_frequency)
+            time.sleep(self._line_length * 1. / self._clock_frequency)
 
         # update the scanner position instance variable
         self._current_position = list(line_path[:, -1])
 
-        return np.array([
+        return line_counts
+
+    def scanner_supports_multiple_lines(self):
+        """ The dummy simulates buffered scanning of several lines.
+
+        @return bool: True
+        """
+        return True
+
+    def scan_lines(self, line_paths, return_paths, pixel_clock=False, line_callback=None):
+        """ Scans several lines in a row and returns the counts on these lines.
+
+        @param float[l][4][k] line_paths: l lines, each an array of 4-part tuples defining the
+                                          positions of the k pixels
+        @param float[l][4][r] return_paths: path following each line, the counts on these paths
+                                            are thrown away
+        @param bool pixel_clock: whether we need to output a pixel clock for the lines
+        @param callable line_callback: optional, called after each line as
+                                       line_callback(line_index, line_counts). If it returns
+                                       False the remaining lines are not scanned.
+
+        @return float[i][k][m]: the photon counts per second of the i scanned lines
+        """
+        if not isinstance(line_paths, (frozenset, list, set, tuple, np.ndarray, )) or \
+                not isinstance(return_paths, (frozenset, list, set, tuple, np.ndarray, )):
+            self.log.error('Given line_paths or return_paths are no array type.')
+            return np.array([[[-1.]]])
+
+        line_paths = np.asarray(line_paths, dtype=np.float64)
+        return_paths = np.asarray(return_paths, dtype=np.float64)
+        self._set_up_line(line_paths.shape[2] + return_paths.shape[2])
+
+        all_counts = self._simulate_lines(line_paths)
+        for line_index, return_path in enumerate(return_paths):
+            # the line and its return path are output in one go with the pixel clock
+            if not self._benchmark_mode:
+                time.sleep(self._line_length * 1. / self._clock_frequency)
+            self._current_position = list(return_path[:, -1])
+            if line_callback is not None and \
+                    line_callback(line_index, all_counts[line_index]) is False:
+                return all_counts[:line_index + 1]
+        return all_counts
+
+    def _build_emitter_index(self):
+        """ Precalculates the emitter parameters needed for the simulation of the counts.
+
+        The coefficients of the elliptical gaussians are calculated once and the emitters are
+        sorted into a KD-tree, so only emitters close to a pixel need to be evaluated.
+        Without emitters (num_points: 0) no KD-tree is built and only the background is simulated.
+        """
+        if len(self._points) == 0:
+            self._emitter_coefficients = np.zeros((3, 0))
+            self._emitter_tree = None
+            self._emitter_cutoff = 0
+            return
+        sigma_x = self._points[:, 3]
+        sigma_y = self._points[:, 4]
+        theta = self._points[:, 5]
+        self._emitter_coefficients = np.array([
+            (np.cos(theta)**2) / (2 * sigma_x**2) + (np.sin(theta)**2) / (2 * sigma_y**2),
+            -(np.sin(2 * theta)) / (4 * sigma_x**2) + (np.sin(2 * theta)) / (4 * sigma_y**2),
+            (np.sin(theta)**2) / (2 * sigma_x**2) + (np.cos(theta)**2) / (2 * sigma_y**2)])
+        self._emitter_tree = cKDTree(self._points[:, 1:3])
+        self._emitter_cutoff = self._cutoff_sigmas * np.max(np.abs(self._points[:, 3:5]))
+
+    def _simulate_fluorescence(self, x_data, y_data, z_data):
+        """ Calculates the fluorescence of all emitters at the given pixel positions.
+
+        @param numpy.ndarray x_data: x positions of the pixels
+        @param numpy.ndarray y_data: y positions of the pixels
+        @param numpy.ndarray z_data: z positions of the pixels
+
+        @return numpy.ndarray: the fluorescence for each pixel in counts/s
+
+        Same result as summing up twoD_gaussian_function * gaussian_function over all emitters
+        (the offsets of the emitters are 0), but only the pairs of pixels and emitters closer than
+        the cutoff distance are evaluated.
+        """
+        if self._emitter_tree is None:
+            return np.zeros(len(x_data))
+        neighbours = self._emitter_tree.query_ball_point(
+            np.column_stack((x_data, y_data)), self._emitter_cutoff)
+        neighbour_count = np.array([len(emitters) for emitters in neighbours], dtype=int)
+        if neighbour_count.sum() == 0:
+            return np.zeros(len(x_data))
+        pixel_index = np.repeat(np.arange(len(neighbours)), neighbour_count)
+        emitter_index = np.concatenate(
+            [emitters for emitters in neighbours if emitters]).astype(int)
+
+        points = self._points[emitter_index]
+        points_z = self._points_z[emitter_index]
+        a, b, c = self._emitter_coefficients[:, emitter_index]
+        dx = x_data[pixel_index] - points[:, 1]
+        dy = y_data[pixel_index] - points[:, 2]
+        dz = z_data[pixel_index] - points_z[:, 1]
+        fluorescence = points[:, 0] * np.exp(-(a * dx**2 + 2 * b * dx * dy + c * dy**2))
+        fluorescence *= points_z[:, 0] * np.exp(-dz**2 / (2 * points_z[:, 2]**2))
+        return np.bincount(pixel_index, weights=fluorescence, minlength=len(x_data))
+
+    def _simulate_lines(self, line_paths):
+        """ Simulates the counts on several lines of the dummy sample at once.
+
+        @param float[l][4][k] line_paths: l lines of positions of the k pixels
+
+        @return float[l][k][3]: the photon counts per second of the pixels for all 3 channels
+        """
+        line_paths = np.asarray(line_paths, dtype=np.float64)
+        number_of_lines, _, line_length = line_paths.shape
+        count_data = np.random.uniform(0, 2e4, (number_of_lines, line_length))
+        count_data += self._simulate_fluorescence(
+            line_paths[:, 0].ravel(),
+            line_paths[:, 1].ravel(),
+            line_paths[:, 2].ravel()).reshape((number_of_lines, line_length))
+
+        return np.stack([
                 count_data,
                 5e5 - count_data,
-                np.ones(count_data.shape) * line_path[1, 0] * 100
-            ]).transpose()
+                np.ones(count_data.shape) * line_paths[:, 1, :1] * 100
+            ], axis=-1)
 
     def close_scanner(self):
         """ Closes the scanner and cleans up afterwards.
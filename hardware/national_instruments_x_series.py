@@ -1405,6 +1405,174 @@ class NationalInstrumentsXSeries(Base, SlowCounterInterface, ConfocalScannerInte
         # return values is a rate of counts/s
         return all_data.transpose()
 
+    def scanner_supports_multiple_lines(self):
+        """ Several lines including the return paths can be output as one buffered waveform.
+
+        @return bool: True
+        """
+        return True
+
+    def scan_lines(self, line_paths, return_paths, pixel_clock=False, line_callback=None):
+        """ Scans several lines in a row and returns the counts on these lines.
+
+        @param float[l][c][m] line_paths: l lines, each an array of c-tuples defining the voltage
+                                          points (m = samples per line)
+        @param float[l][c][r] return_paths: path following each line, the counts on these paths
+                                            are thrown away (r = samples per return path)
+        @param bool pixel_clock: whether we need to output a pixel clock for the lines
+        @param callable line_callback: optional, called after each line as
+                                       line_callback(line_index, line_counts) with
+                                       float[m][n] line_counts. If it returns False the
+                                       remaining lines are not scanned.
+
+        @return float[i][m][n]: i (scanned lines) times m (samples per line) n-channel photon
+                                counts per second
+
+        All lines and return paths are concatenated to a single trajectory which is written to
+        the analog output buffer at once and output with the scanner clock without any software
+        interaction in between. The counts are read line by line while the scan is running.
+        If pixel_clock is True, the pixel clock is also output during the return paths.
+        """
+        if self._scanner_counter_channels and len(self._scanner_counter_daq_tasks) < 1:
+            self.log.error('Configured counter is not running, cannot scan lines.')
+            return np.array([[[-1.]]])
+
+        if self._scanner_ai_channels and self._scanner_analog_daq_task is None:
+            self.log.error('Configured analog input is not running, cannot scan lines.')
+            return np.array([[[-1.]]])
+
+        if not isinstance(line_paths, (frozenset, list, set, tuple, np.ndarray, )) or \
+                not isinstance(return_paths, (frozenset, list, set, tuple, np.ndarray, )):
+            self.log.error('Given line_paths or return_paths are not array type.')
+            return np.array([[[-1.]]])
+
+        line_paths = np.asarray(line_paths, dtype=np.float64)
+        return_paths = np.asarray(return_paths, dtype=np.float64)
+        number_of_lines, number_of_axes, line_length = line_paths.shape
+        # number of samples per line including the return path
+        period = line_length + return_paths.shape[2]
+        # each line is followed by its return path
+        trajectory = np.concatenate((line_paths, return_paths), axis=2)
+        trajectory = trajectory.transpose((1, 0, 2)).reshape((number_of_axes, -1))
+
+        number_of_counters = len(self._scanner_counter_daq_tasks)
+        line_counts = np.full(
+            (number_of_lines, line_length, len(self.get_scanner_count_channels())),
+            2,
+            dtype=np.float64)
+        scanned_lines = 0
+        try:
+            daq.DAQmxSetSampTimingType(self._scanner_ao_task, daq.DAQmx_Val_SampClk)
+            if self._set_up_line(trajectory.shape[1]) < 0:
+                return np.array([[[-1.]]])
+            trajectory_volts = self._scanner_position_to_volt(trajectory)
+            if np.any(np.isnan(trajectory_volts)):
+                return np.array([[[-1.]]])
+            # write the whole trajectory to the analog output buffer
+            self._write_scanner_ao(
+                voltages=trajectory_volts,
+                length=self._line_length,
+                start=False)
+
+            # start the timed analog output task
+            daq.DAQmxStartTask(self._scanner_ao_task)
+
+            for i, task in enumerate(self._scanner_counter_daq_tasks):
+                daq.DAQmxStopTask(task)
+
+            daq.DAQmxStopTask(self._scanner_clock_daq_task)
+
+            if pixel_clock and self._pixel_clock_channel is not None:
+                daq.DAQmxConnectTerms(
+                    self._scanner_clock_channel + 'InternalOutput',
+                    self._pixel_clock_channel,
+                    daq.DAQmx_Val_DoNotInvertPolarity)
+
+            # start the scanner counting task that acquires counts synchroneously
+            for i, task in enumerate(self._scanner_counter_daq_tasks):
+                daq.DAQmxStartTask(task)
+
+            if self._scanner_ai_channels:
+                daq.DAQmxStartTask(self._scanner_analog_daq_task)
+
+            daq.DAQmxStartTask(self._scanner_clock_daq_task)
+
+            # count data of one line (including the return path) will be written here
+            scan_data = np.empty((number_of_counters, 2 * period), dtype=np.uint32)
+            analog_data = np.empty((len(self._scanner_ai_channels), period), dtype=np.float64)
+            n_read_samples = daq.int32()
+            analog_read_samples = daq.int32()
+
+            for line_index in range(number_of_lines):
+                for i, task in enumerate(self._scanner_counter_daq_tasks):
+                    # read the semi periods of this line, waits until they are available
+                    daq.DAQmxReadCounterU32(
+                        task,
+                        2 * period,
+                        self._RWTimeout * 2 * period,
+                        scan_data[i],
+                        2 * period,
+                        daq.byref(n_read_samples),
+                        None)
+                    if line_index == 0:
+                        # The first sample was skipped by the read offset. From now on read
+                        # continuously from the current read position.
+                        daq.DAQmxSetReadOffset(task, 0)
+
+                if self._scanner_ai_channels:
+                    daq.DAQmxReadAnalogF64(
+                        self._scanner_analog_daq_task,
+                        period,
+                        self._RWTimeout * 2 * period,
+                        daq.DAQmx_Val_GroupByChannel,
+                        analog_data,
+                        len(self._scanner_ai_channels) * period,
+                        daq.byref(analog_read_samples),
+                        None)
+
+                # add up adjoint pixels to also get the counts from the low time of the clock
+                # and skip the return path:
+                real_data = scan_data[:, 0:2 * line_length:2] + scan_data[:, 1:2 * line_length:2]
+                line_counts[line_index, :, :number_of_counters] = np.transpose(
+                    real_data * self._scanner_clock_frequency)
+                if self._scanner_ai_channels:
+                    line_counts[line_index, :, number_of_counters:] = np.transpose(
+                        analog_data[:, :line_length])
+
+                scanned_lines += 1
+                if line_callback is not None and \
+                        line_callback(line_index, line_counts[line_index]) is False:
+                    break
+
+            # stop all tasks
+            for i, task in enumerate(self._scanner_counter_daq_tasks):
+                daq.DAQmxStopTask(task)
+            if self._scanner_ai_channels:
+                daq.DAQmxStopTask(self._scanner_analog_daq_task)
+            daq.DAQmxStopTask(self._scanner_clock_daq_task)
+            self._stop_analog_output()
+
+            if pixel_clock and self._pixel_clock_channel is not None:
+                daq.DAQmxDisconnectTerms(
+                    self._scanner_clock_channel + 'InternalOutput',
+                    self._pixel_clock_channel)
+
+            # update the scanner position instance variable
+            end_index = max(scanned_lines * period - 1, 0)
+            self._current_position = np.array(trajectory[:, end_index])
+            if scanned_lines < number_of_lines:
+                # The analog output was already running ahead on the remaining lines when the
+                # scan was aborted. Move back to the end of the last scanned line so the position
+                # matches the hardware.
+                self._write_scanner_ao(
+                    voltages=np.ascontiguousarray(trajectory_volts[:, end_index:end_index + 1]),
+                    start=True)
+        except:
+            self.log.exception('Error while scanning lines.')
+            return np.array([[[-1.]]])
+        # return values is a rate of counts/s
+        return line_counts[:scanned_lines]
+
     def close_scanner(self):
         """ Closes the scanner and cleans up afterwards.
 
@@ -1684,6 +1852,13 @@ class NationalInstrumentsXSeries(Base, SlowCounterInterface, ConfocalScannerInte
                               '  {1:s} is the switching channel for the lock in\n'
                               ''.format(self._odmr_trigger_line, self._odmr_switch_line))
 
+    def odmr_supports_multiple_lines(self):
+        """ The clock, counter and analog tasks can simply run for several sweeps in a row.
+
+        @return bool: True
+        """
+        return True
+
     def count_odmr(self, length=100):
         """ Sweeps the microwave and returns the counts on that sweep.
 
@@ -1691,24 +1866,42 @@ class NationalInstrumentsXSeries(Base, SlowCounterInterface, ConfocalScannerInte
 
         @return float[]: the photon counts per second
         """
+        error, all_data = self.count_odmr_lines(length=length, lines=1)
+        return error, all_data[0]
+
+    def count_odmr_lines(self, length=100, lines=1):
+        """ Sweeps the microwave several times in a row and returns the counts of all sweeps.
+
+        @param int length: length of microwave sweep in pixel
+        @param int lines: number of consecutive sweeps to acquire
+
+        @return (bool, float[][][]): tuple: was there an error, the photon counts per second with
+                                     shape (lines, channels, length)
+
+        The ODMR clock runs continuously over all sweeps (i.e. lines * length pixels plus the start
+        pulse), so the microwave source has to start over at the beginning of the list/sweep after
+        the last pixel of each sweep.
+        """
+        error_data = np.full((lines, len(self.get_odmr_channels()), 1), -1.)
+
         if len(self._scanner_counter_daq_tasks) < 1 and self._scanner_counter_channels:
             self.log.error(
                 'No counter is running, cannot scan an ODMR line without one.')
-            return True, np.array([-1.])
+            return True, error_data
 
         if self._scanner_ai_channels and self._scanner_analog_daq_task is None:
             self.log.error('No analog task is running, cannot do ODMR without one.')
-            return True, np.array([-1.])
+            return True, error_data
 
         # check if length setup is correct, if not, adjust.
         if self._odmr_pulser_daq_task:
-            odmr_length_to_set = length * self.oversampling * 2
+            odmr_length_to_set = length * self.oversampling * 2 * lines
         else:
-            odmr_length_to_set = length
+            odmr_length_to_set = length * lines
 
         if self.set_odmr_length(odmr_length_to_set) < 0:
             self.log.error('An error arose while setting the odmr lenth to {}.'.format(odmr_length_to_set))
-            return True, np.array([-1.])
+            return True, error_data
 
         try:
             # start the scanner counting task that acquires counts synchronously
@@ -1718,7 +1911,7 @@ class NationalInstrumentsXSeries(Base, SlowCounterInterface, ConfocalScannerInte
                 daq.DAQmxStartTask(self._scanner_analog_daq_task)
         except:
             self.log.exception('Cannot start ODMR counter.')
-            return True, np.array([-1.])
+            return True, error_data
 
         if self._odmr_pulser_daq_task:
             try:
@@ -1742,7 +1935,7 @@ class NationalInstrumentsXSeries(Base, SlowCounterInterface, ConfocalScannerInte
                 daq.DAQmxStartTask(self._odmr_pulser_daq_task)
             except:
                 self.log.exception('Cannot start ODMR pulser.')
-                return True, np.array([-1.])
+                return True, error_data
 
         try:
             daq.DAQmxStartTask(self._scanner_clock_daq_task)
@@ -1812,7 +2005,7 @@ class NationalInstrumentsXSeries(Base, SlowCounterInterface, ConfocalScannerInte
                 daq.DAQmxStopTask(self._odmr_pulser_daq_task)
 
             # prepare array to return data
-            all_data = np.full((len(self.get_odmr_channels()), length),
+            all_data = np.full((len(self.get_odmr_channels()), lines * length),
                                222,
                                dtype=np.float64)
             start_index = 0
@@ -1828,7 +2021,8 @@ class NationalInstrumentsXSeries(Base, SlowCounterInterface, ConfocalScannerInte
                 real_data += odmr_data[:-1:2]
 
                 if self._odmr_pulser_daq_task:
-                    differential_data = np.zeros((self.oversampling * length, ), dtype=np.float64)
+                    differential_data = np.zeros((self.oversampling * length * lines, ),
+                                                 dtype=np.float64)
 
                     differential_data += real_data[1::2]
                     differential_data -= real_data[::2]
@@ -1847,7 +2041,8 @@ class NationalInstrumentsXSeries(Base, SlowCounterInterface, ConfocalScannerInte
             if self._scanner_ai_channels:
                 if self._odmr_pulser_daq_task:
                     for i, analog_data in enumerate(odmr_analog_data):
-                        differential_data = np.zeros((self.oversampling * length, ), dtype=np.float64)
+                        differential_data = np.zeros((self.oversampling * length * lines, ),
+                                                     dtype=np.float64)
 
                         differential_data += analog_data[1:-1:2]
                         differential_data -= analog_data[:-1:2]
@@ -1863,10 +2058,12 @@ class NationalInstrumentsXSeries(Base, SlowCounterInterface, ConfocalScannerInte
                 else:
                     all_data[start_index:] = odmr_analog_data[:, :-1]
 
+            # split the continuous data into the single sweeps
+            all_data = all_data.reshape((-1, lines, length)).transpose((1, 0, 2))
             return False, all_data
         except:
             self.log.exception('Error while counting for ODMR.')
-            return True, np.full((len(self.get_odmr_channels()), 1), [-1.])
+            return True, error_data
 
     def close_odmr(self):
         """ Closes the odmr and cleans up afterwards.
@@ -120,6 +120,13 @@ class ODMRCounterDummy(Base, ODMRCounterInterface):
         self._odmr_length = length
         return 0
 
+    def odmr_supports_multiple_lines(self):
+        """ The dummy can simulate several sweeps at once.
+
+        @return bool: True
+        """
+        return True
+
     def count_odmr(self, length=100):
         """ Sweeps the microwave and returns the counts on that sweep.
 
@@ -127,11 +134,23 @@ class ODMRCounterDummy(Base, ODMRCounterInterface):
 
         @return float[]: the photon counts per second
         """
+        error, ret = self.count_odmr_lines(length=length, lines=1)
+        return error, ret[0]
+
+    def count_odmr_lines(self, length=100, lines=1):
+        """ Sweeps the microwave several times in a row and returns the counts of all sweeps.
+
+        @param int length: length of microwave sweep in pixel
+        @param int lines: number of consecutive sweeps to acquire
+
+        @return (bool, float[][][]): tuple: was there an error, the photon counts per second with
+                                     shape (lines, channels, length)
+        """
 
         if self.module_state() == 'locked':
             self.log.error('A scan_line is already running, close this one '
                            'first.')
-            return -1
+            return True, np.full((lines, self._number_of_channels, 1), -1.)
 
         self.module_state.lock()
 
@@ -149,15 +168,12 @@ class ODMRCounterDummy(Base, ODMRCounterInterface):
         params.add('l1_sigma', value=sigma)
         params.add('offset', value=50000.)
 
-        ret = np.empty((self._number_of_channels, length))
-
-        for chnl_index in range(self._number_of_channels):
-            count_data = np.random.uniform(0, 5e4, length)
-            count_data += (chnl_index + 1) * lorentians.eval(x=np.arange(1, length + 1, 1),
-                                                             params=params)
-            ret[chnl_index] = count_data
+        lorentian_data = lorentians.eval(x=np.arange(1, length + 1, 1), params=params)
+        channel_factors = np.arange(1, self._number_of_channels + 1)
+        ret = np.random.uniform(0, 5e4, (lines, self._number_of_channels, length))
+        ret += channel_factors[:, np.newaxis] * lorentian_data
 
-        time.sleep(self._odmr_length*1./self._clock_frequency)
+        time.sleep(self._odmr_length * lines / self._clock_frequency)
 
         self.module_state.unlock()
         return False, ret
@@ -1850,64 +1850,104 @@ class PulseBlasterESRPRO(Base, SwitchInterface, PulserInterface):
 
         ch_list = list(digital_samples)
         ch_list.sort()
-        num_ch = len(ch_list)
 
         # take on of the channel and obtain the channel length
         num_entries = len(digital_samples[ch_list[0]])
 
-        last_sequence_dict = None
-        pb_sequence_list = list()
-
-        for index in range(num_entries):
+        # combine the channel states of each sample into a bitmask
+        states = np.zeros(num_entries, dtype='uint64')
+        for ch_name in ch_list:
+            bit = np.uint64(int(ch_name.replace('d_ch', '')) - 1)
+            states |= np.asarray(digital_samples[ch_name]).astype('uint64') << bit
 
-            # create at first a temporary array, with the minimal granularity
-            # length. The sampling freq is fixed anyway and cannot be changed.
-            temp_sequence_dict = {'active_channels': [],
-                                  'length': self.GRAN_MIN}
+        # the samples where the state changes are the starts of the pulses
+        pulse_starts = np.flatnonzero(np.concatenate(([True], states[1:] != states[:-1])))
+        durations = np.diff(np.append(pulse_starts, num_entries))
 
-            for ch_name in ch_list:
+        return self._convert_run_lengths_to_pb_sequence(durations, states[pulse_starts], ch_list)
 
-                if digital_samples[ch_name][index]:
-                    temp_sequence_dict['active_channels'].append(int(ch_name.replace('d_ch', ''))-1)
+    def _convert_run_lengths_to_pb_sequence(self, durations, states, ch_list):
+        """ Helper method to create a pulse blaster sequence from runs of constant channel states.
 
-            # compare it with the last array if present
+        @param numpy.ndarray durations: length of each run in samples
+        @param numpy.ndarray states: bitmask of the channel states of each run. Bit n-1 is set if
+                                     channel 'd_chn' is high.
+        @param list ch_list: sorted list of the used channel names (i.e. 'd_ch1')
 
-            # if not present start to count
-            if last_sequence_dict is None:
-                last_sequence_dict = temp_sequence_dict
+        @return list: a sequence list with dictionaries formated for the generic
+                      method 'write_pulse_form', see _convert_sample_to_pb_sequence.
+        """
+        durations = np.asarray(durations, dtype='int64')
+        states = np.asarray(states, dtype='uint64')
 
-            else:
+        # merge consecutive runs with the same state
+        run_starts = np.flatnonzero(np.concatenate(([True], states[1:] != states[:-1])))
+        durations = np.add.reduceat(durations, run_starts)
+        states = states[run_starts]
 
-                 # if present and the same channels, accumulate length
-                if temp_sequence_dict['active_channels'] == last_sequence_dict['active_channels']:
-                    last_sequence_dict['length'] += temp_sequence_dict['length']
-
-                # if present and not the same channels, append last array to
-                # sequence array
-                else:
-                    # increase length by 1%, to remove the ambiguity for the
-                    # comparison
-                    if last_sequence_dict['length']*1.01 < self.LEN_MIN:
-                        self.log.warning('Current waveform contains a pulse of '
-                                         'length {0:.2f}ns, which is smaller '
-                                         'than the minimal allowed length of '
-                                         '{1:.2f}ns! Pulse sequence might '
-                                         'most probably look unexpected. '
-                                         'Increase the length of the smallest '
-                                         'pulse!'
-                                         ''.format(last_sequence_dict['length']*1e9,
-                                                   self.LEN_MIN*1e9))
-
-                    pb_sequence_list.append(last_sequence_dict)
-
-                    # and temporary array becomes last array for the next round
-                    last_sequence_dict = temp_sequence_dict
-
-        # do not forget to add the last sequence
-        pb_sequence_list.append(last_sequence_dict)
+        channel_bits = [int(ch_name.replace('d_ch', '')) - 1 for ch_name in ch_list]
+        pb_sequence_list = list()
+        for index, (duration, state) in enumerate(zip(durations, states)):
+            length = duration * self.GRAN_MIN
+            # increase length by 1%, to remove the ambiguity for the comparison
+            if index < len(durations) - 1 and length * 1.01 < self.LEN_MIN:
+                self.log.warning('Current waveform contains a pulse of '
+                                 'length {0:.2f}ns, which is smaller '
+                                 'than the minimal allowed length of '
+                                 '{1:.2f}ns! Pulse sequence might '
+                                 'most probably look unexpected. '
+                                 'Increase the length of the smallest '
+                                 'pulse!'
+                                 ''.format(length*1e9, self.LEN_MIN*1e9))
+            active_channels = [bit for bit in channel_bits if (int(state) >> bit) & 1]
+            pb_sequence_list.append({'active_channels': active_channels, 'length': length})
 
         return pb_sequence_list
 
+    def supports_run_length_waveforms(self):
+        """ The PulseBlaster is programmed with pulses of constant channel states, so it accepts
+        run-length encoded waveforms.
+
+        @return bool: True
+        """
+        return True
+
+    def write_run_length_waveform(self, name, durations, states, digital_channels):
+        """ Write a new purely digital waveform given as a list of runs of constant
+            channel states. See PulserInterface.write_run_length_waveform for the
+            parameters.
+
+        @return (int, list): number of samples written (-1 indicates failed
+                             process) and list of created waveform names.
+        """
+        durations = np.asarray(netobtain(durations), dtype='int64')
+        states = np.asarray(netobtain(states), dtype='uint64')
+        digital_channels = netobtain(digital_channels)
+
+        if len(durations) == 0 or not digital_channels:
+            # same behaviour as writing an empty waveform
+            return self.write_waveform(name=name,
+                                       analog_samples=dict(),
+                                       digital_samples=dict(),
+                                       is_first_chunk=True,
+                                       is_last_chunk=True,
+                                       total_number_of_samples=int(durations.sum()))
+
+        chan = sorted(digital_channels)
+        self._current_activation_config = chan
+        self._current_pb_waveform_theoretical = self._convert_run_lengths_to_pb_sequence(
+            durations, states, chan)
+        self._current_pb_waveform_name = name
+
+        self._current_pb_waveform = self._correct_sequence_for_delays(self._current_pb_waveform_theoretical)
+        self.write_pulse_form(self._current_pb_waveform)
+        self.log.debug('Waveform written in PulseBlaster with name "{0}" '
+                       'and a total length of {1} sequence '
+                       'entries.'.format(self._current_pb_waveform_name,
+                                          len(self._current_pb_waveform)))
+
+        return int(durations.sum()), [self._current_pb_waveform_name]
+
     def write_sequence(self, name, sequence_parameters):
         """
         Write a new sequence on the device memory.
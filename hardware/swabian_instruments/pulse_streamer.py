@@ -24,6 +24,7 @@ from core.module import Base
 from core.configoption import ConfigOption
 from core.statusvariable import  StatusVar
 from core.util.modules import get_home_dir
+from core.util.network import netobtain
 from interface.pulser_interface import PulserInterface, PulserConstraints
 from collections import OrderedDict
 import numpy as np
@@ -653,25 +654,60 @@ class PulseStreamer(Base, PulserInterface):
             self.__current_waveform = {key:[] for key in digital_samples.keys()}
 
         for channel_number, samples in digital_samples.items():
-            new_channel_indices = np.where(samples[:-1] != samples[1:])[0]
-            new_channel_indices = np.unique(new_channel_indices)
-
-            # add in indices for the start and end of the sequence to simplify iteration
-            new_channel_indices = np.insert(new_channel_indices, 0, [-1])
-            new_channel_indices = np.insert(new_channel_indices, new_channel_indices.size, [samples.shape[0] - 1])
-            pulses = []
-            for new_channel_index in range(1, new_channel_indices.size):
-                pulse = [new_channel_indices[new_channel_index] - new_channel_indices[new_channel_index - 1],
-                         samples[new_channel_indices[new_channel_index - 1] + 1].astype(np.byte)]
-                pulses.append(pulse)
-
+            if samples.size == 0:
+                continue
+            # indices of the last sample of each pulse
+            pulse_ends = np.append(np.flatnonzero(samples[:-1] != samples[1:]), samples.size - 1)
+            pulses = self._get_pulse_pattern(np.diff(pulse_ends, prepend=-1),
+                                             samples[pulse_ends].astype(np.byte))
             # extend (as opposed to rewrite) for chunky business
-            #print(pulses)
             self.__current_waveform[channel_number].extend(pulses)
 
         return len(samples), [self.__current_waveform_name]
 
 
+    def supports_run_length_waveforms(self):
+        """ The pulse streamer is programmed with pulse patterns, so it accepts run-length encoded
+        waveforms.
+
+        @return bool: True
+        """
+        return True
+
+    def write_run_length_waveform(self, name, durations, states, digital_channels):
+        """
+        Write a new purely digital waveform given as a list of runs of constant channel states.
+        See PulserInterface.write_run_length_waveform for the parameters.
+
+        @return (int, list): Number of samples written (-1 indicates failed process) and list of
+                             created waveform names
+        """
+        durations = np.asarray(netobtain(durations), dtype='int64')
+        states = np.asarray(netobtain(states), dtype='uint64')
+
+        self.__current_waveform_name = name
+        self.__current_waveform = dict()
+        for channel_number in digital_channels:
+            bit = np.uint64(int(channel_number[-1]) - 1)
+            levels = ((states >> bit) & np.uint64(1)).astype(np.byte)
+            # merge consecutive runs with the same level of this channel
+            pulse_starts = np.flatnonzero(np.concatenate(([True], levels[1:] != levels[:-1])))
+            self.__current_waveform[channel_number] = self._get_pulse_pattern(
+                np.add.reduceat(durations, pulse_starts), levels[pulse_starts])
+        self.__samples_written = int(durations.sum())
+        return self.__samples_written, [self.__current_waveform_name]
+
+    @staticmethod
+    def _get_pulse_pattern(durations, levels):
+        """ Pulse pattern of one channel in the format of pulsestreamer.Sequence.setDigital.
+
+        @param numpy.ndarray durations: duration of each pulse in samples
+        @param numpy.ndarray levels: level (0 or 1) of each pulse
+
+        @return list: list of [duration, level] pulses
+        """
+        return [[int(duration), level] for duration, level in zip(durations, levels)]
+
     
     def write_sequence(self, name, sequence_parameters):
         """
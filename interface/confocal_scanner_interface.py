@@ -20,6 +20,8 @@ Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
 top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
 """
 
+import numpy as np
+
 from core.interface import abstract_interface_method
 from core.meta import InterfaceMetaclass
 
@@ -180,6 +182,51 @@ class ConfocalScannerInterface(metaclass=InterfaceMetaclass):
         """
         pass
 
+    def scanner_supports_multiple_lines(self):
+        """ Function to test if the hardware can scan several lines (including the return paths) as
+        one continuous, buffered trajectory (see scan_lines).
+
+        @return bool: Whether the hardware supports buffered scanning of multiple lines
+
+        This function is not abstract - Thus it is optional and if a hardware do not implement it,
+        the answer is False.
+        """
+        return False
+
+    def scan_lines(self, line_paths, return_paths, pixel_clock=False, line_callback=None):
+        """ Scans several lines in a row and returns the counts on these lines.
+
+        @param float[l][n][k] line_paths: l lines, each an array of n-part tuples defining the k
+                                          pixel positions (same format as for scan_line)
+        @param float[l][n][r] return_paths: path following each line (e.g. back to the start of
+                                            the next line), the counts on these paths are
+                                            thrown away
+        @param bool pixel_clock: whether we need to output a pixel clock for the lines
+        @param callable line_callback: optional, called after each line as
+                                       line_callback(line_index, line_counts) with
+                                       float[k][m] line_counts. If it returns False the
+                                       remaining lines are not scanned.
+
+        @return float[i][k][m]: the photon counts per second for the i scanned lines (i < l if
+                                aborted by line_callback) with k pixels and m channels.
+                                In case of an error an array containing -1 is returned.
+
+        This function is not abstract - Thus it is optional and if a hardware do not implement it,
+        the lines and return paths are scanned by consecutive calls to scan_line.
+        """
+        all_counts = list()
+        for line_index, (line_path, return_path) in enumerate(zip(line_paths, return_paths)):
+            line_counts = self.scan_line(line_path, pixel_clock=pixel_clock)
+            if np.any(line_counts == -1):
+                return np.array([[[-1.]]])
+            return_counts = self.scan_line(return_path)
+            if np.any(return_counts == -1):
+                return np.array([[[-1.]]])
+            all_counts.append(line_counts)
+            if line_callback is not None and line_callback(line_index, line_counts) is False:
+                break
+        return np.array(all_counts)
+
     @abstract_interface_method
     def close_scanner(self):
         """ Closes the scanner and cleans up afterwards.
@@ -19,6 +19,8 @@ Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
 top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
 """
 
+import numpy as np
+
 from core.interface import abstract_interface_method
 from core.meta import InterfaceMetaclass
 
@@ -77,6 +79,39 @@ class ODMRCounterInterface(metaclass=InterfaceMetaclass):
         """
         pass
 
+    def odmr_supports_multiple_lines(self):
+        """ Function to test if the hardware can acquire several consecutive sweeps in one call
+        (see count_odmr_lines).
+
+        @return bool: Whether the hardware supports acquiring multiple sweeps at once
+
+        This function is not abstract - Thus it is optional and if a hardware do not implement it,
+        the answer is False.
+        """
+        return False
+
+    def count_odmr_lines(self, length=100, lines=1):
+        """ Sweeps the microwave several times in a row and returns the counts of all sweeps.
+
+        @param int length: length of microwave sweep in pixel
+        @param int lines: number of consecutive sweeps to acquire
+
+        @return (bool, float[][][]): tuple: was there an error, the photon counts per second with
+                                     shape (lines, channels, length)
+
+        The microwave sweep is not reset in between the sweeps, i.e. the microwave source has to
+        start over at the beginning of the list/sweep after the last pixel of each sweep.
+        This function is not abstract - Thus it is optional and if a hardware do not implement it,
+        the sweeps are acquired by consecutive calls to count_odmr.
+        """
+        all_data = list()
+        for line in range(lines):
+            error, data = self.count_odmr(length=length)
+            if error:
+                return True, np.full((lines, len(self.get_odmr_channels()), 1), -1.)
+            all_data.append(data)
+        return False, np.array(all_data)
+
     @abstract_interface_method
     def close_odmr(self):
         """ Close the odmr and clean up afterwards.
@@ -20,6 +20,7 @@ Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
 top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
 """
 
+import numpy as np
 
 from core.interface import abstract_interface_method
 from core.meta import InterfaceMetaclass
@@ -458,6 +459,53 @@ class PulserInterface(metaclass=InterfaceMetaclass):
         """
         pass
 
+    def supports_run_length_waveforms(self):
+        """ Function to test if the hardware accepts purely digital waveforms in run-length encoded
+        form (see write_run_length_waveform).
+
+        @return bool: Whether write_run_length_waveform is implemented by the hardware
+
+        This function is not abstract - Thus it is optional and if a hardware do not implement it,
+        the answer is False.
+        """
+        return False
+
+    def write_run_length_waveform(self, name, durations, states, digital_channels):
+        """
+        Write a new purely digital waveform given as a list of runs of constant channel states
+        instead of samples. This is the natural form for edge based pulse generators and avoids
+        creating the sample arrays for long waveforms with few transitions.
+
+        @param str name: the name of the waveform to be created
+        @param numpy.ndarray durations: 1D array of type int64 with the length of each run in
+                                        samples (all larger than 0)
+        @param numpy.ndarray states: 1D array of type uint64 with the channel state bitmask of each
+                                     run. Bit n-1 is set if channel 'd_chn' is high.
+                                     Consecutive runs can have the same state.
+        @param list digital_channels: the generic digital channel names (i.e. 'd_ch1') used by the
+                                      waveform
+
+        @return (int, list): Number of samples written (-1 indicates failed process) and list of
+                             created waveform names
+
+        This function is not abstract - Thus it is optional and if a hardware do not implement it,
+        the samples are created from the runs and written with write_waveform.
+        """
+        durations = np.asarray(durations, dtype='int64')
+        states = np.asarray(states, dtype='uint64')
+        digital_samples = dict()
+        for chnl in digital_channels:
+            bit = np.uint64(int(chnl.replace('d_ch', '')) - 1)
+            digital_samples[chnl] = np.repeat(((states >> bit) & np.uint64(1)).astype(bool),
+                                              durations)
+        number_of_samples = int(durations.sum())
+        return self.write_waveform(name=name,
+                                   analog_samples=dict(),
+                                   digital_samples=digital_samples,
+                                   is_first_chunk=True,
+                                   is_last_chunk=True,
+                                   total_number_of_samples=number_of_samples)
+
     @abstract_interface_method
     def write_sequence(self, name, sequence_parameters):
         """
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the tools to fit a stack of data sets sharing the same x axis with the fit
+methods from logic/fitmethods, optionally in a pool of worker processes.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import importlib
+import inspect
+import logging
+import multiprocessing
+import os
+import sys
+import types
+import lmfit
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+
+class FitMethodCollection:
+    """
+    Provides the fit methods (make_*_fit, make_*_model, estimate_* and helpers) from the given
+    fit method directories without the FitLogic module, e.g. in a worker process.
+
+    The methods are bound to this object in the same way they are bound to FitLogic, so
+    fit_collection.make_lorentzian_fit(...) behaves like fit_logic.make_lorentzian_fit(...).
+    """
+
+    def __init__(self, path_list):
+        self.log = logging.getLogger(__name__)
+        for path in path_list:
+            if path not in sys.path:
+                sys.path.append(path)
+            for file in sorted(os.listdir(path)):
+                if not os.path.isfile(os.path.join(path, file)) or not file.endswith('.py'):
+                    continue
+                mod = importlib.import_module(file[:-3])
+                for method in dir(mod):
+                    ref = getattr(mod, method)
+                    if inspect.isfunction(ref):
+                        setattr(self, method, types.MethodType(ref, self))
+
+    def get_fit_methods(self, fit_name, estimator_name):
+        """ Get the fit and estimator method of a fit by name.
+
+        @param str fit_name: name of the fit, e.g. 'lorentzian'
+        @param str estimator_name: name of the estimator, e.g. 'dip' or 'generic'
+
+        @return tuple(method, method): make_*_fit and estimate_* method of the fit
+        """
+        if estimator_name == 'generic':
+            estimator = getattr(self, 'estimate_{0}'.format(fit_name))
+        else:
+            estimator = getattr(self, 'estimate_{0}_{1}'.format(fit_name, estimator_name))
+        return getattr(self, 'make_{0}_fit'.format(fit_name)), estimator
+
+
+def fit_stack(fit_method, estimator, x_data, y_stack, units=None, add_params=None,
+              warm_start=False):
+    """
+    Fit each row of y_stack with the same fit method.
+
+    @param method fit_method: make_*_fit method to use
+    @param method estimator: estimate_* method to use
+    @param numpy.ndarray x_data: 1D array of x values shared by all data sets
+    @param numpy.ndarray y_stack: 2D array with one data set per row
+    @param list units: optional, units passed to the fit method
+    @param lmfit.Parameters add_params: optional, parameters replacing the estimated ones
+    @param bool warm_start: If True, the estimated start values are replaced by the result of the
+                            previous data set (if that fit succeeded).
+
+    @return tuple: list of parameter names,
+                   float[n][p] array of the parameter values,
+                   float[n][p] array of the parameter errors (NaN if not available),
+                   bool[n] array indicating the success of each fit
+    """
+    previous_values = None
+
+    def warm_start_estimator(x_axis, data, params):
+        error, params = estimator(x_axis, data, params)
+        if previous_values is not None:
+            for name, value in previous_values.items():
+                if name in params and params[name].expr is None:
+                    params[name].value = value
+        return error, params
+
+    param_names = None
+    values = errors = None
+    success = np.zeros(len(y_stack), dtype=bool)
+    for index, y_data in enumerate(y_stack):
+        try:
+            result = fit_method(x_axis=x_data,
+                                data=y_data,
+                                estimator=warm_start_estimator if warm_start else estimator,
+                                units=units,
+                                add_params=add_params)
+        except Exception:
+            previous_values = None
+            continue
+        if param_names is None:
+            param_names = list(result.params)
+            values = np.full((len(y_stack), len(param_names)), np.nan)
+            errors = np.full((len(y_stack), len(param_names)), np.nan)
+        for param_index, name in enumerate(param_names):
+            param = result.params[name]
+            values[index, param_index] = param.value
+            if param.stderr is not None:
+                errors[index, param_index] = param.stderr
+        success[index] = result.success
+        if result.success:
+            previous_values = {name: param.value for name, param in result.params.items()}
+        else:
+            previous_values = None
+
+    if param_names is None:
+        return list(), np.empty((len(y_stack), 0)), np.empty((len(y_stack), 0)), success
+    return param_names, values, errors, success
+
+
+# Fit methods of the worker process, created by the pool initializer
+_worker_fit_collection = None
+
+
+def _init_fit_worker(path_list):
+    global _worker_fit_collection
+    _worker_fit_collection = FitMethodCollection(path_list)
+
+
+def _fit_stack_in_worker(fit_name, estimator_name, x_data, y_stack, units, add_params,
+                         warm_start):
+    fit_method, estimator = _worker_fit_collection.get_fit_methods(fit_name, estimator_name)
+    if isinstance(add_params, str):
+        params = lmfit.Parameters()
+        params.loads(add_params)
+        add_params = params
+    return fit_stack(fit_method, estimator, x_data, y_stack, units, add_params, warm_start)
+
+
+class ParallelStackFitter:
+    """
+    Fits stacks of data sets in a pool of worker processes.
+
+    The stack is split into contiguous chunks of rows which are fitted in the worker processes.
+    With warm start, each fit within a chunk starts from the result of the previous row, so
+    neighbouring rows (e.g. neighbouring pixels of a scan) should be adjacent in the stack.
+    """
+    # Number of chunks per worker process the stack is split into
+    chunks_per_worker = 4
+
+    def __init__(self, max_workers, path_list):
+        self.max_workers = max(1, int(max_workers))
+        self._path_list = list(path_list)
+        self._executor = None
+
+    def fit(self, fit_name, estimator_name, x_data, y_stack, units=None, add_params=None,
+            warm_start=False):
+        """
+        Fit each row of y_stack in the worker processes. See fit_stack for the return values.
+
+        @param str fit_name: name of the fit, e.g. 'lorentzian'
+        @param str estimator_name: name of the estimator, e.g. 'dip' or 'generic'
+        """
+        if self._executor is None:
+            # Always spawn fresh interpreters. Forking the multithreaded Qt application is unsafe.
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_init_fit_worker,
+                                                 initargs=(self._path_list,))
+        if isinstance(add_params, lmfit.Parameters):
+            add_params = add_params.dumps()
+
+        chunk_count = max(1, min(len(y_stack), self.max_workers * self.chunks_per_worker))
+        chunks = [chunk for chunk in np.array_split(y_stack, chunk_count) if len(chunk) > 0]
+        futures = [self._executor.submit(_fit_stack_in_worker, fit_name, estimator_name, x_data,
+                                         chunk, units, add_params, warm_start)
+                   for chunk in chunks]
+        results = [future.result() for future in futures]
+
+        param_names = next((result[0] for result in results if result[0]), list())
+        values = np.full((len(y_stack), len(param_names)), np.nan)
+        errors = np.full((len(y_stack), len(param_names)), np.nan)
+        success = np.zeros(len(y_stack), dtype=bool)
+        start = 0
+        for chunk, (names, chunk_values, chunk_errors, chunk_success) in zip(chunks, results):
+            stop = start + len(chunk)
+            if names:
+                values[start:stop] = chunk_values
+                errors[start:stop] = chunk_errors
+            success[start:stop] = chunk_success
+            start = stop
+        return param_names, values, errors, success
+
+    def shutdown(self):
+        """
+        Terminates the worker processes.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        return
@@ -31,7 +31,150 @@ import matplotlib.pyplot as plt
 from logic.generic_logic import GenericLogic
 from core.util.mutex import Mutex
 from core.connector import Connector
+from core.configoption import ConfigOption
 from core.statusvariable import StatusVar
+from logic.figure_rendering import FigureSpec
+
+
+def draw_confocal_image(data, image_extent, scan_axis=None, cbar_range=None,
+                        percentile_range=None, crosshair_pos=None, style=None):
+    """ Create a 2-D color map figure of the scan image.
+
+    @param: array data: The NxM array of count values from a scan with NxM pixels.
+
+    @param: list image_extent: The scan range in the form [hor_min, hor_max, ver_min, ver_max]
+
+    @param: list axes: Names of the horizontal and vertical axes in the image
+
+    @param: list cbar_range: (optional) [color_scale_min, color_scale_max].  If not supplied then a default of
+                             data_min to data_max will be used.
+
+    @param: list percentile_range: (optional) Percentile range of the chosen cbar_range.
+
+    @param: list crosshair_pos: (optional) crosshair position as [hor, vert] in the chosen image axes.
+
+    @param: dict style: (optional) matplotlib style to use, e.g. SaveLogic.mpl_qd_style
+
+    @return: fig fig: a matplotlib figure object to be saved to file.
+    """
+    if scan_axis is None:
+        scan_axis = ['X', 'Y']
+
+    # If no colorbar range was given, take full range of data
+    if cbar_range is None:
+        cbar_range = [np.min(data), np.max(data)]
+
+    # Scale color values using SI prefix
+    prefix = ['', 'k', 'M', 'G']
+    prefix_count = 0
+    image_data = data
+    draw_cb_range = np.array(cbar_range)
+    image_dimension = image_extent.copy()
+
+    while draw_cb_range[1] > 1000:
+        image_data = image_data/1000
+        draw_cb_range = draw_cb_range/1000
+        prefix_count = prefix_count + 1
+
+    c_prefix = prefix[prefix_count]
+
+
+    # Scale axes values using SI prefix
+    axes_prefix = ['', 'm', r'$\mathrm{\mu}$', 'n']
+    x_prefix_count = 0
+    y_prefix_count = 0
+
+    while np.abs(image_dimension[1]-image_dimension[0]) < 1:
+        image_dimension[0] = image_dimension[0] * 1000.
+        image_dimension[1] = image_dimension[1] * 1000.
+        x_prefix_count = x_prefix_count + 1
+
+    while np.abs(image_dimension[3] - image_dimension[2]) < 1:
+        image_dimension[2] = image_dimension[2] * 1000.
+        image_dimension[3] = image_dimension[3] * 1000.
+        y_prefix_count = y_prefix_count + 1
+
+    x_prefix = axes_prefix[x_prefix_count]
+    y_prefix = axes_prefix[y_prefix_count]
+
+    # Use qudi style
+    if style is not None:
+        plt.style.use(style)
+
+    # Create figure
+    fig, ax = plt.subplots()
+
+    # Create image plot
+    cfimage = ax.imshow(image_data,
+                        cmap=plt.get_cmap('inferno'), # reference the right place in qd
+                        origin="lower",
+                        vmin=draw_cb_range[0],
+                        vmax=draw_cb_range[1],
+                        interpolation='none',
+                        extent=image_dimension
+                        )
+
+    ax.set_aspect(1)
+    ax.set_xlabel(scan_axis[0] + ' position (' + x_prefix + 'm)')
+    ax.set_ylabel(scan_axis[1] + ' position (' + y_prefix + 'm)')
+    ax.spines['bottom'].set_position(('outward', 10))
+    ax.spines['left'].set_position(('outward', 10))
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.get_xaxis().tick_bottom()
+    ax.get_yaxis().tick_left()
+
+    # draw the crosshair position if defined
+    if crosshair_pos is not None:
+        trans_xmark = mpl.transforms.blended_transform_factory(
+            ax.transData,
+            ax.transAxes)
+
+        trans_ymark = mpl.transforms.blended_transform_factory(
+            ax.transAxes,
+            ax.transData)
+
+        ax.annotate('', xy=(crosshair_pos[0]*np.power(1000,x_prefix_count), 0),
+                    xytext=(crosshair_pos[0]*np.power(1000,x_prefix_count), -0.01), xycoords=trans_xmark,
+                    arrowprops=dict(facecolor='#17becf', shrink=0.05),
+                    )
+
+        ax.annotate('', xy=(0, crosshair_pos[1]*np.power(1000,y_prefix_count)),
+                    xytext=(-0.01, crosshair_pos[1]*np.power(1000,y_prefix_count)), xycoords=trans_ymark,
+                    arrowprops=dict(facecolor='#17becf', shrink=0.05),
+                    )
+
+    # Draw the colorbar
+    cbar = plt.colorbar(cfimage, shrink=0.8)#, fraction=0.046, pad=0.08, shrink=0.75)
+    cbar.set_label('Fluorescence (' + c_prefix + 'c/s)')
+
+    # remove ticks from colorbar for cleaner image
+    cbar.ax.tick_params(which=u'both', length=0)
+
+    # If we have percentile information, draw that to the figure
+    if percentile_range is not None:
+        cbar.ax.annotate(str(percentile_range[0]),
+                         xy=(-0.3, 0.0),
+                         xycoords='axes fraction',
+                         horizontalalignment='right',
+                         verticalalignment='center',
+                         rotation=90
+                         )
+        cbar.ax.annotate(str(percentile_range[1]),
+                         xy=(-0.3, 1.0),
+                         xycoords='axes fraction',
+                         horizontalalignment='right',
+                         verticalalignment='center',
+                         rotation=90
+                         )
+        cbar.ax.annotate('(percentile)',
+                         xy=(-0.3, 0.5),
+                         xycoords='axes fraction',
+                         horizontalalignment='right',
+                         verticalalignment='center',
+                         rotation=90
+                         )
+    return fig
 
 
 class OldConfigFileError(Exception):
@@ -257,6 +400,11 @@ class ConfocalLogic(GenericLogic):
     confocalscanner1 = Connector(interface='ConfocalScannerInterface')
     savelogic = Connector(interface='SaveLogic')
 
+    # config options
+    # number of image lines scanned as one buffered trajectory if supported by the scanner,
+    # 0 scans all remaining lines of the image at once
+    lines_per_scan = ConfigOption('lines_per_scan', 0, missing='nothing')
+
     # status vars
     _clock_frequency = StatusVar('clock_frequency', 500)
     return_slowness = StatusVar(default=50)
@@ -712,6 +860,65 @@ class ConfocalLogic(GenericLogic):
         """
         return self._scanning_device.get_scanner_count_channels()
 
+    def _get_scan_line(self, image, line_index, n_ch):
+        """ Make a line of the scan from the pixel positions of the image.
+
+        @param numpy.ndarray image: the image to scan
+        @param int line_index: the line of the image
+        @param int n_ch: number of scanner axes
+
+        @return numpy.ndarray: the positions of the line for each scanner axis
+        """
+        # adjust z of line in image to current z before building the line
+        if not self._zscan:
+            image[line_index, :, 2] = self._current_z
+
+        lsx = image[line_index, :, 0]
+        lsy = image[line_index, :, 1]
+        lsz = image[line_index, :, 2]
+        if n_ch <= 3:
+            return np.vstack([lsx, lsy, lsz][0:n_ch])
+        return np.vstack([lsx, lsy, lsz, np.ones(lsx.shape) * self._current_a])
+
+    def _get_return_line(self, image, line_index, n_ch):
+        """ Make a line to go back to the starting position after a scan line.
+
+        @param numpy.ndarray image: the image to scan
+        @param int line_index: the line of the image after which to return
+        @param int n_ch: number of scanner axes
+
+        @return numpy.ndarray: the positions of the return line for each scanner axis
+        """
+        if self.depth_img_is_xz or not self._zscan:
+            return_line = [
+                self._return_XL,
+                image[line_index, 0, 1] * np.ones(self._return_XL.shape),
+                image[line_index, 0, 2] * np.ones(self._return_XL.shape)
+            ]
+        else:
+            return_line = [
+                image[line_index, 0, 1] * np.ones(self._return_YL.shape),
+                self._return_YL,
+                image[line_index, 0, 2] * np.ones(self._return_YL.shape)
+            ]
+        if n_ch <= 3:
+            return np.vstack(return_line[0:n_ch])
+        return np.vstack(return_line + [np.ones(return_line[0].shape) * self._current_a])
+
+    def _update_image_line(self, line_index, line_counts, s_ch):
+        """ Write the counts of a scanned line into the image and notify the GUI.
+
+        @param int line_index: the line of the image
+        @param numpy.ndarray line_counts: the counts of the line for each counting channel
+        @param int s_ch: number of counting channels
+        """
+        if self._zscan:
+            self.depth_image[line_index, :, 3:3 + s_ch] = line_counts
+            self.signal_depth_image_updated.emit()
+        else:
+            self.xy_image[line_index, :, 3:3 + s_ch] = line_counts
+            self.signal_xy_image_updated.emit()
+
     def _scan_line(self):
         """scanning an image in either depth or xy
 
@@ -762,75 +969,54 @@ class ConfocalLogic(GenericLogic):
                     self.signal_scan_lines_next.emit()
                     return
 
-            # adjust z of line in image to current z before building the line
-            if not self._zscan:
-                z_shape = image[self._scan_counter, :, 2].shape
-                image[self._scan_counter, :, 2] = self._current_z * np.ones(z_shape)
-
-            # make a line in the scan, _scan_counter says which one it is
-            lsx = image[self._scan_counter, :, 0]
-            lsy = image[self._scan_counter, :, 1]
-            lsz = image[self._scan_counter, :, 2]
-            if n_ch <= 3:
-                line = np.vstack([lsx, lsy, lsz][0:n_ch])
+            if self._scanning_device.scanner_supports_multiple_lines():
+                # scan several lines including their return paths as one trajectory
+                remaining_lines = np.size(self._image_vert_axis) - self._scan_counter
+                if self.lines_per_scan > 0:
+                    number_of_lines = min(self.lines_per_scan, remaining_lines)
+                else:
+                    number_of_lines = remaining_lines
+                first_line = self._scan_counter
+                line_indices = range(first_line, first_line + number_of_lines)
+                lines = np.array([self._get_scan_line(image, i, n_ch) for i in line_indices])
+                return_lines = np.array(
+                    [self._get_return_line(image, i, n_ch) for i in line_indices])
+
+                def line_scanned(line_index, line_counts):
+                    # update image with counts from the line just scanned
+                    self._update_image_line(first_line + line_index, line_counts, s_ch)
+                    return not self.stopRequested
+
+                lines_counts = self._scanning_device.scan_lines(
+                    lines, return_lines, pixel_clock=True, line_callback=line_scanned)
+                if np.any(lines_counts == -1):
+                    self.stopRequested = True
+                    self.signal_scan_lines_next.emit()
+                    return
+                # the last scanned line is counted below
+                self._scan_counter += len(lines_counts) - 1
             else:
-                line = np.vstack(
-                    [lsx, lsy, lsz, np.ones(lsx.shape) * self._current_a])
+                line = self._get_scan_line(image, self._scan_counter, n_ch)
 
-            # scan the line in the scan
-            line_counts = self._scanning_device.scan_line(line, pixel_clock=True)
-            if np.any(line_counts == -1):
-                self.stopRequested = True
-                self.signal_scan_lines_next.emit()
-                return
+                # scan the line in the scan
+                line_counts = self._scanning_device.scan_line(line, pixel_clock=True)
+                if np.any(line_counts == -1):
+                    self.stopRequested = True
+                    self.signal_scan_lines_next.emit()
+                    return
 
-            # make a line to go to the starting position of the next scan line
-            if self.depth_img_is_xz or not self._zscan:
-                if n_ch <= 3:
-                    return_line = np.vstack([
-                        self._return_XL,
-                        image[self._scan_counter, 0, 1] * np.ones(self._return_XL.shape),
-                        image[self._scan_counter, 0, 2] * np.ones(self._return_XL.shape)
-                    ][0:n_ch])
-                else:
-                    return_line = np.vstack([
-                            self._return_XL,
-                            image[self._scan_counter, 0, 1] * np.ones(self._return_XL.shape),
-                            image[self._scan_counter, 0, 2] * np.ones(self._return_XL.shape),
-                            np.ones(self._return_XL.shape) * self._current_a
-                        ])
-            else:
-                if n_ch <= 3:
-                    return_line = np.vstack([
-                            image[self._scan_counter, 0, 1] * np.ones(self._return_YL.shape),
-                            self._return_YL,
-                            image[self._scan_counter, 0, 2] * np.ones(self._return_YL.shape)
-                        ][0:n_ch])
-                else:
-                    return_line = np.vstack([
-                            image[self._scan_counter, 0, 1] * np.ones(self._return_YL.shape),
-                            self._return_YL,
-                            image[self._scan_counter, 0, 2] * np.ones(self._return_YL.shape),
-                            np.ones(self._return_YL.shape) * self._current_a
-                        ])
-
-            # return the scanner to the start of next line, counts are thrown away
-            return_line_counts = self._scanning_device.scan_line(return_line)
-            if np.any(return_line_counts == -1):
-                self.stopRequested = True
-                self.signal_scan_lines_next.emit()
-                return
+                # make a line to go to the starting position of the next scan line
+                return_line = self._get_return_line(image, self._scan_counter, n_ch)
 
-            # update image with counts from the line we just scanned
-            if self._zscan:
-                if self.depth_img_is_xz:
-                    self.depth_image[self._scan_counter, :, 3:3 + s_ch] = line_counts
-                else:
-                    self.depth_image[self._scan_counter, :, 3:3 + s_ch] = line_counts
-                self.signal_depth_image_updated.emit()
-            else:
-                self.xy_image[self._scan_counter, :, 3:3 + s_ch] = line_counts
-                self.signal_xy_image_updated.emit()
+                # return the scanner to the start of next line, counts are thrown away
+                return_line_counts = self._scanning_device.scan_line(return_line)
+                if np.any(return_line_counts == -1):
+                    self.stopRequested = True
+                    self.signal_scan_lines_next.emit()
+                    return
+
+                # update image with counts from the line we just scanned
+                self._update_image_line(self._scan_counter, line_counts, s_ch)
 
             # next line in scan
             self._scan_counter += 1
@@ -906,12 +1092,15 @@ class ConfocalLogic(GenericLogic):
         axes = ['X', 'Y']
         crosshair_pos = [self.get_position()[0], self.get_position()[1]]
 
-        figs = {ch: self.draw_figure(data=self.xy_image[:, :, 3 + n],
-                                     image_extent=image_extent,
-                                     scan_axis=axes,
-                                     cbar_range=colorscale_range,
-                                     percentile_range=percentile_range,
-                                     crosshair_pos=crosshair_pos)
+        # The figures are drawn by the save logic, possibly in a worker process
+        figs = {ch: FigureSpec(draw_confocal_image,
+                               data=self.xy_image[:, :, 3 + n],
+                               image_extent=image_extent,
+                               scan_axis=axes,
+                               cbar_range=colorscale_range,
+                               percentile_range=percentile_range,
+                               crosshair_pos=crosshair_pos,
+                               style=self._save_logic.mpl_qd_style)
                 for n, ch in enumerate(self.get_scanner_count_channels())}
 
         # Save the image data and figure
@@ -1015,12 +1204,15 @@ class ConfocalLogic(GenericLogic):
                         self.image_z_range[0],
                         self.image_z_range[1]]
 
-        figs = {ch: self.draw_figure(data=self.depth_image[:, :, 3 + n],
-                                     image_extent=image_extent,
-                                     scan_axis=axes,
-                                     cbar_range=colorscale_range,
-                                     percentile_range=percentile_range,
-                                     crosshair_pos=crosshair_pos)
+        # The figures are drawn by the save logic, possibly in a worker process
+        figs = {ch: FigureSpec(draw_confocal_image,
+                               data=self.depth_image[:, :, 3 + n],
+                               image_extent=image_extent,
+                               scan_axis=axes,
+                               cbar_range=colorscale_range,
+                               percentile_range=percentile_range,
+                               crosshair_pos=crosshair_pos,
+                               style=self._save_logic.mpl_qd_style)
                 for n, ch in enumerate(self.get_scanner_count_channels())}
 
         # Save the image data and figure
@@ -1066,139 +1258,12 @@ class ConfocalLogic(GenericLogic):
         return
 
     def draw_figure(self, data, image_extent, scan_axis=None, cbar_range=None, percentile_range=None,  crosshair_pos=None):
-        """ Create a 2-D color map figure of the scan image.
-
-        @param: array data: The NxM array of count values from a scan with NxM pixels.
-
-        @param: list image_extent: The scan range in the form [hor_min, hor_max, ver_min, ver_max]
-
-        @param: list axes: Names of the horizontal and vertical axes in the image
-
-        @param: list cbar_range: (optional) [color_scale_min, color_scale_max].  If not supplied then a default of
-                                 data_min to data_max will be used.
-
-        @param: list percentile_range: (optional) Percentile range of the chosen cbar_range.
-
-        @param: list crosshair_pos: (optional) crosshair position as [hor, vert] in the chosen image axes.
+        """ Create a 2-D color map figure of the scan image, see draw_confocal_image.
 
         @return: fig fig: a matplotlib figure object to be saved to file.
         """
-        if scan_axis is None:
-            scan_axis = ['X', 'Y']
-
-        # If no colorbar range was given, take full range of data
-        if cbar_range is None:
-            cbar_range = [np.min(data), np.max(data)]
-
-        # Scale color values using SI prefix
-        prefix = ['', 'k', 'M', 'G']
-        prefix_count = 0
-        image_data = data
-        draw_cb_range = np.array(cbar_range)
-        image_dimension = image_extent.copy()
-
-        while draw_cb_range[1] > 1000:
-            image_data = image_data/1000
-            draw_cb_range = draw_cb_range/1000
-            prefix_count = prefix_count + 1
-
-        c_prefix = prefix[prefix_count]
-
-
-        # Scale axes values using SI prefix
-        axes_prefix = ['', 'm', r'$\mathrm{\mu}$', 'n']
-        x_prefix_count = 0
-        y_prefix_count = 0
-
-        while np.abs(image_dimension[1]-image_dimension[0]) < 1:
-            image_dimension[0] = image_dimension[0] * 1000.
-            image_dimension[1] = image_dimension[1] * 1000.
-            x_prefix_count = x_prefix_count + 1
-
-        while np.abs(image_dimension[3] - image_dimension[2]) < 1:
-            image_dimension[2] = image_dimension[2] * 1000.
-            image_dimension[3] = image_dimension[3] * 1000.
-            y_prefix_count = y_prefix_count + 1
-
-        x_prefix = axes_prefix[x_prefix_count]
-        y_prefix = axes_prefix[y_prefix_count]
-
-        # Use qudi style
-        plt.style.use(self._save_logic.mpl_qd_style)
-
-        # Create figure
-        fig, ax = plt.subplots()
-
-        # Create image plot
-        cfimage = ax.imshow(image_data,
-                            cmap=plt.get_cmap('inferno'), # reference the right place in qd
-                            origin="lower",
-                            vmin=draw_cb_range[0],
-                            vmax=draw_cb_range[1],
-                            interpolation='none',
-                            extent=image_dimension
-                            )
-
-        ax.set_aspect(1)
-        ax.set_xlabel(scan_axis[0] + ' position (' + x_prefix + 'm)')
-        ax.set_ylabel(scan_axis[1] + ' position (' + y_prefix + 'm)')
-        ax.spines['bottom'].set_position(('outward', 10))
-        ax.spines['left'].set_position(('outward', 10))
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        ax.get_xaxis().tick_bottom()
-        ax.get_yaxis().tick_left()
-
-        # draw the crosshair position if defined
-        if crosshair_pos is not None:
-            trans_xmark = mpl.transforms.blended_transform_factory(
-                ax.transData,
-                ax.transAxes)
-
-            trans_ymark = mpl.transforms.blended_transform_factory(
-                ax.transAxes,
-                ax.transData)
-
-            ax.annotate('', xy=(crosshair_pos[0]*np.power(1000,x_prefix_count), 0),
-                        xytext=(crosshair_pos[0]*np.power(1000,x_prefix_count), -0.01), xycoords=trans_xmark,
-                        arrowprops=dict(facecolor='#17becf', shrink=0.05),
-                        )
-
-            ax.annotate('', xy=(0, crosshair_pos[1]*np.power(1000,y_prefix_count)),
-                        xytext=(-0.01, crosshair_pos[1]*np.power(1000,y_prefix_count)), xycoords=trans_ymark,
-                        arrowprops=dict(facecolor='#17becf', shrink=0.05),
-                        )
-
-        # Draw the colorbar
-        cbar = plt.colorbar(cfimage, shrink=0.8)#, fraction=0.046, pad=0.08, shrink=0.75)
-        cbar.set_label('Fluorescence (' + c_prefix + 'c/s)')
-
-        # remove ticks from colorbar for cleaner image
-        cbar.ax.tick_params(which=u'both', length=0)
-
-        # If we have percentile information, draw that to the figure
-        if percentile_range is not None:
-            cbar.ax.annotate(str(percentile_range[0]),
-                             xy=(-0.3, 0.0),
-                             xycoords='axes fraction',
-                             horizontalalignment='right',
-                             verticalalignment='center',
-                             rotation=90
-                             )
-            cbar.ax.annotate(str(percentile_range[1]),
-                             xy=(-0.3, 1.0),
-                             xycoords='axes fraction',
-                             horizontalalignment='right',
-                             verticalalignment='center',
-                             rotation=90
-                             )
-            cbar.ax.annotate('(percentile)',
-                             xy=(-0.3, 0.5),
-                             xycoords='axes fraction',
-                             horizontalalignment='right',
-                             verticalalignment='center',
-                             rotation=90
-                             )
+        fig = draw_confocal_image(data, image_extent, scan_axis, cbar_range, percentile_range,
+                                  crosshair_pos, style=self._save_logic.mpl_qd_style)
         self.signal_draw_figure_completed.emit()
         return fig
 
@@ -22,11 +22,14 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 from qtpy import QtCore
 from collections import OrderedDict
 import numpy as np
+import tempfile
 import time
 import matplotlib.pyplot as plt
 
 from core.connector import Connector
+from core.configoption import ConfigOption
 from core.statusvariable import StatusVar
+from core.util.data_recorder import ChunkedDataRecorder
 from logic.generic_logic import GenericLogic
 from interface.slow_counter_interface import CountingMode
 from core.util.mutex import Mutex
@@ -59,6 +62,12 @@ class CounterLogic(GenericLogic):
     counter1 = Connector(interface='SlowCounterInterface')
     savelogic = Connector(interface='SaveLogic')
 
+    # config options
+    # Number of saved samples held in one preallocated chunk of the recording buffer
+    _recording_chunk_size = ConfigOption('recording_chunk_size', 65536, missing='nothing')
+    # Directory full chunks of the recording buffer are spilled to (default: system temp directory)
+    _recording_path = ConfigOption('recording_path', None, missing='nothing')
+
     # status vars
     _count_length = StatusVar('count_length', 300)
     _smooth_window_length = StatusVar('smooth_window_length', 10)
@@ -112,11 +121,14 @@ class CounterLogic(GenericLogic):
         number_of_detectors = constraints.max_detectors
 
         # initialize data arrays
-        self.countdata = np.zeros([len(self.get_channels()), self._count_length])
-        self.countdata_smoothed = np.zeros([len(self.get_channels()), self._count_length])
+        self._init_trace_buffers()
         self.rawdata = np.zeros([len(self.get_channels()), self._counting_samples])
         self._already_counted_samples = 0  # For gated counting
-        self._data_to_save = []
+        recording_path = tempfile.gettempdir() if self._recording_path is None else \
+            self._recording_path
+        self._data_to_save = ChunkedDataRecorder(number_of_columns=len(self.get_channels()) + 1,
+                                                 chunk_size=self._recording_chunk_size,
+                                                 spill_path=recording_path)
 
         # Flag to stop the loop
         self.stopRequested = False
@@ -138,8 +150,31 @@ class CounterLogic(GenericLogic):
             self._stopCount_wait()
 
         self.sigCountDataNext.disconnect()
+        self._data_to_save.close()
         return
 
+    @property
+    def countdata(self):
+        """ Count trace of all channels in chronological order (oldest sample first).
+
+        This is a read-only view into the circular trace buffer and not a copy. It changes in place
+        with each new sample.
+
+        @return numpy.ndarray: count trace with shape (channels, count_length)
+        """
+        return self._get_trace_view(self._trace_buffer)
+
+    @property
+    def countdata_smoothed(self):
+        """ Smoothed (running median) count trace of all channels in chronological order.
+
+        This is a read-only view into the circular trace buffer and not a copy. It changes in place
+        with each new sample.
+
+        @return numpy.ndarray: smoothed count trace with shape (channels, count_length)
+        """
+        return self._get_trace_view(self._smoothed_trace_buffer)
+
     def get_hardware_constraints(self):
         """
         Retrieve the hardware constrains from the counter device.
@@ -263,7 +298,7 @@ class CounterLogic(GenericLogic):
         @return bool: saving state
         """
         if not resume:
-            self._data_to_save = []
+            self._data_to_save.clear()
             self._saving_start_time = time.time()
 
         self._saving = True
@@ -308,11 +343,11 @@ class CounterLogic(GenericLogic):
             for i, detector in enumerate(self.get_channels()):
                 header = header + ',Signal{0} (counts/s)'.format(i)
 
-            data = {header: self._data_to_save}
+            data = {header: self._data_to_save[:]}
             filepath = self._save_logic.get_path_for_module(module_name='Counter')
 
             if save_figure:
-                fig = self.draw_figure(data=np.array(self._data_to_save))
+                fig = self.draw_figure(data=data[header])
             else:
                 fig = None
             self._save_logic.save_data(data, filepath=filepath, parameters=parameters,
@@ -320,7 +355,7 @@ class CounterLogic(GenericLogic):
             self.log.info('Counter Trace saved to:\n{0}'.format(filepath))
 
         self.sigSavingStatusChanged.emit(self._saving)
-        return self._data_to_save, parameters
+        return self._data_to_save[:], parameters
 
     def draw_figure(self, data):
         """ Draw figure to save with data file.
@@ -426,9 +461,8 @@ class CounterLogic(GenericLogic):
 
             # initialising the data arrays
             self.rawdata = np.zeros([len(self.get_channels()), self._counting_samples])
-            self.countdata = np.zeros([len(self.get_channels()), self._count_length])
-            self.countdata_smoothed = np.zeros([len(self.get_channels()), self._count_length])
-            self._sampling_data = np.empty([len(self.get_channels()), self._counting_samples])
+            self._init_trace_buffers()
+            self._sampling_data = np.empty([self._counting_samples, len(self.get_channels()) + 1])
 
             # the sample index for gated counting
             self._already_counted_samples = 0
@@ -553,39 +587,13 @@ class CounterLogic(GenericLogic):
         Processes the raw data from the counting device
         @return:
         """
-        for i, ch in enumerate(self.get_channels()):
-            # remember the new count data in circular array
-            self.countdata[i, 0] = np.average(self.rawdata[i])
-        # move the array to the left to make space for the new data
-        self.countdata = np.roll(self.countdata, -1, axis=1)
-        # also move the smoothing array
-        self.countdata_smoothed = np.roll(self.countdata_smoothed, -1, axis=1)
-        # calculate the median and save it
-        window = -int(self._smooth_window_length / 2) - 1
-        for i, ch in enumerate(self.get_channels()):
-            self.countdata_smoothed[i, window:] = np.median(self.countdata[i,
-                                                            -self._smooth_window_length:])
+        # remember the new count data in circular array and update the running median
+        self._append_to_trace(np.mean(self.rawdata, axis=1)[:, np.newaxis])
+        self._update_smoothed_trace()
 
         # save the data if necessary
         if self._saving:
-             # if oversampling is necessary
-            if self._counting_samples > 1:
-                chans = self.get_channels()
-                self._sampling_data = np.empty([len(chans) + 1, self._counting_samples])
-                self._sampling_data[0, :] = time.time() - self._saving_start_time
-                for i, ch in enumerate(chans):
-                    self._sampling_data[i+1, 0] = self.rawdata[i]
-
-                self._data_to_save.extend(list(self._sampling_data))
-            # if we don't want to use oversampling
-            else:
-                # append tuple to data stream (timestamp, average counts)
-                chans = self.get_channels()
-                newdata = np.empty((len(chans) + 1, ))
-                newdata[0] = time.time() - self._saving_start_time
-                for i, ch in enumerate(chans):
-                    newdata[i+1] = self.countdata[i, -1]
-                self._data_to_save.append(newdata)
+            self._record_samples()
         return
 
     def _process_data_gated(self):
@@ -593,29 +601,23 @@ class CounterLogic(GenericLogic):
         Processes the raw data from the counting device
         @return:
         """
-        # remember the new count data in circular array
-        self.countdata[0] = np.average(self.rawdata[0])
-        # move the array to the left to make space for the new data
-        self.countdata = np.roll(self.countdata, -1)
-        # also move the smoothing array
-        self.countdata_smoothed = np.roll(self.countdata_smoothed, -1)
-        # calculate the median and save it
-        self.countdata_smoothed[-int(self._smooth_window_length / 2) - 1:] = np.median(
-            self.countdata[-self._smooth_window_length:])
+        # remember the new count data in circular array and update the running median
+        self._append_to_trace(np.mean(self.rawdata, axis=1)[:, np.newaxis])
+        self._update_smoothed_trace()
 
         # save the data if necessary
         if self._saving:
-            # if oversampling is necessary
-            if self._counting_samples > 1:
-                self._sampling_data = np.empty((self._counting_samples, 2))
-                self._sampling_data[:, 0] = time.time() - self._saving_start_time
-                self._sampling_data[:, 1] = self.rawdata[0]
-                self._data_to_save.extend(list(self._sampling_data))
-            # if we don't want to use oversampling
-            else:
-                # append tuple to data stream (timestamp, average counts)
-                self._data_to_save.append(np.array((time.time() - self._saving_start_time,
-                                                    self.countdata[-1])))
+            self._record_samples()
+        return
+
+    def _record_samples(self):
+        """ Appends the current raw data (one row per sample: timestamp, counts of each channel)
+        to the recording buffer.
+        Without oversampling this is the same as the latest entry of the count trace.
+        """
+        self._sampling_data[:, 0] = time.time() - self._saving_start_time
+        self._sampling_data[:, 1:] = self.rawdata.transpose()
+        self._data_to_save.append(self._sampling_data)
         return
 
     def _process_data_finite_gated(self):
@@ -623,19 +625,93 @@ class CounterLogic(GenericLogic):
         Processes the raw data from the counting device
         @return:
         """
-        if self._already_counted_samples+len(self.rawdata[0]) >= len(self.countdata):
-            needed_counts = len(self.countdata) - self._already_counted_samples
-            self.countdata[0:needed_counts] = self.rawdata[0][0:needed_counts]
-            self.countdata = np.roll(self.countdata, -needed_counts)
+        if self._already_counted_samples + self.rawdata.shape[1] >= self._count_length:
+            needed_counts = self._count_length - self._already_counted_samples
+            self._append_to_trace(self.rawdata[:, :needed_counts])
             self._already_counted_samples = 0
             self.stopRequested = True
         else:
-            # replace the first part of the array with the new data:
-            self.countdata[0:len(self.rawdata[0])] = self.rawdata[0]
-            # roll the array by the amount of data it had been inserted:
-            self.countdata = np.roll(self.countdata, -len(self.rawdata[0]))
+            # append the new data to the circular array
+            self._append_to_trace(self.rawdata)
             # increment the index counter:
-            self._already_counted_samples += len(self.rawdata[0])
+            self._already_counted_samples += self.rawdata.shape[1]
+        return
+
+    def _init_trace_buffers(self):
+        """ (Re-)Initialize the circular buffers holding the (smoothed) count trace.
+
+        Each buffer holds every sample twice (at index i and i + count_length). This way the
+        chronological trace is always a contiguous slice of the buffer and can be handed out as
+        view without copying or rolling the data.
+        """
+        number_of_channels = len(self.get_channels())
+        self._trace_buffer = np.zeros((number_of_channels, 2 * self._count_length))
+        self._smoothed_trace_buffer = np.zeros((number_of_channels, 2 * self._count_length))
+        # Buffer index of the oldest sample in the trace (the next one to be overwritten)
+        self._trace_head = 0
+        return
+
+    def _get_trace_view(self, buffer):
+        """ Returns a read-only view of a circular trace buffer in chronological order.
+
+        @param numpy.ndarray buffer: one of the circular trace buffers
+
+        @return numpy.ndarray: view of the buffer with shape (channels, count_length)
+        """
+        length = buffer.shape[1] // 2
+        view = buffer[:, self._trace_head:self._trace_head + length]
+        view.flags.writeable = False
+        return view
+
+    def _write_to_trace_buffer(self, buffer, position, data):
+        """ Writes samples into both halves of a circular trace buffer.
+
+        @param numpy.ndarray buffer: one of the circular trace buffers
+        @param int position: buffer index (0 <= position < count_length) of the first sample
+        @param numpy.ndarray data: samples to write with shape (channels, n), n <= count_length
+        """
+        length = buffer.shape[1] // 2
+        number_of_samples = data.shape[1]
+        first_part = min(number_of_samples, length - position)
+        buffer[:, position:position + first_part] = data[:, :first_part]
+        buffer[:, position + length:position + length + first_part] = data[:, :first_part]
+        if first_part < number_of_samples:
+            # wrap around
+            rest = number_of_samples - first_part
+            buffer[:, :rest] = data[:, first_part:]
+            buffer[:, length:length + rest] = data[:, first_part:]
+        return
+
+    def _append_to_trace(self, samples):
+        """ Appends new samples to the count trace, dropping the same number of oldest samples.
+
+        The cost only depends on the number of new samples and not on the trace length.
+
+        @param numpy.ndarray samples: new samples with shape (channels, n)
+        """
+        length = self._trace_buffer.shape[1] // 2
+        samples = samples[:, -length:]
+        self._write_to_trace_buffer(self._trace_buffer, self._trace_head, samples)
+        self._trace_head = (self._trace_head + samples.shape[1]) % length
+        return
+
+    def _update_smoothed_trace(self):
+        """ Updates the smoothed trace after a single sample has been appended to the trace.
+
+        The median of the last smooth_window_length samples is calculated and written to the last
+        int(smooth_window_length / 2) + 1 entries of the smoothed trace. This way each entry of the
+        smoothed trace ends up as the median of a window centered around it, while the most recent
+        entries show the current median. Only the samples within the smoothing window are touched.
+        """
+        length = self._trace_buffer.shape[1] // 2
+        window_length = min(self._smooth_window_length, length)
+        update_length = min(int(self._smooth_window_length / 2) + 1, length)
+        newest = self._trace_head + length
+        median = np.median(self._trace_buffer[:, newest - window_length:newest], axis=1)
+        median = np.repeat(median[:, np.newaxis], update_length, axis=1)
+        self._write_to_trace_buffer(self._smoothed_trace_buffer,
+                                    (self._trace_head - update_length) % length,
+                                    median)
         return
 
     def _stopCount_wait(self, timeout=5.0):
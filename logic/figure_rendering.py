@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the tools to render the figures saved by the SaveLogic, optionally in a pool of
+worker processes so the measurement can continue while the figures are rendered.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import multiprocessing
+import pickle
+import matplotlib
+import matplotlib.pyplot as plt
+from concurrent.futures import Future, ProcessPoolExecutor
+from matplotlib.backends.backend_pdf import PdfPages
+
+
+class FigureSpec:
+    """
+    Description of a figure which is only drawn when it is rendered, e.g. in a worker process.
+
+    The figure is created by calling function(*args, **kwargs), which must return a matplotlib
+    figure. To be drawn in a worker process, the function has to be a module level function and
+    all arguments have to be picklable.
+    """
+
+    def __init__(self, function, *args, **kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+
+    def draw(self):
+        """ Create the figure.
+
+        @return matplotlib.figure.Figure: the drawn figure
+        """
+        return self.function(*self.args, **self.kwargs)
+
+
+def figure_metadata(module_name, timestamp):
+    """ Metadata of the figure files saved by qudi.
+
+    @param str module_name: name of the module the figure belongs to
+    @param datetime.datetime timestamp: creation time of the figure
+
+    @return dict: metadata for the PDF info dictionary
+    """
+    metadata = dict()
+    metadata['Title'] = 'Image produced by qudi: ' + module_name
+    metadata['Author'] = 'qudi - Software Suite'
+    metadata['Subject'] = 'Find more information on: https://github.com/Ulm-IQO/qudi'
+    metadata['Keywords'] = 'Python 3, Qt, experiment control, automation, measurement, software, ' \
+                           'framework, modular'
+    metadata['Producer'] = 'qudi - Software Suite'
+    metadata['CreationDate'] = timestamp
+    metadata['ModDate'] = timestamp
+    return metadata
+
+
+def render_figure(figure, fig_basename, metadata, save_pdf=False, save_png=True):
+    """
+    Saves a figure as PDF and/or PNG file including the metadata and closes it afterwards.
+
+    @param matplotlib.figure.Figure|FigureSpec figure: the figure (or its description) to save
+    @param str fig_basename: path of the figure files without the extension
+    @param dict metadata: metadata of the figure as returned by figure_metadata
+    @param bool save_pdf: save the figure as <fig_basename>.pdf
+    @param bool save_png: save the figure as <fig_basename>.png
+
+    @return list: paths of the saved files
+    """
+    if isinstance(figure, FigureSpec):
+        figure = figure.draw()
+
+    saved_files = list()
+    try:
+        if save_pdf:
+            fig_fname_vector = fig_basename + '.pdf'
+            # The with statement makes sure that the PdfPages object is closed properly at
+            # the end of the block, even if an Exception occurs.
+            with PdfPages(fig_fname_vector) as pdf:
+                pdf.savefig(figure, bbox_inches='tight', pad_inches=0.05)
+                pdf.infodict().update(metadata)
+            saved_files.append(fig_fname_vector)
+
+        if save_png:
+            fig_fname_image = fig_basename + '.png'
+            # PNG text chunks can only hold strings, so let's convert our times
+            png_metadata = dict()
+            for key, value in metadata.items():
+                if hasattr(value, 'strftime'):
+                    value = value.strftime('%Y%m%d-%H%M-%S')
+                png_metadata[key] = str(value)
+            # the metadata is written together with the image
+            figure.savefig(fig_fname_image, format='png', bbox_inches='tight', pad_inches=0.05,
+                           metadata=png_metadata)
+            saved_files.append(fig_fname_image)
+    finally:
+        # close matplotlib figure
+        plt.close(figure)
+    return saved_files
+
+
+def _init_render_worker():
+    # Render without any GUI toolkit
+    matplotlib.use('Agg')
+
+
+def _render_pickled_figure(pickled_figure, fig_basename, metadata, save_pdf, save_png):
+    return render_figure(pickle.loads(pickled_figure), fig_basename, metadata, save_pdf, save_png)
+
+
+class FigureRenderer:
+    """
+    Renders figures in a pool of worker processes (Agg backend).
+
+    The figure (or FigureSpec) is pickled in the calling thread and closed there, all drawing and
+    file output happens in a worker process. Figures that can not be pickled are rendered in the
+    calling thread instead. With max_workers=0 all figures are rendered in the calling thread.
+    """
+
+    def __init__(self, max_workers=1):
+        self.max_workers = max(0, int(max_workers))
+        self._executor = None
+
+    def submit(self, figure, fig_basename, metadata, save_pdf=False, save_png=True):
+        """
+        Render a figure, see render_figure for the parameters.
+
+        @return concurrent.futures.Future: future with the list of saved files as result
+        """
+        pickled_figure = None
+        if self.max_workers > 0:
+            try:
+                pickled_figure = pickle.dumps(figure)
+            except Exception:
+                pickled_figure = None
+
+        if pickled_figure is None:
+            future = Future()
+            try:
+                future.set_result(render_figure(figure, fig_basename, metadata, save_pdf, save_png))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        if not isinstance(figure, FigureSpec):
+            plt.close(figure)
+        if self._executor is None:
+            # Always spawn fresh interpreters. Forking the multithreaded Qt application is unsafe.
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_init_render_worker)
+        return self._executor.submit(_render_pickled_figure, pickled_figure, fig_basename,
+                                     metadata, save_pdf, save_png)
+
+    def shutdown(self, wait=True):
+        """
+        Terminates the worker processes.
+
+        @param bool wait: wait for all submitted figures to be rendered
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+        return
@@ -31,6 +31,7 @@ from collections import OrderedDict
 from distutils.version import LooseVersion
 
 from logic.generic_logic import GenericLogic
+from logic.batch_fitting import ParallelStackFitter, fit_stack
 from core.util.modules import get_main_dir
 from core.util.mutex import Mutex
 from core.config import load, save
@@ -54,6 +55,9 @@ class FitLogic(GenericLogic):
     _additional_methods_import_path = ConfigOption(name='additional_fit_methods_path',
                                                    default=None,
                                                    missing='nothing')
+    # Number of worker processes used by batch_fit. A value of 1 (default) fits all data sets one
+    # after another in the calling thread.
+    _batch_fit_processes = ConfigOption(name='batch_fit_processes', default=1, missing='nothing')
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -88,6 +92,8 @@ class FitLogic(GenericLogic):
                     filenames.append(f[:-3])
                     if path not in sys.path:
                         sys.path.append(path)
+        self._fit_methods_path_list = path_list
+        self._parallel_fitter = None
 
         # A dictionary containing all fit methods and their estimators.
         self.fit_list = OrderedDict()
@@ -175,9 +181,15 @@ class FitLogic(GenericLogic):
         if fitversion < LooseVersion('0.9.2'):
             raise Exception('lmfit needs to be at least version 0.9.2!')
 
+        if self._batch_fit_processes > 1:
+            self._parallel_fitter = ParallelStackFitter(max_workers=self._batch_fit_processes,
+                                                        path_list=self._fit_methods_path_list)
+
     def on_deactivate(self):
         """ """
-        pass
+        if self._parallel_fitter is not None:
+            self._parallel_fitter.shutdown()
+            self._parallel_fitter = None
 
     def validate_load_fits(self, fits):
         """ Take fit names and estimators from a dict and check if they are valid.
@@ -270,6 +282,56 @@ class FitLogic(GenericLogic):
         stripped_fits = self.prepare_save_fits(fits)
         save(filename, stripped_fits)
 
+    def batch_fit(self, x_data, y_stack, fit_name, estimator_name='generic', units=None,
+                  add_params=None, warm_start=False):
+        """ Fit many 1D data sets sharing the same x axis with the same fit.
+            @param x_data numpy.ndarray: 1D array of x values
+            @param y_stack numpy.ndarray: 2D array with one data set per row. Higher dimensional
+                                          arrays (e.g. one spectrum per pixel of a scan) are
+                                          fitted along the last axis.
+            @param fit_name str: name of the fit function, e.g. 'lorentzian'
+            @param estimator_name str: name of the estimator, e.g. 'dip' (default: 'generic')
+            @param units list(str): optional, units for x axis and y axis
+            @param add_params lmfit.parameter.Parameters: optional, parameters used instead of
+                                                          the estimated ones
+            @param warm_start bool: If True, each fit starts from the result of the previous
+                                    data set (the neighbouring row) instead of the estimate.
+
+            @return dict: 'parameters' (OrderedDict of parameter value arrays),
+                          'errors' (OrderedDict of parameter error arrays, NaN if not available)
+                          and 'success' (bool array). All arrays have the shape of y_stack
+                          without the last axis.
+
+        If the ConfigOption "batch_fit_processes" is larger than 1, the data sets are fitted in
+        a pool of worker processes. Otherwise they are fitted one after another in the calling
+        thread.
+        """
+        x_data = np.asarray(x_data, dtype=float)
+        y_stack = np.asarray(y_stack, dtype=float)
+        stack_shape = y_stack.shape[:-1]
+        y_stack = y_stack.reshape((-1, y_stack.shape[-1]))
+
+        if self._parallel_fitter is not None:
+            param_names, values, errors, success = self._parallel_fitter.fit(
+                fit_name, estimator_name, x_data, y_stack, units, add_params, warm_start)
+        else:
+            if estimator_name == 'generic':
+                estimator = getattr(self, 'estimate_{0}'.format(fit_name))
+            else:
+                estimator = getattr(self, 'estimate_{0}_{1}'.format(fit_name, estimator_name))
+            param_names, values, errors, success = fit_stack(
+                getattr(self, 'make_{0}_fit'.format(fit_name)), estimator, x_data, y_stack,
+                units, add_params, warm_start)
+
+        if not success.all():
+            self.log.warning('{0:d} of {1:d} fits did not succeed.'.format(
+                np.count_nonzero(~success), len(success)))
+        return {'parameters': OrderedDict((name, values[:, i].reshape(stack_shape))
+                                          for i, name in enumerate(param_names)),
+                'errors': OrderedDict((name, errors[:, i].reshape(stack_shape))
+                                      for i, name in enumerate(param_names)),
+                'success': success.reshape(stack_shape)}
+
     def make_fit_container(self, container_name, dimension):
         """ Creare a fit container object.
             @param container_name str: user-fiendly name for configurable fit
@@ -462,3 +524,29 @@ class FitContainer(QtCore.QObject):
         self.sigFitUpdated.emit()
 
         return fit_x, fit_y, result
+
+    def do_batch_fit(self, x_data, y_stack, warm_start=False):
+        """ Performs the chosen fit on many data sets sharing the same x values.
+        @param array x_data: 1D np.array with the x values.
+        @param array y_stack: np.array with one data set per row (last axis), each with the
+                              same size as x_data.
+        @param bool warm_start: If True, each fit starts from the result of the previous data set.
+
+        @return dict: parameter, error and success arrays, see FitLogic.batch_fit.
+                      None if the current fit is 'No Fit'.
+
+        The result of the batch fit is not stored as current fit result of this container.
+        """
+        if self.current_fit not in self.fit_list:
+            if self.current_fit != 'No Fit':
+                self.fit_logic.log.warning('Fit "{0}" not found in {1} fit list. Batch fit is '
+                                           'skipped.'.format(self.current_fit, self.name))
+            return None
+        fit = self.fit_list[self.current_fit]
+        return self.fit_logic.batch_fit(x_data=x_data,
+                                        y_stack=y_stack,
+                                        fit_name=fit['fit_name'],
+                                        estimator_name=fit['est_name'],
+                                        units=self.units,
+                                        add_params=self.use_settings,
+                                        warm_start=warm_start)
@@ -186,6 +186,31 @@ class ScannerTiltInterfuse(GenericLogic, ConfocalScannerInterface):
             line_path[:][2] += self._calc_dz(line_path[:][0], line_path[:][1])
         return self._scanning_device.scan_line(line_path, pixel_clock)
 
+    def scanner_supports_multiple_lines(self):
+        """ Whether the underlying scanner can scan several lines as one buffered trajectory.
+
+        @return bool: True if the connected scanner supports scan_lines
+        """
+        return self._scanning_device.scanner_supports_multiple_lines()
+
+    def scan_lines(self, line_paths, return_paths, pixel_clock=False, line_callback=None):
+        """ Scans several lines in a row and returns the counts on these lines.
+
+        @param float[l][4][k] line_paths: l lines of positions (same format as for scan_line)
+        @param float[l][4][r] return_paths: path following each line, counts are thrown away
+        @param bool pixel_clock: whether we need to output a pixel clock for the lines
+        @param callable line_callback: optional, called after each line with the line index
+                                       and the counts of that line
+
+        @return float[i][k][m]: the photon counts per second of the i scanned lines
+        """
+        if self.tiltcorrection:
+            for path in (line_paths, return_paths):
+                for line_path in path:
+                    line_path[2] += self._calc_dz(line_path[0], line_path[1])
+        return self._scanning_device.scan_lines(
+            line_paths, return_paths, pixel_clock=pixel_clock, line_callback=line_callback)
+
     def close_scanner(self):
         """ Closes the scanner and cleans up afterwards.
 
@@ -52,6 +52,9 @@ class ODMRLogic(GenericLogic):
                     'LIST',
                     missing='warn',
                     converter=lambda x: MicrowaveMode[x.upper()])
+    # Number of sweeps acquired by the ODMR counter in one call (if supported by the hardware).
+    # The microwave source has to start over at the beginning of the list/sweep by itself.
+    sweeps_per_readout = ConfigOption('sweeps_per_readout', 1, missing='nothing')
 
     clock_frequency = StatusVar('clock_frequency', 200)
     cw_mw_frequency = StatusVar('cw_mw_frequency', 2870e6)
@@ -123,11 +126,7 @@ class ODMRLogic(GenericLogic):
         # Initalize the ODMR data arrays (mean signal and sweep matrix)
         self._initialize_odmr_plots()
         # Raw data array
-        self.odmr_raw_data = np.zeros(
-            [self.number_of_lines,
-             len(self._odmr_counter.get_odmr_channels()),
-            self.odmr_plot_x.size]
-            )
+        self._initialize_odmr_raw_data(self.number_of_lines)
 
         # Switch off microwave and set CW frequency and power
         self.mw_off()
@@ -199,6 +198,107 @@ class ODMRLogic(GenericLogic):
         else:
             return None
 
+    @property
+    def odmr_raw_data(self):
+        """ All sweeps of the current measurement, most recent sweep first.
+
+        This is a read-only view into the raw data buffer and not a copy.
+
+        @return numpy.ndarray: raw data with shape (elapsed_sweeps, channels, frequencies)
+        """
+        offset = self._odmr_raw_offset
+        view = self._odmr_raw_buffer[offset:offset + self.elapsed_sweeps][::-1]
+        view.flags.writeable = False
+        return view
+
+    def _initialize_odmr_raw_data(self, number_of_lines):
+        """ Allocates the raw data buffer and resets the running sums of the ODMR sweeps.
+
+        Sweeps are stored in chronological order after number_of_lines leading rows of zeros. This
+        way the sweep matrix (most recent sweep first, padded with zeros) is always a reversed slice
+        of the buffer and can be handed out without copying.
+
+        @param int number_of_lines: estimated number of sweeps to allocate memory for
+        """
+        self._odmr_raw_offset = self.number_of_lines
+        self._odmr_raw_buffer = np.zeros(
+            [self._odmr_raw_offset + number_of_lines,
+             len(self._odmr_counter.get_odmr_channels()),
+             self.odmr_plot_x.size]
+        )
+        self._odmr_sum = np.zeros(self._odmr_raw_buffer.shape[1:])
+        self._odmr_window_sum = np.zeros(self._odmr_raw_buffer.shape[1:])
+        # Number of sweeps the window sum has been calculated for
+        self._odmr_window_length = 0
+        return
+
+    def _get_odmr_matrix(self):
+        """ Returns the sweep matrix with the most recent sweep first.
+
+        @return numpy.ndarray: view of the raw data buffer with shape
+                               (number_of_lines, channels, frequencies)
+        """
+        top = self._odmr_raw_offset + self.elapsed_sweeps
+        return self._odmr_raw_buffer[max(0, top - self.number_of_lines):top][::-1]
+
+    def _sum_odmr_window(self):
+        """ Sums up the most recent lines_to_average sweeps from scratch.
+
+        @return numpy.ndarray: sum of the sweeps with shape (channels, frequencies)
+        """
+        offset = self._odmr_raw_offset
+        first_line = offset + max(0, self.elapsed_sweeps - self.lines_to_average)
+        return np.sum(self._odmr_raw_buffer[first_line:offset + self.elapsed_sweeps],
+                      axis=0,
+                      dtype=np.float64)
+
+    def _update_odmr_window_sum(self, number_of_new_lines=1):
+        """ Updates the sum of the most recent lines_to_average sweeps after new sweeps have been
+        added to the raw data buffer.
+
+        Only the new sweeps are added and the sweeps dropping out of the window are subtracted.
+        From time to time (and if lines_to_average has changed) the window is summed up from
+        scratch to avoid accumulating rounding errors.
+
+        @param int number_of_new_lines: number of sweeps added since the last update
+        """
+        lines_to_average = self.lines_to_average
+        if lines_to_average <= 0:
+            return
+        new_sweeps = self.elapsed_sweeps
+        old_sweeps = new_sweeps - number_of_new_lines
+        if self._odmr_window_length != lines_to_average or \
+                new_sweeps // lines_to_average != old_sweeps // lines_to_average:
+            self._odmr_window_length = lines_to_average
+            self._odmr_window_sum = self._sum_odmr_window()
+        elif number_of_new_lines > 0:
+            offset = self._odmr_raw_offset
+            self._odmr_window_sum += np.sum(
+                self._odmr_raw_buffer[offset + old_sweeps:offset + new_sweeps], axis=0)
+            first_old_line = max(0, old_sweeps - lines_to_average)
+            first_new_line = max(0, new_sweeps - lines_to_average)
+            self._odmr_window_sum -= np.sum(
+                self._odmr_raw_buffer[offset + first_old_line:offset + first_new_line], axis=0)
+        return
+
+    def _get_sweeps_per_readout(self):
+        """ Returns the number of sweeps to acquire with one call to the ODMR counter.
+
+        @return int: number of sweeps per readout (1 if the hardware can not acquire more at once)
+        """
+        if self.sweeps_per_readout > 1 and self._odmr_counter.odmr_supports_multiple_lines():
+            return int(self.sweeps_per_readout)
+        return 1
+
+    def _get_odmr_mean(self):
+        """ Calculates the mean signal from the running sums of the sweeps.
+
+        @return numpy.ndarray: mean signal with shape (channels, frequencies)
+        """
+        if self.lines_to_average <= 0 or self.elapsed_sweeps <= self.lines_to_average:
+            return self._odmr_sum / max(1, self.elapsed_sweeps)
+        return self._odmr_window_sum / self.lines_to_average
+
     def _initialize_odmr_plots(self):
         """ Initializing the ODMR plots (line and matrix). """
         self.odmr_plot_x = np.arange(self.mw_start, self.mw_stop + self.mw_step, self.mw_step)
@@ -243,18 +343,11 @@ class ODMRLogic(GenericLogic):
         """
         self.lines_to_average = int(lines_to_average)
 
-        if self.lines_to_average <= 0:
-            self.odmr_plot_y = np.mean(
-                self.odmr_raw_data[:max(1, self.elapsed_sweeps), :, :],
-                axis=0,
-                dtype=np.float64
-            )
-        else:
-            self.odmr_plot_y = np.mean(
-                self.odmr_raw_data[:max(1, min(self.lines_to_average, self.elapsed_sweeps)), :, :],
-                axis=0,
-                dtype=np.float64
-            )
+        # During a running measurement the window sum is updated with the next sweep
+        if self.module_state() != 'locked':
+            self._odmr_window_sum = self._sum_odmr_window()
+            self._odmr_window_length = self.lines_to_average
+            self.odmr_plot_y = self._get_odmr_mean()
 
         self.sigOdmrPlotsUpdated.emit(self.odmr_plot_x, self.odmr_plot_y, self.odmr_plot_xy)
         self.sigParameterUpdated.emit({'average_length': self.lines_to_average})
@@ -611,11 +704,7 @@ class ODMRLogic(GenericLogic):
                 estimated_number_of_lines = self.number_of_lines
             self.log.debug('Estimated number of raw data lines: {0:d}'
                            ''.format(estimated_number_of_lines))
-            self.odmr_raw_data = np.zeros(
-                [estimated_number_of_lines,
-                 len(self._odmr_counter.get_odmr_channels()),
-                 self.odmr_plot_x.size]
-            )
+            self._initialize_odmr_raw_data(estimated_number_of_lines)
             self.sigNextLine.emit()
             return 0
 
@@ -700,56 +789,51 @@ class ODMRLogic(GenericLogic):
             # reset position so every line starts from the same frequency
             self.reset_sweep()
 
-            # Acquire count data
-            error, new_counts = self._odmr_counter.count_odmr(length=self.odmr_plot_x.size)
+            # Acquire count data (one or several sweeps)
+            number_of_lines = self._get_sweeps_per_readout()
+            if number_of_lines > 1:
+                error, new_counts = self._odmr_counter.count_odmr_lines(
+                    length=self.odmr_plot_x.size, lines=number_of_lines)
+            else:
+                error, new_counts = self._odmr_counter.count_odmr(length=self.odmr_plot_x.size)
+                new_counts = new_counts[np.newaxis]
 
             if error:
                 self.stopRequested = True
                 self.sigNextLine.emit()
                 return
 
-            # Add new count data to raw_data array and append if array is too small
+            # Reset running sums. Old sweeps in the buffer are overwritten by the new ones.
             if self._clearOdmrData:
-                self.odmr_raw_data[:, :, :] = 0
+                self._odmr_sum[:, :] = 0
+                self._odmr_window_sum[:, :] = 0
                 self._clearOdmrData = False
-            if self.elapsed_sweeps == (self.odmr_raw_data.shape[0] - 1):
-                expanded_array = np.zeros(self.odmr_raw_data.shape)
-                self.odmr_raw_data = np.concatenate((self.odmr_raw_data, expanded_array), axis=0)
+            # Add new count data to raw_data array and expand if array is too small
+            line_index = self._odmr_raw_offset + self.elapsed_sweeps
+            while line_index + number_of_lines > self._odmr_raw_buffer.shape[0]:
+                old_shape = self._odmr_raw_buffer.shape
+                self._odmr_raw_buffer = np.concatenate(
+                    (self._odmr_raw_buffer, np.zeros(self._odmr_raw_buffer.shape)), axis=0)
                 self.log.warning('raw data array in ODMRLogic was not big enough for the entire '
                                  'measurement. Array will be expanded.\nOld array shape was '
                                  '({0:d}, {1:d}), new shape is ({2:d}, {3:d}).'
-                                 ''.format(self.odmr_raw_data.shape[0] - self.number_of_lines,
-                                           self.odmr_raw_data.shape[1],
-                                           self.odmr_raw_data.shape[0],
-                                           self.odmr_raw_data.shape[1]))
-
-            # shift data in the array "up" and add new data at the "bottom"
-            self.odmr_raw_data = np.roll(self.odmr_raw_data, 1, axis=0)
-
-            self.odmr_raw_data[0] = new_counts
+                                 ''.format(old_shape[0] - self._odmr_raw_offset,
+                                           old_shape[1],
+                                           self._odmr_raw_buffer.shape[0] - self._odmr_raw_offset,
+                                           self._odmr_raw_buffer.shape[1]))
+            self._odmr_raw_buffer[line_index:line_index + number_of_lines] = new_counts
 
-            # Add new count data to mean signal
-            if self._clearOdmrData:
-                self.odmr_plot_y[:, :] = 0
-
-            if self.lines_to_average <= 0:
-                self.odmr_plot_y = np.mean(
-                    self.odmr_raw_data[:max(1, self.elapsed_sweeps), :, :],
-                    axis=0,
-                    dtype=np.float64
-                )
-            else:
-                self.odmr_plot_y = np.mean(
-                    self.odmr_raw_data[:max(1, min(self.lines_to_average, self.elapsed_sweeps)), :, :],
-                    axis=0,
-                    dtype=np.float64
-                )
+            # Update elapsed time/sweeps
+            self.elapsed_sweeps += number_of_lines
 
-            # Set plot slice of matrix
-            self.odmr_plot_xy = self.odmr_raw_data[:self.number_of_lines, :, :]
+            # Update the running sums of all sweeps and of the last lines_to_average sweeps
+            self._odmr_sum += np.sum(
+                self._odmr_raw_buffer[line_index:line_index + number_of_lines], axis=0)
+            self._update_odmr_window_sum(number_of_lines)
 
-            # Update elapsed time/sweeps
-            self.elapsed_sweeps += 1
+            # Calculate mean signal and set plot slice of matrix
+            self.odmr_plot_y = self._get_odmr_mean()
+            self.odmr_plot_xy = self._get_odmr_matrix()
             self.elapsed_time = time.time() - self._startTime
             if self.elapsed_time >= self.run_time:
                 self.stopRequested = True
@@ -26,12 +26,14 @@ import numpy as np
 import time
 
 from collections import OrderedDict
+from scipy.spatial import cKDTree
 from core.connector import Connector
 from core.statusvariable import StatusVar
 from datetime import datetime
 from logic.generic_logic import GenericLogic
 from qtpy import QtCore
 from core.util.mutex import Mutex
+from core.util.filters import find_spots
 
 
 class RegionOfInterest:
@@ -42,6 +44,7 @@ class RegionOfInterest:
     The origin af a new ROI is always defined as (0,0,0) initially.
     Sample shifts will cause this origin to move to a different coordinate.
     The anchors of each individual POI is given relative to the initial ROI origin (even if added later).
+    The POI anchors are stored in a single array and indexed with a KD-tree for spatial queries.
     """
 
     def __init__(self, name=None, creation_time=None, history=None, scan_image=None,
@@ -60,8 +63,14 @@ class RegionOfInterest:
         # Nametag for POIs. If you add a POI without explicitly setting a name, the name will be
         # generated by using the nametag and appending it with consecutive integer numbers.
         self._poi_tag = None
-        # dictionary of POIs contained in this ROI with keys being the name
-        self._pois = dict()
+        # Names of the POIs contained in this ROI, the anchors are stored in the same order
+        self._poi_names = list()
+        # Mapping of POI names to their index in the anchor array
+        self._poi_index = dict()
+        # POI anchors (x,y,z) as float[n][3] array
+        self._poi_anchors = np.empty((0, 3), dtype=float)
+        # KD-tree of the (x, y) anchors, created on demand
+        self._poi_tree = None
 
         self.creation_time = creation_time
         self.name = name
@@ -69,8 +78,8 @@ class RegionOfInterest:
         self.pos_history = history
         self.set_scan_image(scan_image, scan_image_extent)
         if poi_list is not None:
-            for poi in poi_list:
-                self.add_poi(poi)
+            self.add_pois([poi.position for poi in poi_list], [poi.name for poi in poi_list],
+                          relative=True)
         return
 
     @property
@@ -151,82 +160,223 @@ class RegionOfInterest:
 
     @property
     def poi_names(self):
-        return list(self._pois)
+        return list(self._poi_names)
 
     @property
     def poi_positions(self):
-        origin = self.origin
-        return {name: poi.position + origin for name, poi in self._pois.items()}
+        return dict(zip(self._poi_names, self.poi_position_array))
 
     @property
     def poi_anchors(self):
-        return {name: poi.position for name, poi in self._pois.items()}
+        return dict(zip(self._poi_names, self._poi_anchors.copy()))
 
-    def get_poi_position(self, name):
+    @property
+    def poi_position_array(self):
+        """ float[n][3] array of all POI positions in the order of poi_names. """
+        return self._poi_anchors + self.origin
+
+    def _get_poi_index(self, name):
         if not isinstance(name, str):
             raise TypeError('POI name must be of type str.')
-        if name not in self._pois:
+        if name not in self._poi_index:
             raise KeyError('No POI with name "{0}" found in POI list.'.format(name))
-        return self._pois[name].position + self.origin
+        return self._poi_index[name]
+
+    def _poi_anchors_changed(self):
+        self._poi_index = {name: index for index, name in enumerate(self._poi_names)}
+        self._poi_tree = None
+        return
+
+    @property
+    def poi_tree(self):
+        """ KD-tree of the (x, y) anchors of all POIs. Indices refer to the order of poi_names. """
+        if self._poi_tree is None:
+            self._poi_tree = cKDTree(self._poi_anchors[:, :2])
+        return self._poi_tree
+
+    def get_poi_position(self, name):
+        return self._poi_anchors[self._get_poi_index(name)] + self.origin
 
     def get_poi_anchor(self, name):
-        if not isinstance(name, str):
-            raise TypeError('POI name must be of type str.')
-        if name not in self._pois:
-            raise KeyError('No POI with name "{0}" found in POI list.'.format(name))
-        return self._pois[name].position
+        return self._poi_anchors[self._get_poi_index(name)].copy()
 
     def set_poi_position(self, name, new_pos):
-        if name not in self._pois:
+        if name not in self._poi_index:
             raise KeyError('POI with name "{0}" not found in ROI "{1}".\n'
                            'Unable to change POI position.'.format(name, self.name))
-        self._pois[name].position = np.array(new_pos, dtype=float) - self.origin
+        self.set_poi_anchor(name, np.array(new_pos, dtype=float) - self.origin)
         return
 
     def set_poi_anchor(self, name, new_pos):
-        if name not in self._pois:
+        if name not in self._poi_index:
             raise KeyError('POI with name "{0}" not found in ROI "{1}".\n'
                            'Unable to change POI position.'.format(name, self.name))
-        self._pois[name].position = new_pos
+        if len(new_pos) != 3:
+            raise ValueError('POI position to set must be iterable of length 3 (X, Y, Z).')
+        self._poi_anchors[self._poi_index[name]] = new_pos
+        self._poi_tree = None
         return
 
     def rename_poi(self, name, new_name=None):
         if new_name is not None and not isinstance(new_name, str):
             raise TypeError('POI name to set must be of type str or None.')
-        if name not in self._pois:
+        if name not in self._poi_index:
             raise KeyError('Name "{0}" not found in POI list.'.format(name))
-        if new_name in self._pois:
+        if new_name in self._poi_index:
             raise NameError('New POI name "{0}" already present in current POI list.')
-        self._pois[name].name = new_name
-        self._pois[new_name] = self._pois.pop(name)
+        if not new_name:
+            new_name = self._generic_poi_names(1)[0]
+        index = self._poi_index.pop(name)
+        self._poi_names[index] = new_name
+        self._poi_index[new_name] = index
         return
 
+    def _generic_poi_names(self, count):
+        """ Create unambiguous names for new POIs.
+
+        Names are generated from the poi_nametag appended with consecutive integer numbers if a
+        nametag is set. Otherwise they are generated from the current time.
+        """
+        names = list()
+        if self._poi_tag is not None:
+            tag_index = len(self._poi_names)
+            while len(names) < count:
+                tag_index += 1
+                name = '{0}{1:d}'.format(self._poi_tag, tag_index)
+                if name not in self._poi_index:
+                    names.append(name)
+        else:
+            timestamp = datetime.now().strftime('poi_%Y%m%d%H%M%S%f')
+            suffix = 0
+            while len(names) < count:
+                name = timestamp if suffix == 0 else '{0}_{1:d}'.format(timestamp, suffix)
+                suffix += 1
+                if name not in self._poi_index:
+                    names.append(name)
+        return names
+
     def add_poi(self, position, name=None):
+        """
+        Add a single POI to the ROI.
+
+        @param float[3]|PointOfInterest position: absolute POI position or POI instance
+        @param str name: optional, name of the POI. None creates a generic name.
+
+        @return str: the name of the added POI
+        """
         if isinstance(position, PointOfInterest):
-            poi_inst = position
-        else:
-            position = position - self.origin
-            # Create a generic name from the poi_nametag if it is set and no name is given.
-            if name is None and self._poi_tag is not None:
-                tag_index = len(self._pois)
-                while True:
-                    tag_index += 1
-                    name = '{0}{1:d}'.format(self._poi_tag, tag_index)
-                    if name not in self._pois:
-                        break
-            poi_inst = PointOfInterest(position=position, name=name)
-        if poi_inst.name in self._pois:
-            raise ValueError('POI with name "{0}" already present in ROI "{1}".\n'
-                             'Could not add POI to ROI'.format(poi_inst.name, self.name))
-        self._pois[poi_inst.name] = poi_inst
-        return
+            return self.add_pois([position.position], [position.name], relative=True)[0]
+        return self.add_pois([position], None if name is None else [name])[0]
+
+    def add_pois(self, positions, names=None, relative=False, min_distance=0):
+        """
+        Add several POIs to the ROI at once.
+
+        @param float[n][3] positions: (x, y, z) positions of the POIs
+        @param str[n] names: optional, names of the POIs. Empty names get generic names.
+        @param bool relative: If True, the positions are anchors (relative to the initial ROI
+                              origin), otherwise absolute positions.
+        @param float min_distance: POIs closer than this (x, y) distance to an existing POI or to
+                                   another new POI are skipped.
+
+        @return list: names of the added POIs
+        """
+        positions = np.array(positions, dtype=float).reshape((-1, 3))
+        if not relative:
+            positions -= self.origin
+        if names is None:
+            names = [None] * len(positions)
+        names = list(names)
+        if len(names) != len(positions):
+            raise ValueError('Number of POI names and positions must be equal.')
+
+        if min_distance > 0 and len(positions) > 0:
+            keep = np.ones(len(positions), dtype=bool)
+            if self._poi_names:
+                distances, _ = self.poi_tree.query(positions[:, :2],
+                                                   distance_upper_bound=min_distance)
+                keep &= ~np.isfinite(distances)
+            # Of several new POIs close to each other only the first one is kept
+            for first, second in sorted(cKDTree(positions[:, :2]).query_pairs(min_distance)):
+                if keep[first]:
+                    keep[second] = False
+            positions = positions[keep]
+            names = [name for name, keep_poi in zip(names, keep) if keep_poi]
+
+        generic_names = iter(self._generic_poi_names(sum(not name for name in names)))
+        names = [next(generic_names) if not name else str(name) for name in names]
+        if len(set(names)) != len(names):
+            raise ValueError('POI names to add must be unique.')
+        for name in names:
+            if name in self._poi_index:
+                raise ValueError('POI with name "{0}" already present in ROI "{1}".\n'
+                                 'Could not add POI to ROI'.format(name, self.name))
+
+        self._poi_names.extend(names)
+        self._poi_anchors = np.concatenate((self._poi_anchors, positions))
+        self._poi_anchors_changed()
+        return names
 
     def delete_poi(self, name):
         if not isinstance(name, str):
             raise TypeError('POI name to delete must be of type str.')
-        if name not in self._pois:
-            raise KeyError('Name "{0}" not found in POI list.'.format(name))
-        del self._pois[name]
+        self.delete_pois([name])
+        return
+
+    def delete_pois(self, names):
+        """
+        Delete several POIs from the ROI at once.
+
+        @param str[] names: names of the POIs to delete
+        """
+        indices = [self._get_poi_index(name) for name in names]
+        keep = np.ones(len(self._poi_names), dtype=bool)
+        keep[indices] = False
+        self._poi_names = [name for name, keep_poi in zip(self._poi_names, keep) if keep_poi]
+        self._poi_anchors = self._poi_anchors[keep]
+        self._poi_anchors_changed()
+        return
+
+    def get_nearest_poi(self, position, max_distance=np.inf):
+        """
+        Find the POI closest to a position in the (x, y) plane.
+
+        @param float[2|3] position: absolute position, only x and y are considered
+        @param float max_distance: optional, maximum distance of the POI
+
+        @return str: name of the nearest POI or None if there is no POI within max_distance
+        """
+        if not self._poi_names:
+            return None
+        distance, index = self.poi_tree.query(
+            np.asarray(position[:2], dtype=float) - self.origin[:2],
+            distance_upper_bound=max_distance)
+        return self._poi_names[index] if np.isfinite(distance) else None
+
+    def get_pois_in_rectangle(self, x_range, y_range):
+        """
+        Find all POIs within a rectangle in the (x, y) plane.
+
+        @param float[2] x_range: absolute (min, max) x coordinates of the rectangle
+        @param float[2] y_range: absolute (min, max) y coordinates of the rectangle
+
+        @return list: names of the POIs inside the rectangle
+        """
+        positions = self.poi_position_array
+        inside = (positions[:, 0] >= min(x_range)) & (positions[:, 0] <= max(x_range)) & \
+                 (positions[:, 1] >= min(y_range)) & (positions[:, 1] <= max(y_range))
+        return [self._poi_names[index] for index in np.flatnonzero(inside)]
+
+    def transform_pois(self, transform_matrix):
+        """
+        Apply a linear transformation to the absolute positions of all POIs.
+
+        @param float[3][3] transform_matrix: matrix transforming (x, y, z) column vectors
+        """
+        origin = self.origin
+        positions = self._poi_anchors + origin
+        self._poi_anchors = positions.dot(np.asarray(transform_matrix, dtype=float).T) - origin
+        self._poi_tree = None
         return
 
     def set_scan_image(self, image_arr, image_extent):
@@ -280,7 +430,8 @@ class RegionOfInterest:
                 'pos_history': self.pos_history,
                 'scan_image': self.scan_image,
                 'scan_image_extent': self.scan_image_extent,
-                'pois': [poi.to_dict() for poi in self._pois.values()]}
+                'pois': [{'name': name, 'position': tuple(anchor)}
+                         for name, anchor in zip(self._poi_names, self._poi_anchors)]}
 
     @classmethod
     def from_dict(cls, dict_repr):
@@ -586,13 +737,8 @@ class PoiManagerLogic(GenericLogic):
         if position is None:
             position = self.scanner_position
 
-        current_poi_set = set(self.poi_names)
-
         # Add POI to current ROI
-        self._roi.add_poi(position=position, name=name)
-
-        # Get newly added POI name from comparing POI names before and after addition of new POI
-        poi_name = set(self.poi_names).difference(current_poi_set).pop()
+        poi_name = self._roi.add_poi(position=position, name=name)
 
         # Notify about a changed set of POIs if necessary
         if emit_change:
@@ -602,6 +748,33 @@ class PoiManagerLogic(GenericLogic):
         self.set_active_poi(poi_name)
         return
 
+    @QtCore.Slot(np.ndarray)
+    def add_pois(self, positions, names=None, min_distance=0, emit_change=True):
+        """
+        Creates several new POIs at once and adds them to the current ROI.
+        The changed set of POIs is signaled only once.
+
+        @param scalar[n][3] positions: Array of the (x, y, z) positions of the new POIs.
+        @param str[n] names: Optional names for the POIs (must be unique within ROI).
+                             None (default) will create generic names.
+        @param float min_distance: POIs closer than this distance to an existing POI or to
+                                   another new POI are not added. 0 (default) adds all POIs.
+        @param bool emit_change: Flag indicating if the changed POI set should be signaled.
+
+        @return list: Names of the added POIs
+        """
+        poi_names = self._roi.add_pois(positions=positions, names=names,
+                                       min_distance=min_distance)
+
+        # Notify about a changed set of POIs if necessary
+        if emit_change:
+            self.sigRoiUpdated.emit({'pois': self.poi_positions})
+
+        # Set last created POI as active poi
+        if poi_names:
+            self.set_active_poi(poi_names[-1])
+        return poi_names
+
     @QtCore.Slot()
     def delete_poi(self, name=None):
         """
@@ -632,14 +805,47 @@ class PoiManagerLogic(GenericLogic):
         self.sigPoiUpdated.emit(name, '', np.zeros(3))
         return
 
+    def delete_pois(self, names):
+        """
+        Deletes several POIs from the ROI at once. The changed set of POIs is signaled only once.
+
+        @param str[] names: Names of the POIs to delete.
+        """
+        names = list(names)
+        if self.active_poi in names:
+            self.set_active_poi(None)
+        self._roi.delete_pois(names)
+        self.sigRoiUpdated.emit({'pois': self.poi_positions})
+        return
+
     @QtCore.Slot()
     def delete_all_pois(self):
-        self.active_poi = None
-        for name in self.poi_names:
-            self._roi.delete_poi(name)
-            self.sigPoiUpdated.emit(name, '', np.zeros(3))
+        self.delete_pois(self.poi_names)
         return
 
+    def get_nearest_poi(self, position=None, max_distance=np.inf):
+        """
+        Returns the name of the POI closest to the given position in the xy plane.
+
+        @param float[3] position: Position to search from. None (default) uses the current
+                                  scanner position.
+        @param float max_distance: Optional maximum distance of the POI to the position.
+        @return str: Name of the nearest POI or None if no POI is found.
+        """
+        if position is None:
+            position = self.scanner_position
+        return self._roi.get_nearest_poi(position, max_distance)
+
+    def get_pois_in_rectangle(self, x_range, y_range):
+        """
+        Returns the names of all POIs within the given rectangle in the xy plane.
+
+        @param float[2] x_range: (min, max) x coordinates of the rectangle
+        @param float[2] y_range: (min, max) y coordinates of the rectangle
+        @return list: Names of the POIs inside the rectangle
+        """
+        return self._roi.get_pois_in_rectangle(x_range, y_range)
+
     @QtCore.Slot(str)
     @QtCore.Slot(str, str)
     def rename_poi(self, new_name, name=None):
@@ -1173,11 +1379,17 @@ class PoiManagerLogic(GenericLogic):
         return roi.to_dict()
 
     def transform_roi(self, transform_matrix):
-        # TODO: Implement this
+        """
+        Applies a linear transformation to the positions of all POIs in the ROI.
+
+        @param numpy.ndarray transform_matrix: float[3][3] matrix transforming (x, y, z) positions
+        """
+        transform_matrix = np.asarray(transform_matrix, dtype=float)
         if transform_matrix.shape != (3, 3):
             self.log.error('Tranformation matrix must be numpy array of shape (3, 3).')
             return
-        self.log.error('Tranformation of all POI positions not implemented yet.')
+        self._roi.transform_pois(transform_matrix)
+        self.sigRoiUpdated.emit({'pois': self.poi_positions})
         return
 
     def _spot_filter(self, scan):
@@ -1188,71 +1400,22 @@ class PoiManagerLogic(GenericLogic):
         arr_size = int(spot_size / pixel_size)
         return arr_size
 
-    def _is_spot_shape(self, local_arr):
-        unspot_e = 0
-        ensem_e = 0
-        len_arr = len(local_arr)
-        mid_f = int(0.5 * len_arr)
-        hm_local_arr = local_arr[mid_f].mean()
-        vm_local_arr = local_arr[:, mid_f].mean()
-        for i in range(0, len_arr):
-            if local_arr[i].mean() > hm_local_arr:
-                ensem_e += 1
-            if local_arr[:, i].mean() > vm_local_arr:
-                ensem_e += 1
-            if hm_local_arr > vm_local_arr * 1.2:
-                unspot_e += 1
-            if vm_local_arr > hm_local_arr * 1.2:
-                unspot_e += 1
-        if ensem_e > 4:
-            return False
-        elif unspot_e > 1:
-            return False
-        else:
-            return True
-
-    def _local_max(self, scan):
-        scan = np.asarray(scan, order="C")  # scan has to be a 2-D array
-        filter_size = self._spot_filter(scan)
-        scan_m = scan.mean()
-        mid_f = int(filter_size / 2)
-        xc = []
-        yc = []
-        for i in range(0, len(scan) - filter_size):
-            for j in range(0, len(scan[i]) - filter_size):
-                local_arr = scan[i:i + filter_size, j:j + filter_size]
-                local_arr = np.asarray(local_arr)
-                arr_threshold = scan_m * self._poi_threshold * 0.5
-                if scan[i + mid_f][j + mid_f] == local_arr.max() and self._is_spot_shape(local_arr) and local_arr.mean() > arr_threshold:
-                    xc.append(i + mid_f)
-                    yc.append(j + mid_f)
-        return xc, yc
-
     def auto_catch_poi(self):
-        scan_image = self.roi_scan_image.T
+        """
+        Detects bright spots in the ROI scan image and adds a POI for each of them.
+        """
+        scan_image = np.asarray(self.roi_scan_image, dtype=float).T
         x_range = self.roi_scan_image_extent[0]
         y_range = self.roi_scan_image_extent[1]
-        x_axis = np.arange(x_range[0], x_range[1], (x_range[1] - x_range[0]) / len(scan_image))
-        y_axis = np.arange(y_range[0], y_range[1], (y_range[1] - y_range[0]) / len(scan_image[0]))
-
-        for i in range(0, len(scan_image)):
-            for j in range(0, len(scan_image[i])):
-                scan_image[i][j] = int(scan_image[i][j])  # data here somehow needs to be reset, otherwise shit happens.
+        x_step = (x_range[1] - x_range[0]) / scan_image.shape[0]
+        y_step = (y_range[1] - y_range[0]) / scan_image.shape[1]
 
         threshold = scan_image.mean() * self._poi_threshold
 
-        xc1, yc1 = self._local_max(scan_image)
-        xc2 = []
-        yc2 = []
-        for i in range(0, len(xc1)):
-            if scan_image[xc1[i], yc1[i]] > threshold:
-                xc2.append(xc1[i])
-                yc2.append(yc1[i])
-
-        pois = np.zeros((len(xc2), 3))
-        z = self.scanner_position[2]
-        for i in range(0, len(pois)):
-            pois[i] = [x_axis[xc2[i]], y_axis[yc2[i]], z]
-            self.add_poi(pois[i])
-            if self.poi_nametag is None:
-                time.sleep(0.1)
\ No newline at end of file
+        spots = find_spots(scan_image, self._spot_filter(scan_image), threshold)
+
+        pois = np.zeros((len(spots), 3))
+        pois[:, 0] = x_range[0] + spots[:, 0] * x_step
+        pois[:, 1] = y_range[0] + spots[:, 1] * y_step
+        pois[:, 2] = self.scanner_position[2]
+        self.add_pois(pois, min_distance=self.poi_diameter)
\ No newline at end of file
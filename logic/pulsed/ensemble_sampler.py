@@ -0,0 +1,659 @@
+# -*- coding: utf-8 -*-
+"""
+This file contains the Qudi helper class for the vectorized sampling of PulseBlockEnsembles.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import queue
+import threading
+import numpy as np
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+
+class EnsembleSampler:
+    """
+    Block-level sampling engine for PulseBlockEnsembles.
+
+    Instead of walking through every block repetition and PulseBlockElement in the interpreter,
+    all elements (incl. repetitions) are flattened once into numpy arrays. All elements of a chunk
+    sharing the same sampling function (type and parameters) on a channel are then sampled with a
+    single call to get_samples. If the ensemble is not sampled in the rotating frame, every element
+    starts at the same time offset and the samples of a function are only calculated once for the
+    longest element and re-used for all others.
+
+    The resulting samples are identical to sampling each element on its own. Sampling functions
+    that do not declare themselves as elementwise (see SamplingBase.is_elementwise) are sampled
+    element by element.
+
+    Optionally (use_lookup_tables=True) all sampling functions that can be decomposed into a sum of
+    sines (see SamplingBase.get_sine_components) are not evaluated sample by sample if the ensemble
+    is sampled in the rotating frame. Instead the sine and cosine of each frequency are calculated
+    once for lookup_table_length samples and the samples of each piece are obtained via the angle
+    addition theorem from the phase at the start of the piece (longer pieces are split into
+    segments of lookup_table_length samples, each with its own start phase). The result agrees
+    with get_samples to within floating point precision but is not bit-identical.
+    """
+    # Pieces of elements with at least this number of samples are sampled on their own instead of
+    # being batched together with other pieces.
+    batch_length_threshold = 1024
+    # Chunks containing less than this number of (partial) elements are sampled element by element
+    batch_min_pieces = 8
+    # Number of samples in each sine/cosine lookup table (must be >= batch_length_threshold) and
+    # maximum number of frequencies to keep lookup tables for (16 bytes per sample and frequency)
+    lookup_table_length = 4096
+    max_lookup_tables = 64
+
+    def __init__(self, block_list, elements_length_bins, analog_amplitudes, sample_rate,
+                 rotating_frame=True, offset_bin=0, use_lookup_tables=False):
+        """
+        @param list block_list: list of tuples (element_list, repetitions) for each block in the
+                                ensemble with element_list being the list of PulseBlockElement
+                                instances of the block.
+        @param numpy.ndarray elements_length_bins: length in bins of each element (incl.
+                                                   repetitions) as returned by
+                                                   SequenceGeneratorLogic.analyze_block_ensemble
+        @param dict analog_amplitudes: peak-to-peak amplitudes (values) of the analog channels (keys)
+        @param float sample_rate: sample rate in samples/s
+        @param bool rotating_frame: flag indicating if the time offset is incremented with each
+                                    sample (True) or kept at offset_bin for each element (False)
+        @param int offset_bin: time offset in bins to start sampling at
+        @param bool use_lookup_tables: flag indicating if sampling functions decomposable into a
+                                       sum of sines should be sampled using lookup tables
+        """
+        self.sample_rate = sample_rate
+        self.rotating_frame = bool(rotating_frame)
+        self.start_offset_bin = offset_bin
+        self.use_lookup_tables = bool(use_lookup_tables)
+
+        self.elements_length_bins = np.asarray(elements_length_bins, dtype='int64')
+        self.elements_end_bins = np.cumsum(self.elements_length_bins)
+        self.elements_start_bins = self.elements_end_bins - self.elements_length_bins
+        self.number_of_samples = int(self.elements_end_bins[-1]) if len(
+            self.elements_end_bins) > 0 else 0
+
+        self._analog_norm = {chnl: amp / 2 for chnl, amp in analog_amplitudes.items()}
+
+        # Unique sampling functions per analog channel and the index of the function used by each
+        # element (incl. repetitions) in chronological order.
+        self._functions = dict()
+        self._function_indices = dict()
+        # Boolean state of each element (incl. repetitions) for each digital channel
+        self._digital_states = dict()
+        # Sine decomposition (or None) of each unique sampling function per analog channel
+        self._sine_components = dict()
+        # Sine and cosine lookup tables (values) for each frequency (keys)
+        self._lookup_tables = dict()
+
+        function_index_lists = dict()
+        digital_state_lists = dict()
+        function_keys = dict()
+        for element_list, reps in block_list:
+            if len(element_list) == 0:
+                continue
+            for chnl in element_list[0].pulse_function:
+                if chnl not in self._functions:
+                    self._functions[chnl] = list()
+                    function_keys[chnl] = dict()
+                    function_index_lists[chnl] = list()
+            for chnl in element_list[0].digital_high:
+                if chnl not in digital_state_lists:
+                    digital_state_lists[chnl] = list()
+
+            for chnl, index_list in function_index_lists.items():
+                block_indices = np.empty(len(element_list), dtype='int64')
+                for ii, element in enumerate(element_list):
+                    func = element.pulse_function[chnl]
+                    key = (type(func).__name__,) + tuple(getattr(func, p) for p in func.params)
+                    if key not in function_keys[chnl]:
+                        function_keys[chnl][key] = len(self._functions[chnl])
+                        self._functions[chnl].append(func)
+                    block_indices[ii] = function_keys[chnl][key]
+                index_list.append(np.tile(block_indices, reps + 1))
+            for chnl, state_list in digital_state_lists.items():
+                block_states = np.array([el.digital_high[chnl] for el in element_list], dtype=bool)
+                state_list.append(np.tile(block_states, reps + 1))
+
+        for chnl, index_list in function_index_lists.items():
+            self._function_indices[chnl] = np.concatenate(index_list)
+        for chnl, func_list in self._functions.items():
+            # Without rotating frame the samples of each function are only calculated once anyway
+            if self.use_lookup_tables and self.rotating_frame:
+                self._sine_components[chnl] = [func.get_sine_components() for func in func_list]
+            else:
+                self._sine_components[chnl] = [None] * len(func_list)
+        for chnl, state_list in digital_state_lists.items():
+            self._digital_states[chnl] = np.concatenate(state_list)
+        return
+
+    @property
+    def end_offset_bin(self):
+        """
+        The time offset in bins after the last sample (to be passed on to the next ensemble in
+        order to preserve the rotating frame).
+        """
+        if self.rotating_frame:
+            return self.start_offset_bin + self.number_of_samples
+        return self.start_offset_bin
+
+    def iterate_chunks(self, chunk_length, analog_channels, digital_channels, prefetch=True):
+        """
+        Generator sampling the entire ensemble chunk by chunk. Yields tuples of
+        (start_bin, analog_samples, digital_samples) with the sample dicts as accepted by
+        PulserInterface.write_waveform.
+
+        The sample buffers are allocated once and re-used for every chunk (the last chunk is a
+        view of the first samples). Hence the yielded arrays are only valid until the next
+        iteration step.
+        If prefetch is True, two buffer sets are used and the next chunk is sampled in a background
+        thread while the caller processes the current chunk (e.g. uploads it to the device).
+
+        @param int chunk_length: maximum number of samples per chunk
+        @param iterable analog_channels: analog channel descriptors to sample
+        @param iterable digital_channels: digital channel descriptors to sample
+        @param bool prefetch: flag indicating if the next chunk should be sampled in advance
+        """
+        if self.number_of_samples == 0:
+            return
+        chunk_length = min(chunk_length, self.number_of_samples)
+        chunk_starts = range(0, self.number_of_samples, chunk_length)
+        number_of_buffers = 2 if prefetch and len(chunk_starts) > 1 else 1
+        buffers = list()
+        for ii in range(number_of_buffers):
+            buffers.append(({chnl: np.empty(chunk_length, dtype='float32') for chnl in analog_channels},
+                            {chnl: np.empty(chunk_length, dtype=bool) for chnl in digital_channels}))
+
+        def get_chunk(buffer_index, start_bin):
+            length = min(chunk_length, self.number_of_samples - start_bin)
+            analog_buffer, digital_buffer = buffers[buffer_index]
+            analog_samples = {chnl: arr[:length] for chnl, arr in analog_buffer.items()}
+            digital_samples = {chnl: arr[:length] for chnl, arr in digital_buffer.items()}
+            self.sample_chunk(start_bin, analog_samples, digital_samples)
+            return start_bin, analog_samples, digital_samples
+
+        if number_of_buffers == 1:
+            for start_bin in chunk_starts:
+                yield get_chunk(0, start_bin)
+            return
+
+        free_buffers = queue.Queue()
+        filled_buffers = queue.Queue()
+        abort_event = threading.Event()
+        for ii in range(number_of_buffers):
+            free_buffers.put(ii)
+
+        def produce():
+            try:
+                for start_bin in chunk_starts:
+                    buffer_index = free_buffers.get()
+                    if abort_event.is_set():
+                        return
+                    filled_buffers.put((buffer_index, get_chunk(buffer_index, start_bin)))
+            except BaseException as err:
+                filled_buffers.put((None, err))
+            return
+
+        producer = threading.Thread(target=produce, name='EnsembleSamplerProducer', daemon=True)
+        producer.start()
+        try:
+            for ii in range(len(chunk_starts)):
+                buffer_index, chunk = filled_buffers.get()
+                if buffer_index is None:
+                    # Re-raise exceptions from the producer thread in the calling thread
+                    raise chunk
+                yield chunk
+                free_buffers.put(buffer_index)
+        finally:
+            abort_event.set()
+            free_buffers.put(None)
+            producer.join()
+        return
+
+    def sample_chunk(self, start_bin, analog_samples, digital_samples):
+        """
+        Samples all analog and digital channels starting at sample index start_bin into the
+        provided (preallocated) sample arrays. The number of samples calculated is given by the
+        length of the sample arrays.
+
+        @param int start_bin: index of the first sample to calculate within the ensemble
+        @param dict analog_samples: float32 arrays to fill for each analog channel (keys)
+        @param dict digital_samples: bool arrays to fill for each digital channel (keys)
+        """
+        if analog_samples:
+            chunk_length = len(next(iter(analog_samples.values())))
+        elif digital_samples:
+            chunk_length = len(next(iter(digital_samples.values())))
+        else:
+            return
+        stop_bin = start_bin + chunk_length
+
+        # Determine all elements (partially) contained in this chunk and clip them to the chunk
+        first = np.searchsorted(self.elements_end_bins, start_bin, side='right')
+        last = np.searchsorted(self.elements_start_bins, stop_bin, side='left')
+        piece_start = np.maximum(self.elements_start_bins[first:last], start_bin)
+        piece_length = np.minimum(self.elements_end_bins[first:last], stop_bin) - piece_start
+        # Position of each piece within the chunk arrays
+        piece_position = piece_start - start_bin
+        # Time offset (in bins) of the first sample of each piece
+        if self.rotating_frame:
+            piece_offset = piece_start + self.start_offset_bin
+        else:
+            piece_offset = np.full(len(piece_start), self.start_offset_bin, dtype='int64')
+
+        for chnl, samples in digital_samples.items():
+            samples[:] = np.repeat(self._digital_states[chnl][first:last], piece_length)
+
+        for chnl, samples in analog_samples.items():
+            norm = self._analog_norm[chnl]
+            chunk_indices = self._function_indices[chnl][first:last]
+            if len(chunk_indices) < self.batch_min_pieces:
+                # Only a few elements in this chunk. Batching does not pay off here.
+                for func_index, pos, offset, length in zip(chunk_indices, piece_position,
+                                                           piece_offset, piece_length):
+                    components = self._sine_components[chnl][func_index]
+                    if components is not None:
+                        self._sample_sine_batch(components=components,
+                                                norm=norm,
+                                                samples=samples,
+                                                positions=np.array([pos]),
+                                                offsets=np.array([offset]),
+                                                lengths=np.array([length]))
+                        continue
+                    self._sample_piece(func=self._functions[chnl][func_index],
+                                       norm=norm,
+                                       samples=samples,
+                                       position=pos,
+                                       offset=offset,
+                                       length=length)
+                continue
+
+            for func_index in np.unique(chunk_indices):
+                func = self._functions[chnl][func_index]
+                mask = chunk_indices == func_index
+                components = self._sine_components[chnl][func_index]
+                if components is not None:
+                    self._sample_sine_batch(components=components,
+                                            norm=norm,
+                                            samples=samples,
+                                            positions=piece_position[mask],
+                                            offsets=piece_offset[mask],
+                                            lengths=piece_length[mask])
+                elif func.is_elementwise:
+                    self._sample_function_batch(func=func,
+                                                norm=norm,
+                                                samples=samples,
+                                                positions=piece_position[mask],
+                                                offsets=piece_offset[mask],
+                                                lengths=piece_length[mask])
+                else:
+                    for pos, offset, length in zip(piece_position[mask],
+                                                   piece_offset[mask],
+                                                   piece_length[mask]):
+                        self._sample_piece(func=func,
+                                           norm=norm,
+                                           samples=samples,
+                                           position=pos,
+                                           offset=offset,
+                                           length=length)
+        return
+
+    def _sample_piece(self, func, norm, samples, position, offset, length):
+        """
+        Samples a single (part of an) element into the samples array.
+        """
+        if length == 0:
+            return
+        time_arr = (offset + np.arange(length, dtype='float64')) / self.sample_rate
+        samples[position:position + length] = func.get_samples(time_arr) / norm
+        return
+
+    def _sample_function_batch(self, func, norm, samples, positions, offsets, lengths):
+        """
+        Samples all pieces of a chunk that share the same elementwise sampling function.
+        Short pieces are sampled together with a single call to get_samples. Long pieces are
+        sampled on their own since the interpreter overhead is negligible for them and slicing is
+        cheaper than scattering the samples with an index array.
+        """
+        if len(lengths) == 0:
+            return
+        is_short = lengths < self.batch_length_threshold
+
+        if not self.rotating_frame:
+            # All pieces start at the same time offset. Sample only the longest one and re-use it.
+            time_arr = (offsets[0] + np.arange(np.max(lengths), dtype='float64')) / self.sample_rate
+            func_samples = func.get_samples(time_arr) / norm
+            for pos, length in zip(positions[~is_short], lengths[~is_short]):
+                samples[pos:pos + length] = func_samples[:length]
+            if np.any(is_short):
+                sample_positions, relative_bins = self._get_sample_positions(positions[is_short],
+                                                                             lengths[is_short])
+                samples[sample_positions] = func_samples[relative_bins]
+            return
+
+        for pos, offset, length in zip(positions[~is_short], offsets[~is_short], lengths[~is_short]):
+            self._sample_piece(func=func,
+                               norm=norm,
+                               samples=samples,
+                               position=pos,
+                               offset=offset,
+                               length=length)
+        if np.any(is_short):
+            sample_positions, relative_bins = self._get_sample_positions(positions[is_short],
+                                                                         lengths[is_short])
+            # In the rotating frame the time offset of each sample only depends on its position
+            time_offset = offsets[is_short][0] - positions[is_short][0]
+            time_arr = (time_offset + sample_positions) / self.sample_rate
+            samples[sample_positions] = func.get_samples(time_arr) / norm
+        return
+
+    def _sample_sine_batch(self, components, norm, samples, positions, offsets, lengths):
+        """
+        Samples all pieces of a chunk that share the same sampling function given by its sine
+        decomposition. Uses
+            sin(phase_0 + w*k) = cos(phase_0) * sin(w*k) + sin(phase_0) * cos(w*k)
+        with sin(w*k) and cos(w*k) taken from lookup tables and phase_0 being the phase at the
+        start of each piece.
+        """
+        if len(lengths) == 0:
+            return
+        is_short = lengths < self.batch_length_threshold
+        table_length = self.lookup_table_length
+        tables = [self._get_lookup_table(frequency / self.sample_rate)
+                  for amplitude, frequency, phase in components]
+
+        for pos, offset, length in zip(positions[~is_short], offsets[~is_short],
+                                       lengths[~is_short]):
+            # Split the piece into segments of table_length samples (the last one may be shorter)
+            segment_offsets = offset + table_length * np.arange(-(-length // table_length))
+            segment_coefficients = self._get_sine_coefficients(components, norm, segment_offsets)
+            number_of_full = length // table_length
+            piece_samples = np.zeros(length, dtype='float64')
+            full_segments = piece_samples[:number_of_full * table_length].reshape(
+                number_of_full, table_length)
+            rest = piece_samples[number_of_full * table_length:]
+            for (sin_table, cos_table), (sin_coeff, cos_coeff) in zip(tables, segment_coefficients):
+                full_segments += sin_coeff[:number_of_full, np.newaxis] * sin_table
+                full_segments += cos_coeff[:number_of_full, np.newaxis] * cos_table
+                if len(rest) > 0:
+                    rest += sin_coeff[-1] * sin_table[:len(rest)]
+                    rest += cos_coeff[-1] * cos_table[:len(rest)]
+            samples[pos:pos + length] = piece_samples
+
+        if np.any(is_short):
+            coefficients = self._get_sine_coefficients(components, norm, offsets)
+            sample_positions, relative_bins = self._get_sample_positions(positions[is_short],
+                                                                         lengths[is_short])
+            piece_indices = np.repeat(np.flatnonzero(is_short), lengths[is_short])
+            piece_samples = np.zeros(len(sample_positions), dtype='float64')
+            for (sin_table, cos_table), (sin_coeff, cos_coeff) in zip(tables, coefficients):
+                piece_samples += sin_coeff[piece_indices] * sin_table[relative_bins]
+                piece_samples += cos_coeff[piece_indices] * cos_table[relative_bins]
+            samples[sample_positions] = piece_samples
+        return
+
+    def _get_sine_coefficients(self, components, norm, offsets):
+        """
+        Returns the coefficients (cos(phase_0), sin(phase_0)) of the sine and cosine lookup tables
+        for each component and each start offset (in bins).
+        """
+        coefficients = list()
+        for amplitude, frequency, phase in components:
+            cycles_per_bin = frequency / self.sample_rate
+            # Only the fractional part of the start phase matters. This also keeps the phase
+            # accurate for large time offsets.
+            start_phase = 2 * np.pi * np.mod(cycles_per_bin * offsets, 1.0) + phase
+            coefficients.append((amplitude * np.cos(start_phase) / norm,
+                                 amplitude * np.sin(start_phase) / norm))
+        return coefficients
+
+    def _get_lookup_table(self, cycles_per_bin):
+        """
+        Returns the sine and cosine of 2*pi*cycles_per_bin*k for k = 0...lookup_table_length-1.
+        Tables are memoized for the last max_lookup_tables frequencies.
+        """
+        tables = self._lookup_tables.pop(cycles_per_bin, None)
+        if tables is None:
+            angles = (2 * np.pi * cycles_per_bin) * np.arange(self.lookup_table_length,
+                                                              dtype='float64')
+            tables = (np.sin(angles), np.cos(angles))
+            if len(self._lookup_tables) >= self.max_lookup_tables:
+                # Drop the least recently used table
+                del self._lookup_tables[next(iter(self._lookup_tables))]
+        # (Re-)insert as most recently used table
+        self._lookup_tables[cycles_per_bin] = tables
+        return tables
+
+    @staticmethod
+    def _get_sample_positions(positions, lengths):
+        """
+        Expands start positions and lengths of pieces into the positions of all samples and the
+        sample index relative to the start of the respective piece.
+        """
+        piece_index_offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        relative_bins = np.arange(np.sum(lengths), dtype='int64') - piece_index_offsets
+        return np.repeat(positions, lengths) + relative_bins, relative_bins
+
+
+def run_length_encode_ensemble(block_list, elements_length_bins, digital_channels):
+    """
+    Creates the run-length encoded form of the digital channels of a PulseBlockEnsemble directly
+    from its elements, i.e. without sampling it. Each run is a stretch of samples with constant
+    digital channel states. Elements of zero length are dropped and consecutive elements with the
+    same states are merged into a single run.
+
+    @param list block_list: list of tuples (element_list, repetitions) for each block in the
+                            ensemble (see EnsembleSampler)
+    @param numpy.ndarray elements_length_bins: length in bins of each element (incl. repetitions)
+                                               as returned by
+                                               SequenceGeneratorLogic.analyze_block_ensemble
+    @param iterable digital_channels: the generic digital channel names (i.e. 'd_ch1') to encode
+
+    @return (numpy.ndarray, numpy.ndarray): int64 array with the length in bins of each run and
+                                            uint64 array with the state bitmask of each run (bit n-1
+                                            is set if channel 'd_chn' is high)
+    """
+    channel_bits = {chnl: 1 << (int(chnl.replace('d_ch', '')) - 1) for chnl in digital_channels}
+    state_list = list()
+    for element_list, reps in block_list:
+        if len(element_list) == 0:
+            continue
+        block_states = np.array(
+            [sum(bit for chnl, bit in channel_bits.items() if element.digital_high[chnl]) for
+             element in element_list], dtype='uint64')
+        state_list.append(np.tile(block_states, reps + 1))
+
+    durations = np.asarray(elements_length_bins, dtype='int64')
+    states = np.concatenate(state_list) if state_list else np.zeros(0, dtype='uint64')
+    non_empty = durations > 0
+    durations = durations[non_empty]
+    states = states[non_empty]
+    if len(states) == 0:
+        return durations, states
+
+    run_starts = np.flatnonzero(np.concatenate(([True], states[1:] != states[:-1])))
+    return np.add.reduceat(durations, run_starts), states[run_starts]
+
+
+def sample_ensemble_to_shared_memory(sampler_kwargs, shared_memory_names, chunk_length):
+    """
+    Samples an entire PulseBlockEnsemble into already existing shared memory blocks.
+    This function is meant to be executed in a worker process of ParallelEnsembleSampler.
+
+    @param dict sampler_kwargs: keyword arguments to create the EnsembleSampler instance with
+    @param dict shared_memory_names: names of the shared memory blocks (values) for each channel
+                                     (keys)
+    @param int chunk_length: number of samples to calculate at once (limits temporary memory)
+    """
+    sampler = EnsembleSampler(**sampler_kwargs)
+    number_of_samples = sampler.number_of_samples
+    shared_memory = {chnl: SharedMemory(name=name) for chnl, name in shared_memory_names.items()}
+    try:
+        samples = {chnl: np.ndarray(number_of_samples,
+                                    dtype='float32' if chnl.startswith('a') else bool,
+                                    buffer=shm.buf) for chnl, shm in shared_memory.items()}
+        for start_bin in range(0, number_of_samples, chunk_length):
+            stop_bin = min(start_bin + chunk_length, number_of_samples)
+            sampler.sample_chunk(
+                start_bin=start_bin,
+                analog_samples={chnl: arr[start_bin:stop_bin] for chnl, arr in samples.items() if
+                                chnl.startswith('a')},
+                digital_samples={chnl: arr[start_bin:stop_bin] for chnl, arr in samples.items() if
+                                 chnl.startswith('d')})
+        # Release all buffer exports before closing the shared memory
+        del samples
+    finally:
+        for shm in shared_memory.values():
+            shm.close()
+    return
+
+
+class ParallelEnsembleSampler:
+    """
+    Samples several PulseBlockEnsembles concurrently in a pool of worker processes.
+
+    Jobs are registered in the order the samples will be consumed (e.g. the order of sequence
+    steps). The samples of each job are calculated into shared memory blocks so they do not need to
+    be copied back to the calling process. In order to limit the memory footprint, only the next
+    max_workers jobs after the job currently consumed are sampled in advance.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max(1, int(max_workers))
+        self._executor = None
+        # Registered jobs (keys are unique job identifiers, e.g. the sampling fingerprint)
+        self._jobs = OrderedDict()
+
+    def add_job(self, job_id, sampler_kwargs, channels, number_of_samples, chunk_length):
+        """
+        Registers a new sampling job. Nothing will be sampled until start or get_samples is called.
+
+        @param str job_id: unique identifier of the job (e.g. the sampling fingerprint)
+        @param dict sampler_kwargs: keyword arguments to create the EnsembleSampler instance with
+        @param iterable channels: analog and digital channel descriptors to sample
+        @param int number_of_samples: total number of samples of the ensemble
+        @param int chunk_length: number of samples to calculate at once in the worker process
+        """
+        if job_id in self._jobs or number_of_samples == 0:
+            return
+        self._jobs[job_id] = {'sampler_kwargs': sampler_kwargs,
+                              'channels': set(channels),
+                              'number_of_samples': int(number_of_samples),
+                              'chunk_length': max(1, int(chunk_length)),
+                              'shared_memory': None,
+                              'future': None}
+        return
+
+    def has_job(self, job_id):
+        return job_id in self._jobs
+
+    def start(self):
+        """
+        Starts sampling of the first max_workers registered jobs.
+        """
+        for job_id in list(self._jobs)[:self.max_workers]:
+            self._submit(job_id)
+        return
+
+    def get_samples(self, job_id):
+        """
+        Waits for the job to finish and returns the samples. Before waiting, the job itself (if
+        not started yet) and the max_workers jobs following it are submitted, so the workers keep
+        sampling while the samples of this job are consumed. The shared memory must be released by
+        calling release afterwards.
+
+        @param str job_id: unique identifier of the job
+        @return dict: sample arrays (values) for each channel (keys) backed by shared memory.
+        """
+        job_ids = list(self._jobs)
+        index = job_ids.index(job_id)
+        # this job and the next max_workers jobs in line
+        for next_id in job_ids[index:index + 1 + self.max_workers]:
+            self._submit(next_id)
+
+        job = self._jobs[job_id]
+        # Re-raises any exception that occurred in the worker process
+        job['future'].result()
+        return {chnl: np.ndarray(job['number_of_samples'],
+                                 dtype='float32' if chnl.startswith('a') else bool,
+                                 buffer=shm.buf) for chnl, shm in job['shared_memory'].items()}
+
+    def release(self, job_id):
+        """
+        Removes a job and frees the associated shared memory. Sample arrays returned by
+        get_samples for this job must not be used anymore.
+
+        @param str job_id: unique identifier of the job
+        """
+        job = self._jobs.pop(job_id, None)
+        if job is None:
+            return
+        if job['future'] is not None:
+            job['future'].cancel()
+            try:
+                job['future'].exception()
+            except Exception:
+                pass
+        if job['shared_memory'] is not None:
+            for shm in job['shared_memory'].values():
+                try:
+                    shm.close()
+                except BufferError:
+                    # Sample arrays still referenced. Memory is freed once they are deleted.
+                    pass
+                shm.unlink()
+        return
+
+    def clear(self):
+        """
+        Removes all registered jobs and frees the associated shared memory.
+        """
+        for job_id in list(self._jobs):
+            self.release(job_id)
+        return
+
+    def shutdown(self):
+        """
+        Removes all jobs and terminates the worker processes.
+        """
+        self.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        return
+
+    def _submit(self, job_id):
+        job = self._jobs[job_id]
+        if job['future'] is not None:
+            return
+        if self._executor is None:
+            # Always spawn fresh interpreters. Forking the multithreaded Qt application is unsafe.
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        job['shared_memory'] = dict()
+        for chnl in job['channels']:
+            bytes_per_sample = 4 if chnl.startswith('a') else 1
+            job['shared_memory'][chnl] = SharedMemory(
+                create=True, size=job['number_of_samples'] * bytes_per_sample)
+        job['future'] = self._executor.submit(
+            sample_ensemble_to_shared_memory,
+            job['sampler_kwargs'],
+            {chnl: shm.name for chnl, shm in job['shared_memory'].items()},
+            job['chunk_length'])
+        return
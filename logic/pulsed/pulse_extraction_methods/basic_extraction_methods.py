@@ -20,7 +20,7 @@ top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi
 """
 
 import numpy as np
-from scipy import ndimage
+from scipy import ndimage, signal
 
 from logic.pulsed.pulse_extractor import PulseExtractorBase
 
@@ -110,11 +110,13 @@ class BasicPulseExtractor(PulseExtractorBase):
             trace.
 
             The maxima and minima are not found sequentially, pulse by pulse,
-            but are rather globally obtained. I.e. the convolved and derived
-            array is searched iteratively for a maximum and a minimum, and after
-            finding those the array entries within the 4 times
-            self.conv_std_dev (2*self.conv_std_dev to the left and
-            2*self.conv_std_dev) are set to zero.
+            but are rather globally obtained. I.e. all local maxima (minima) of
+            the convolved and derived array with a minimum distance of
+            2*conv_std_dev to each other are determined in a single pass and the
+            number_of_lasers largest (smallest) ones are taken as flanks.
+            The flank positions are refined afterwards within +-conv_std_dev
+            using a derivative smoothed with a small, fixed standard deviation
+            of 10 bins, which is only calculated around the flanks.
 
             The crucial part is the knowledge of the number of laser pulses and
             the choice of the appropriate std_dev for the gauss filter.
@@ -149,87 +151,24 @@ class BasicPulseExtractor(PulseExtractorBase):
             return_dict['laser_counts_arr'] = np.zeros((number_of_lasers, 10), dtype='int64')
             return return_dict
 
-        # use a reference for array, because the exact position of the peaks or dips
-        # (i.e. maxima or minima, which are the inflection points in the pulse) are distorted by
-        # a large conv_std_dev value.
-        try:
-            conv = ndimage.filters.gaussian_filter1d(count_data.astype(float), 10)
-        except:
-            conv = np.zeros(count_data.size)
-        try:
-            conv_deriv_ref = np.gradient(conv)
-        except:
-            conv_deriv_ref = np.zeros(conv.size)
-
-        # initialize arrays to contain indices for all rising and falling
-        # flanks, respectively
-        rising_ind = np.empty(number_of_lasers, dtype='int64')
-        falling_ind = np.empty(number_of_lasers, dtype='int64')
-
-        # Find as many rising and falling flanks as there are laser pulses in
-        # the trace:
-        for i in range(number_of_lasers):
-            # save the index of the absolute maximum of the derived time trace
-            # as rising edge position
-            rising_ind[i] = np.argmax(conv_deriv)
-
-            # refine the rising edge detection, by using a small and fixed
-            # conv_std_dev parameter to find the inflection point more precise
-            start_ind = int(rising_ind[i] - conv_std_dev)
-            if start_ind < 0:
-                start_ind = 0
-
-            stop_ind = int(rising_ind[i] + conv_std_dev)
-            if stop_ind > len(conv_deriv):
-                stop_ind = len(conv_deriv)
-
-            if start_ind == stop_ind:
-                stop_ind = start_ind + 1
-
-            rising_ind[i] = start_ind + np.argmax(conv_deriv_ref[start_ind:stop_ind])
-
-            # set this position and the surrounding of the saved edge to 0 to
-            # avoid a second detection
-            if rising_ind[i] < 2 * conv_std_dev:
-                del_ind_start = 0
-            else:
-                del_ind_start = rising_ind[i] - int(2 * conv_std_dev)
-            if (conv_deriv.size - rising_ind[i]) < 2 * conv_std_dev:
-                del_ind_stop = conv_deriv.size - 1
-            else:
-                del_ind_stop = rising_ind[i] + int(2 * conv_std_dev)
-                conv_deriv[del_ind_start:del_ind_stop] = 0
-
-            # save the index of the absolute minimum of the derived time trace
-            # as falling edge position
-            falling_ind[i] = np.argmin(conv_deriv)
-
-            # refine the falling edge detection, by using a small and fixed
-            # conv_std_dev parameter to find the inflection point more precise
-            start_ind = int(falling_ind[i] - conv_std_dev)
-            if start_ind < 0:
-                start_ind = 0
-
-            stop_ind = int(falling_ind[i] + conv_std_dev)
-            if stop_ind > len(conv_deriv):
-                stop_ind = len(conv_deriv)
-
-            if start_ind == stop_ind:
-                stop_ind = start_ind + 1
+        # Find as many rising and falling flanks as there are laser pulses in the trace. Local
+        # extrema closer than 2 * conv_std_dev to a larger one are discarded.
+        min_distance = max(int(2 * conv_std_dev), 1)
+        rising_ind = self._find_largest_peaks(conv_deriv, number_of_lasers, min_distance)
+        falling_ind = self._find_largest_peaks(-conv_deriv, number_of_lasers, min_distance)
+        if rising_ind.size != number_of_lasers or falling_ind.size != number_of_lasers:
+            self.log.warning('Unable to find {0:d} rising and falling flanks in the timetrace '
+                             '(found {1:d} rising and {2:d} falling flanks).'
+                             ''.format(number_of_lasers, rising_ind.size, falling_ind.size))
+            return_dict['laser_counts_arr'] = np.zeros((number_of_lasers, 10), dtype='int64')
+            return return_dict
 
-            falling_ind[i] = start_ind + np.argmin(conv_deriv_ref[start_ind:stop_ind])
-
-            # set this position and the sourrounding of the saved flank to 0 to
-            #  avoid a second detection
-            if falling_ind[i] < 2 * conv_std_dev:
-                del_ind_start = 0
-            else:
-                del_ind_start = falling_ind[i] - int(2 * conv_std_dev)
-            if (conv_deriv.size - falling_ind[i]) < 2 * conv_std_dev:
-                del_ind_stop = conv_deriv.size - 1
-            else:
-                del_ind_stop = falling_ind[i] + int(2 * conv_std_dev)
-            conv_deriv[del_ind_start:del_ind_stop] = 0
+        # refine the edge detection, by using a small and fixed conv_std_dev parameter to find
+        # the inflection point more precise. This is necessary because the exact position of the
+        # peaks or dips (i.e. maxima or minima, which are the inflection points in the pulse) are
+        # distorted by a large conv_std_dev value.
+        rising_ind = self._refine_flank_positions(count_data, rising_ind, conv_std_dev, 10, True)
+        falling_ind = self._refine_flank_positions(count_data, falling_ind, conv_std_dev, 10, False)
 
         # sort all indices of rising and falling flanks
         rising_ind.sort()
@@ -238,22 +177,78 @@ class BasicPulseExtractor(PulseExtractorBase):
         # find the maximum laser length to use as size for the laser array
         laser_length = np.max(falling_ind - rising_ind)
 
-        # initialize the empty output array
+        # slice the detected laser pulses of the timetrace according to the found rising edge.
+        # Laser pulses exceeding the end of the timetrace are padded with zeros.
+        laser_indices = rising_ind[:, np.newaxis] + np.arange(laser_length, dtype='int64')
         laser_arr = np.zeros((number_of_lasers, laser_length), dtype='int64')
-        # slice the detected laser pulses of the timetrace and save them in the
-        # output array according to the found rising edge
-        for i in range(number_of_lasers):
-            if rising_ind[i] + laser_length > count_data.size:
-                lenarr = count_data[rising_ind[i]:].size
-                laser_arr[i, 0:lenarr] = count_data[rising_ind[i]:]
-            else:
-                laser_arr[i] = count_data[rising_ind[i]:rising_ind[i] + laser_length]
+        in_range = laser_indices < count_data.size
+        laser_arr[in_range] = count_data[laser_indices[in_range]]
 
-        return_dict['laser_counts_arr'] = laser_arr.astype('int64')
+        return_dict['laser_counts_arr'] = laser_arr
         return_dict['laser_indices_rising'] = rising_ind
         return_dict['laser_indices_falling'] = falling_ind
         return return_dict
 
+    @staticmethod
+    def _find_largest_peaks(data, number_of_peaks, min_distance):
+        """
+        Finds the positions of the largest local maxima in a 1D array. Maxima closer than
+        min_distance to a larger maximum are discarded.
+
+        @param numpy.ndarray data: 1D array to search for maxima
+        @param int number_of_peaks: maximum number of peak positions to return
+        @param int min_distance: minimum distance in bins between two peaks
+
+        @return numpy.ndarray: positions of the largest peaks (in descending order of peak height)
+        """
+        peaks, _ = signal.find_peaks(data, distance=min_distance)
+        if peaks.size > number_of_peaks:
+            peaks = peaks[np.argsort(data[peaks], kind='stable')[::-1][:number_of_peaks]]
+        else:
+            peaks = peaks[np.argsort(data[peaks], kind='stable')[::-1]]
+        return peaks.astype('int64')
+
+    @staticmethod
+    def _refine_flank_positions(count_data, flank_ind, search_width, ref_std_dev, is_rising):
+        """
+        Refines flank positions by searching the extremum of the derivative of the timetrace
+        smoothed with a gaussian filter of small standard deviation (ref_std_dev) within
+        +-search_width bins around each flank. The smoothed derivative is only calculated in the
+        vicinity of the flanks.
+
+        @param numpy.ndarray count_data: The raw timetrace data (1D)
+        @param numpy.ndarray flank_ind: coarse flank positions
+        @param float search_width: search for the refined flank within +-search_width bins
+        @param float ref_std_dev: standard deviation of the gaussian filter used for refinement
+        @param bool is_rising: search for maxima (True) or minima (False) of the derivative
+
+        @return numpy.ndarray: refined flank positions
+        """
+        # search windows [start_ind, stop_ind) around each flank
+        start_ind = np.clip(np.trunc(flank_ind - search_width).astype('int64'), 0, None)
+        stop_ind = np.clip(np.trunc(flank_ind + search_width).astype('int64'), None,
+                           count_data.size)
+        stop_ind = np.where(start_ind == stop_ind, start_ind + 1, stop_ind)
+        window_width = int(np.max(stop_ind - start_ind))
+
+        # Extract the raw data needed to smooth and derive each search window. The timetrace is
+        # extended with its mirror image at both ends (same as the "reflect" mode of ndimage).
+        radius = int(4.0 * ref_std_dev + 0.5)
+        margin = radius + 1
+        padded_data = np.pad(count_data.astype(float), margin, mode='symmetric')
+        data_indices = start_ind[:, np.newaxis] + np.arange(window_width + 2 * margin)
+        windows = padded_data[np.clip(data_indices, 0, padded_data.size - 1)]
+        windows_deriv = np.gradient(ndimage.filters.gaussian_filter1d(windows, ref_std_dev),
+                                    axis=1)[:, margin:margin + window_width]
+
+        # Exclude all bins beyond the end of each search window
+        outside = np.arange(window_width) >= (stop_ind - start_ind)[:, np.newaxis]
+        if is_rising:
+            windows_deriv[outside] = -np.inf
+            return start_ind + np.argmax(windows_deriv, axis=1)
+        windows_deriv[outside] = np.inf
+        return start_ind + np.argmin(windows_deriv, axis=1)
+
     def ungated_threshold(self, count_data, count_threshold=10, min_laser_length=200e-9,
                           threshold_tolerance=20e-9):
         """
@@ -69,6 +69,7 @@ class PulsedMasterLogic(GenericLogic):
     # signals for master module (i.e. GUI) coming from PulsedMeasurementLogic
     sigMeasurementDataUpdated = QtCore.Signal()
     sigTimerUpdated = QtCore.Signal(float, int, float)
+    sigAnalysisLatencyUpdated = QtCore.Signal(dict)
     sigFitUpdated = QtCore.Signal(str, np.ndarray, object, bool)
     sigMeasurementStatusUpdated = QtCore.Signal(bool, bool)
     sigPulserRunningUpdated = QtCore.Signal(bool)
@@ -167,6 +168,8 @@ class PulsedMasterLogic(GenericLogic):
             self.sigMeasurementDataUpdated, QtCore.Qt.QueuedConnection)
         self.pulsedmeasurementlogic().sigTimerUpdated.connect(
             self.sigTimerUpdated, QtCore.Qt.QueuedConnection)
+        self.pulsedmeasurementlogic().sigAnalysisLatencyUpdated.connect(
+            self.sigAnalysisLatencyUpdated, QtCore.Qt.QueuedConnection)
         self.pulsedmeasurementlogic().sigFitUpdated.connect(
             self.fit_updated, QtCore.Qt.QueuedConnection)
         self.pulsedmeasurementlogic().sigMeasurementStatusUpdated.connect(
@@ -264,6 +267,7 @@ class PulsedMasterLogic(GenericLogic):
         # Disconnect signals coming from PulsedMeasurementLogic
         self.pulsedmeasurementlogic().sigMeasurementDataUpdated.disconnect()
         self.pulsedmeasurementlogic().sigTimerUpdated.disconnect()
+        self.pulsedmeasurementlogic().sigAnalysisLatencyUpdated.disconnect()
         self.pulsedmeasurementlogic().sigFitUpdated.disconnect()
         self.pulsedmeasurementlogic().sigMeasurementStatusUpdated.disconnect()
         self.pulsedmeasurementlogic().sigPulserRunningUpdated.disconnect()
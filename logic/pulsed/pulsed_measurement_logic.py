@@ -23,6 +23,7 @@ from qtpy import QtCore
 from collections import OrderedDict
 import numpy as np
 import copy
+import queue
 import time
 import datetime
 import matplotlib.pyplot as plt
@@ -39,6 +40,18 @@ from logic.pulsed.pulse_extractor import PulseExtractor
 from logic.pulsed.pulse_analyzer import PulseAnalyzer
 
 
+class PulsedMeasurementWorker(QtCore.QObject):
+    """ Helper class for running a method of the logic in a separate thread. """
+
+    def __init__(self, method):
+        super().__init__()
+        self._method = method
+
+    @QtCore.Slot()
+    def run(self):
+        self._method()
+
+
 class PulsedMeasurementLogic(GenericLogic):
     """
     This is the Logic class for the control of pulsed measurements.
@@ -57,6 +70,10 @@ class PulsedMeasurementLogic(GenericLogic):
     analysis_import_path = ConfigOption(name='additional_analysis_path', default=None)
     # Optional file type descriptor for saving raw data to file
     _raw_data_save_type = ConfigOption(name='raw_data_save_type', default='text')
+    # Read the fast counter and analyze the data in two separate worker threads. The fast counter
+    # is read on each timer tick independent of the analysis. If the analysis is slower, only the
+    # most recent raw data is analyzed.
+    _threaded_analysis = ConfigOption(name='threaded_analysis', default=False, missing='nothing')
 
     # status variables
     # ext. microwave settings
@@ -80,6 +97,9 @@ class PulsedMeasurementLogic(GenericLogic):
     _laser_ignore_list = StatusVar(default=list())
     _data_units = StatusVar(default=('s', ''))
     _data_labels = StatusVar(default=('Tau', 'Signal'))
+    # Re-use the laser pulse positions of the first successful extraction in subsequent analysis
+    # runs instead of running the extraction method on every timer tick.
+    _streaming_extraction = StatusVar(default=False)
 
     # PulseExtractor settings
     extraction_parameters = StatusVar(default=None)
@@ -110,8 +130,12 @@ class PulsedMeasurementLogic(GenericLogic):
     sigAnalysisSettingsUpdated = QtCore.Signal(dict)
     sigExtractionSettingsUpdated = QtCore.Signal(dict)
     # Internal signals
+    # Duration in seconds (values) of each analysis stage (keys) for the last analysis run
+    sigAnalysisLatencyUpdated = QtCore.Signal(dict)
+
     sigStartTimer = QtCore.Signal()
     sigStopTimer = QtCore.Signal()
+    sigRawDataAcquired = QtCore.Signal()
 
     def __init__(self, config, **kwargs):
         super().__init__(config=config, **kwargs)
@@ -129,6 +153,14 @@ class PulsedMeasurementLogic(GenericLogic):
 
         # threading
         self._threadlock = Mutex()
+        # Serializes all fast counter calls (acquisition worker thread and logic thread)
+        self._fast_counter_lock = Mutex()
+        # Most recent raw data snapshot waiting for analysis (only used with threaded_analysis)
+        self._raw_data_queue = queue.Queue(maxsize=1)
+        self._acquisition_thread = None
+        self._acquisition_worker = None
+        self._analysis_thread = None
+        self._analysis_worker = None
 
         # measurement data
         self.signal_data = np.empty((2, 0), dtype=float)
@@ -137,6 +169,9 @@ class PulsedMeasurementLogic(GenericLogic):
         self.laser_data = np.zeros((10, 20), dtype='int64')
         self.raw_data = np.zeros((10, 20), dtype='int64')
 
+        # Frozen laser pulse positions for streaming extraction (see _create_laser_gather_index)
+        self._laser_gather_index = None
+
         self._saved_raw_data = OrderedDict()  # temporary saved raw data
         self._recalled_raw_data_tag = None  # the currently recalled raw data dict key
 
@@ -165,8 +200,22 @@ class PulsedMeasurementLogic(GenericLogic):
         self.__analysis_timer = QtCore.QTimer()
         self.__analysis_timer.setSingleShot(False)
         self.__analysis_timer.setInterval(round(1000. * self.__timer_interval))
-        self.__analysis_timer.timeout.connect(self._pulsed_analysis_loop,
-                                              QtCore.Qt.QueuedConnection)
+        if self._threaded_analysis:
+            # Create independent threads for reading the fast counter and for the analysis
+            self._acquisition_thread = QtCore.QThread()
+            self._acquisition_worker = PulsedMeasurementWorker(self._acquire_raw_data)
+            self._acquisition_worker.moveToThread(self._acquisition_thread)
+            self._analysis_thread = QtCore.QThread()
+            self._analysis_worker = PulsedMeasurementWorker(self._analyze_acquired_raw_data)
+            self._analysis_worker.moveToThread(self._analysis_thread)
+            self.__analysis_timer.timeout.connect(self._acquisition_worker.run,
+                                                  QtCore.Qt.QueuedConnection)
+            self.sigRawDataAcquired.connect(self._analysis_worker.run, QtCore.Qt.QueuedConnection)
+            self._acquisition_thread.start()
+            self._analysis_thread.start()
+        else:
+            self.__analysis_timer.timeout.connect(self._pulsed_analysis_loop,
+                                                  QtCore.Qt.QueuedConnection)
 
         # Fitting
         self.fc = self.fitlogic().make_fit_container('pulsed', '1d')
@@ -228,6 +277,12 @@ class PulsedMeasurementLogic(GenericLogic):
         self.__analysis_timer.timeout.disconnect()
         self.sigStartTimer.disconnect()
         self.sigStopTimer.disconnect()
+        if self._threaded_analysis:
+            self.sigRawDataAcquired.disconnect()
+            self._acquisition_thread.quit()
+            self._analysis_thread.quit()
+            self._acquisition_thread.wait()
+            self._analysis_thread.wait()
         return
 
     ############################################################################
@@ -303,14 +358,16 @@ class PulsedMeasurementLogic(GenericLogic):
 
         @return int: error code (0:OK, -1:error)
         """
-        return self.fastcounter().start_measure()
+        with self._fast_counter_lock:
+            return self.fastcounter().start_measure()
 
     def fast_counter_off(self):
         """Switching off the fast counter
 
         @return int: error code (0:OK, -1:error)
         """
-        return self.fastcounter().stop_measure()
+        with self._fast_counter_lock:
+            return self.fastcounter().stop_measure()
 
     @QtCore.Slot(bool)
     def toggle_fast_counter(self, switch_on):
@@ -330,14 +387,16 @@ class PulsedMeasurementLogic(GenericLogic):
 
         @return int: error code (0:OK, -1:error)
         """
-        return self.fastcounter().pause_measure()
+        with self._fast_counter_lock:
+            return self.fastcounter().pause_measure()
 
     def fast_counter_continue(self):
         """Switching off the fast counter
 
         @return int: error code (0:OK, -1:error)
         """
-        return self.fastcounter().continue_measure()
+        with self._fast_counter_lock:
+            return self.fastcounter().continue_measure()
 
     @QtCore.Slot(bool)
     def fast_counter_pause_continue(self, continue_counter):
@@ -527,6 +586,7 @@ class PulsedMeasurementLogic(GenericLogic):
         settings_dict['alternating'] = bool(self._alternating)
         settings_dict['units'] = self._data_units
         settings_dict['labels'] = self._data_labels
+        settings_dict['streaming_extraction'] = bool(self._streaming_extraction)
         return settings_dict
 
     @measurement_settings.setter
@@ -674,6 +734,7 @@ class PulsedMeasurementLogic(GenericLogic):
         # Use threadlock to update settings during a running measurement
         with self._threadlock:
             self._pulseextractor.extraction_settings = settings_dict
+            self._laser_gather_index = None
             self.sigExtractionSettingsUpdated.emit(self.extraction_settings)
         return
 
@@ -712,6 +773,9 @@ class PulsedMeasurementLogic(GenericLogic):
                     self.fc.set_units(self._data_units)
                 if 'labels' in settings_dict:
                     self._data_labels = list(settings_dict.get('labels'))
+                if 'streaming_extraction' in settings_dict:
+                    self._streaming_extraction = bool(settings_dict.get('streaming_extraction'))
+                    self._laser_gather_index = None
 
             if self.module_state() == 'idle':
                 # Get all other parameters if present
@@ -777,6 +841,8 @@ class PulsedMeasurementLogic(GenericLogic):
 
                 # initialize data arrays
                 self._initialize_data_arrays()
+                self._laser_gather_index = None
+                self._clear_raw_data_queue()
 
                 # recall stashed raw data
                 if stashed_raw_data_tag in self._saved_raw_data:
@@ -840,6 +906,7 @@ class PulsedMeasurementLogic(GenericLogic):
                                                                 {'elapsed_sweeps': self.__elapsed_sweeps,
                                                                  'elapsed_time': self.__elapsed_time})
                 self._recalled_raw_data_tag = None
+                self._clear_raw_data_queue()
 
                 # Set measurement paused flag
                 self.__is_paused = False
@@ -960,6 +1027,16 @@ class PulsedMeasurementLogic(GenericLogic):
             self.sigMeasurementDataUpdated.emit()
         return
 
+    @QtCore.Slot()
+    def redetect_laser_pulses(self):
+        """
+        Discards the laser pulse positions used for streaming extraction. The extraction method is
+        run again on the next analysis run.
+        """
+        with self._threadlock:
+            self._laser_gather_index = None
+        return
+
     @QtCore.Slot()
     def manually_pull_data(self):
         """ Analyse and display the data
@@ -1103,43 +1180,39 @@ class PulsedMeasurementLogic(GenericLogic):
         """
         with self._threadlock:
             if self.module_state() == 'locked':
-                # Update elapsed time
-
-                self._extract_laser_pulses()
-
-                tmp_signal, tmp_error = self._analyze_laser_pulses()
-
-                # exclude laser pulses to ignore
-                if len(self._laser_ignore_list) > 0:
-                    # Convert relative negative indices into absolute positive indices
-                    while self._laser_ignore_list[0] < 0:
-                        neg_index = self._laser_ignore_list[0]
-                        self._laser_ignore_list[0] = len(tmp_signal) + neg_index
-                        self._laser_ignore_list.sort()
+                self._analyze_raw_data(self._get_raw_data_snapshot())
 
-                    tmp_signal = np.delete(tmp_signal, self._laser_ignore_list)
-                    tmp_error = np.delete(tmp_error, self._laser_ignore_list)
+            # emit signals
+            self.sigTimerUpdated.emit(self.__elapsed_time, self.__elapsed_sweeps,
+                                      self.__timer_interval)
+            self.sigMeasurementDataUpdated.emit()
+            return
 
-                # order data according to alternating flag
-                if self._alternating:
-                    if len(self.signal_data[0]) != len(tmp_signal[::2]):
-                        self.log.error('Length of controlled variable ({0}) does not match length of number of readout '
-                                       'pulses ({1}).'.format(len(self.signal_data[0]), len(tmp_signal[::2])))
-                        return
-                    self.signal_data[1] = tmp_signal[::2]
-                    self.signal_data[2] = tmp_signal[1::2]
-                    self.measurement_error[1] = tmp_error[::2]
-                    self.measurement_error[2] = tmp_error[1::2]
-                else:
-                    if len(self.signal_data[0]) != len(tmp_signal):
-                        self.log.error('Length of controlled variable ({0}) does not match length of number of readout '
-                                       'pulses ({1}).'.format(len(self.signal_data[0]), len(tmp_signal)))
-                        return
-                    self.signal_data[1] = tmp_signal
-                    self.measurement_error[1] = tmp_error
+    def _acquire_raw_data(self):
+        """ Reads the fast counter and hands the raw data over to the analysis worker.
+            Runs in the acquisition worker thread (threaded_analysis only).
+        """
+        if self.module_state() != 'locked' or self.__is_paused:
+            return
+        snapshot = self._get_raw_data_snapshot()
+        # Latest wins: replace raw data that has not been analyzed yet
+        self._clear_raw_data_queue()
+        self._raw_data_queue.put_nowait(snapshot)
+        self.sigRawDataAcquired.emit()
+        return
 
-                # Compute alternative data array from signal
-                self._compute_alt_data()
+    def _analyze_acquired_raw_data(self):
+        """ Analyzes the most recent raw data acquired by the acquisition worker.
+            Runs in the analysis worker thread (threaded_analysis only).
+        """
+        try:
+            snapshot = self._raw_data_queue.get_nowait()
+        except queue.Empty:
+            # Already analyzed by an earlier call
+            return
+        with self._threadlock:
+            if self.module_state() == 'locked':
+                self._analyze_raw_data(snapshot)
 
             # emit signals
             self.sigTimerUpdated.emit(self.__elapsed_time, self.__elapsed_sweeps,
@@ -1147,18 +1220,164 @@ class PulsedMeasurementLogic(GenericLogic):
             self.sigMeasurementDataUpdated.emit()
             return
 
-    def _extract_laser_pulses(self):
+    def _clear_raw_data_queue(self):
+        """ Discards raw data acquired but not analyzed yet (threaded_analysis only).
+        """
+        try:
+            self._raw_data_queue.get_nowait()
+        except queue.Empty:
+            pass
+        return
+
+    def _analyze_raw_data(self, snapshot):
+        """ Extracts and analyzes the laser pulses from a raw data snapshot and updates the
+            signal data. Publishes the duration of each stage via sigAnalysisLatencyUpdated.
+
+        @param dict snapshot: raw data snapshot as returned by _get_raw_data_snapshot
+        """
+        latency = {'acquisition': snapshot['acquisition_duration'],
+                   'queue': time.perf_counter() - snapshot['timestamp']}
+        start = time.perf_counter()
+
+        self._extract_laser_pulses(snapshot)
+        latency['extraction'] = time.perf_counter() - start
+        start = time.perf_counter()
+
+        tmp_signal, tmp_error = self._analyze_laser_pulses()
+
+        # exclude laser pulses to ignore
+        if len(self._laser_ignore_list) > 0:
+            # Convert relative negative indices into absolute positive indices
+            while self._laser_ignore_list[0] < 0:
+                neg_index = self._laser_ignore_list[0]
+                self._laser_ignore_list[0] = len(tmp_signal) + neg_index
+                self._laser_ignore_list.sort()
+
+            tmp_signal = np.delete(tmp_signal, self._laser_ignore_list)
+            tmp_error = np.delete(tmp_error, self._laser_ignore_list)
+
+        # order data according to alternating flag
+        if self._alternating:
+            if len(self.signal_data[0]) != len(tmp_signal[::2]):
+                self.log.error('Length of controlled variable ({0}) does not match length of number of readout '
+                               'pulses ({1}).'.format(len(self.signal_data[0]), len(tmp_signal[::2])))
+                return
+            self.signal_data[1] = tmp_signal[::2]
+            self.signal_data[2] = tmp_signal[1::2]
+            self.measurement_error[1] = tmp_error[::2]
+            self.measurement_error[2] = tmp_error[1::2]
+        else:
+            if len(self.signal_data[0]) != len(tmp_signal):
+                self.log.error('Length of controlled variable ({0}) does not match length of number of readout '
+                               'pulses ({1}).'.format(len(self.signal_data[0]), len(tmp_signal)))
+                return
+            self.signal_data[1] = tmp_signal
+            self.measurement_error[1] = tmp_error
+        latency['analysis'] = time.perf_counter() - start
+        start = time.perf_counter()
+
+        # Compute alternative data array from signal
+        self._compute_alt_data()
+        latency['alternative_data'] = time.perf_counter() - start
+
+        latency['total'] = latency['acquisition'] + time.perf_counter() - snapshot['timestamp']
+        self.sigAnalysisLatencyUpdated.emit(latency)
+        return
+
+    def _extract_laser_pulses(self, snapshot=None):
         # Get counter raw data (including recalled raw data from previous measurement)
-        fc_data, info_dict = self._get_raw_data()
+        fc_data, info_dict = self._get_raw_data(snapshot)
         self.raw_data = fc_data
         self.__elapsed_sweeps = info_dict['elapsed_sweeps']
         self.__elapsed_time = info_dict['elapsed_time']
 
+        # In streaming mode use the laser pulse positions of a previous extraction if possible.
+        # Re-detect the laser pulses each time the elapsed time has doubled to account for drifts
+        # and the improved statistics.
+        gather_index = self._laser_gather_index
+        if self._streaming_extraction and gather_index is not None:
+            if gather_index['raw_data_shape'] == self.raw_data.shape and \
+                    self.__elapsed_time < 2 * gather_index['elapsed_time']:
+                self.laser_data = self._gather_laser_pulses(self.raw_data, gather_index)
+                return
+
         # extract laser pulses from raw data
         return_dict = self._pulseextractor.extract_laser_pulses(self.raw_data)
         self.laser_data = return_dict['laser_counts_arr']
+        if self._streaming_extraction:
+            self._laser_gather_index = self._create_laser_gather_index(self.raw_data, return_dict)
         return
 
+    def _create_laser_gather_index(self, raw_data, extraction_dict):
+        """
+        Tries to describe the result of a laser pulse extraction as a gather operation on the raw
+        data, i.e. each laser pulse is a (zero padded) slice of the raw data starting at the
+        respective rising flank index. The gather index is only returned if it reproduces the
+        extracted laser pulses exactly.
+
+        @param numpy.ndarray raw_data: the raw data the extraction was performed on
+        @param dict extraction_dict: the dict returned by PulseExtractor.extract_laser_pulses
+        @return dict: gather index to be used with _gather_laser_pulses. None if the extraction
+                      can not be described by a gather index (or has failed).
+        """
+        laser_data = extraction_dict['laser_counts_arr']
+        rising_ind = np.asarray(extraction_dict['laser_indices_rising'], dtype='int64')
+        falling_ind = np.asarray(extraction_dict['laser_indices_falling'], dtype='int64')
+        if laser_data.ndim != 2 or not laser_data.any():
+            return None
+
+        gather_index = {'raw_data_shape': raw_data.shape, 'elapsed_time': self.__elapsed_time}
+        if raw_data.ndim == 2:
+            # Gated data: the same time window for all gates
+            if rising_ind.ndim != 0:
+                return None
+            gather_index['slice'] = slice(int(rising_ind), int(rising_ind) + laser_data.shape[1])
+            gather_index['indices'] = None
+            candidates = [gather_index]
+        else:
+            # Ungated data: one slice per laser pulse
+            if rising_ind.shape != (laser_data.shape[0],):
+                return None
+            indices = rising_ind[:, np.newaxis] + np.arange(laser_data.shape[1], dtype='int64')
+            in_range = (indices >= 0) & (indices < raw_data.size)
+            candidates = list()
+            # Laser pulses are either zero padded only beyond the end of the raw data or also
+            # beyond the falling flank.
+            masks = [in_range]
+            if falling_ind.shape == rising_ind.shape:
+                masks.append(in_range & (indices <= falling_ind[:, np.newaxis]))
+            for valid in masks:
+                candidate = gather_index.copy()
+                candidate['slice'] = None
+                candidate['indices'] = np.where(valid, indices, 0)
+                candidate['invalid'] = ~valid if not valid.all() else None
+                candidates.append(candidate)
+
+        for candidate in candidates:
+            gathered = self._gather_laser_pulses(raw_data, candidate)
+            if gathered.shape == laser_data.shape and np.array_equal(gathered, laser_data):
+                return candidate
+        self.log.debug('Extraction result can not be reproduced by slicing the raw data. '
+                       'Streaming extraction falls back to full extraction.')
+        return None
+
+    @staticmethod
+    def _gather_laser_pulses(raw_data, gather_index):
+        """
+        Extracts the laser pulses from raw data using a gather index created by
+        _create_laser_gather_index.
+
+        @param numpy.ndarray raw_data: the raw count data
+        @param dict gather_index: gather index created by _create_laser_gather_index
+        @return numpy.ndarray: 2D array of laser pulses. dim 0: laser number, dim 1: time bin
+        """
+        if gather_index['slice'] is not None:
+            return raw_data[:, gather_index['slice']].astype('int64')
+        laser_data = raw_data[gather_index['indices']].astype('int64', copy=False)
+        if gather_index['invalid'] is not None:
+            laser_data[gather_index['invalid']] = 0
+        return laser_data
+
     def _analyze_laser_pulses(self):
         # analyze pulses and get data points for signal array. Also check if extraction
         # worked (non-zero array returned).
@@ -1170,15 +1389,17 @@ class PulsedMeasurementLogic(GenericLogic):
             tmp_error = np.zeros(self.laser_data.shape[0])
         return tmp_signal, tmp_error
 
-    def _get_raw_data(self):
+    def _get_raw_data_snapshot(self):
         """
-        Get the raw count data from the fast counting hardware and perform sanity checks.
-        Also add recalled raw data to the newly received data.
-        @return tuple(numpy.ndarray, info_dict): The count data (1D for ungated, 2D for gated counter) and
-                                                 info_dict with keys 'elapsed_sweeps' and 'elapsed_time'
+        Get the raw count data from the fast counter hardware.
+        @return dict: raw data snapshot with keys 'fc_data' (numpy.ndarray), 'elapsed_sweeps',
+                      'elapsed_time', 'timestamp' (time.perf_counter() after readout) and
+                      'acquisition_duration' (time needed for readout in s)
         """
+        start = time.perf_counter()
         # get raw data from fast counter
-        fc_data = self.fastcounter().get_data_trace()
+        with self._fast_counter_lock:
+            fc_data = self.fastcounter().get_data_trace()
         if type(fc_data) == tuple and len(fc_data) == 2:  # if the hardware implement the new version of the interface
             fc_data, info_dict = fc_data
         else:
@@ -1195,6 +1416,28 @@ class PulsedMeasurementLogic(GenericLogic):
         else:
             elapsed_time = time.time() - self.__start_time
 
+        stop = time.perf_counter()
+        return {'fc_data': fc_data,
+                'elapsed_sweeps': elapsed_sweeps,
+                'elapsed_time': elapsed_time,
+                'timestamp': stop,
+                'acquisition_duration': stop - start}
+
+    def _get_raw_data(self, snapshot=None):
+        """
+        Get the raw count data from the fast counting hardware and perform sanity checks.
+        Also add recalled raw data to the newly received data.
+        @param dict snapshot: optional raw data snapshot (see _get_raw_data_snapshot). The fast
+                              counter is read if no snapshot is given.
+        @return tuple(numpy.ndarray, info_dict): The count data (1D for ungated, 2D for gated counter) and
+                                                 info_dict with keys 'elapsed_sweeps' and 'elapsed_time'
+        """
+        if snapshot is None:
+            snapshot = self._get_raw_data_snapshot()
+        fc_data = snapshot['fc_data']
+        elapsed_sweeps = snapshot['elapsed_sweeps']
+        elapsed_time = snapshot['elapsed_time']
+
         # add old raw data from previous measurements if necessary
         if self._saved_raw_data.get(self._recalled_raw_data_tag) is not None:
             # self.log.info('Found old saved raw data with tag "{0}".'
@@ -29,6 +29,8 @@ class Idle(SamplingBase):
     """
     Object representing an idle element (zero voltage)
     """
+    is_elementwise = True
+
     def __init__(self):
         pass
 
@@ -37,11 +39,16 @@ class Idle(SamplingBase):
         samples_arr = np.zeros(len(time_array))
         return samples_arr
 
+    @staticmethod
+    def get_sine_components():
+        return list()
+
 
 class DC(SamplingBase):
     """
     Object representing an DC element (constant voltage)
     """
+    is_elementwise = True
     params = OrderedDict()
     params['voltage'] = {'unit': 'V', 'init': 0.0, 'min': -np.inf, 'max': +np.inf, 'type': float}
 
@@ -61,11 +68,16 @@ class DC(SamplingBase):
         samples_arr = self._get_dc(time_array, self.voltage)
         return samples_arr
 
+    def get_sine_components(self):
+        # A constant is a sine with zero frequency and a phase of 90 degrees
+        return [(self.voltage, 0.0, np.pi / 2)]
+
 
 class Sin(SamplingBase):
     """
     Object representing a sine wave element
     """
+    is_elementwise = True
     params = OrderedDict()
     params['amplitude'] = {'unit': 'V', 'init': 0.0, 'min': 0.0, 'max': np.inf, 'type': float}
     params['frequency'] = {'unit': 'Hz', 'init': 2.87e9, 'min': 0.0, 'max': np.inf, 'type': float}
@@ -96,11 +108,15 @@ class Sin(SamplingBase):
         samples_arr = self._get_sine(time_array, self.amplitude, self.frequency, phase_rad)
         return samples_arr
 
+    def get_sine_components(self):
+        return [(self.amplitude, self.frequency, np.pi * self.phase / 180)]
+
 
 class DoubleSinSum(SamplingBase):
     """
     Object representing a double sine wave element (Superposition of two sine waves; NOT normalized)
     """
+    is_elementwise = True
     params = OrderedDict()
     params['amplitude_1'] = {'unit': 'V', 'init': 0.0, 'min': 0.0, 'max': np.inf, 'type': float}
     params['frequency_1'] = {'unit': 'Hz', 'init': 2.87e9, 'min': 0.0, 'max': np.inf, 'type': float}
@@ -154,11 +170,17 @@ class DoubleSinSum(SamplingBase):
         samples_arr += self._get_sine(time_array, self.amplitude_2, self.frequency_2, phase_rad)
         return samples_arr
 
+    def get_sine_components(self):
+        components = [(self.amplitude_1, self.frequency_1, np.pi * self.phase_1 / 180)]
+        components_2 = [(self.amplitude_2, self.frequency_2, np.pi * self.phase_2 / 180)]
+        return components + components_2
+
 
 class DoubleSinProduct(SamplingBase):
     """
     Object representing a double sine wave element (Product of two sine waves; NOT normalized)
     """
+    is_elementwise = True
     params = OrderedDict()
     params['amplitude_1'] = {'unit': 'V', 'init': 0.0, 'min': 0.0, 'max': np.inf, 'type': float}
     params['frequency_1'] = {'unit': 'Hz', 'init': 2.87e9, 'min': 0.0, 'max': np.inf, 'type': float}
@@ -212,12 +234,18 @@ class DoubleSinProduct(SamplingBase):
         samples_arr *= self._get_sine(time_array, self.amplitude_2, self.frequency_2, phase_rad)
         return samples_arr
 
+    def get_sine_components(self):
+        components = [(self.amplitude_1, self.frequency_1, np.pi * self.phase_1 / 180)]
+        components_2 = [(self.amplitude_2, self.frequency_2, np.pi * self.phase_2 / 180)]
+        return self._multiply_sine_components(components, components_2)
+
 
 class TripleSinSum(SamplingBase):
     """
     Object representing a linear combination of three sines
     (Superposition of three sine waves; NOT normalized)
     """
+    is_elementwise = True
     params = OrderedDict()
     params['amplitude_1'] = {'unit': 'V', 'init': 0.0, 'min': 0.0, 'max': np.inf, 'type': float}
     params['frequency_1'] = {'unit': 'Hz', 'init': 2.87e9, 'min': 0.0, 'max': np.inf, 'type': float}
@@ -292,12 +320,19 @@ class TripleSinSum(SamplingBase):
         samples_arr += self._get_sine(time_array, self.amplitude_3, self.frequency_3, phase_rad)
         return samples_arr
 
+    def get_sine_components(self):
+        components = [(self.amplitude_1, self.frequency_1, np.pi * self.phase_1 / 180)]
+        components_2 = [(self.amplitude_2, self.frequency_2, np.pi * self.phase_2 / 180)]
+        components_3 = [(self.amplitude_3, self.frequency_3, np.pi * self.phase_3 / 180)]
+        return components + components_2 + components_3
+
 
 class TripleSinProduct(SamplingBase):
     """
     Object representing a wave element composed of the product of three sines
     (Product of three sine waves; NOT normalized)
     """
+    is_elementwise = True
     params = OrderedDict()
     params['amplitude_1'] = {'unit': 'V', 'init': 0.0, 'min': 0.0, 'max': np.inf, 'type': float}
     params['frequency_1'] = {'unit': 'Hz', 'init': 2.87e9, 'min': 0.0, 'max': np.inf, 'type': float}
@@ -372,6 +407,13 @@ class TripleSinProduct(SamplingBase):
         samples_arr *= self._get_sine(time_array, self.amplitude_3, self.frequency_3, phase_rad)
         return samples_arr
 
+    def get_sine_components(self):
+        components = [(self.amplitude_1, self.frequency_1, np.pi * self.phase_1 / 180)]
+        components_2 = [(self.amplitude_2, self.frequency_2, np.pi * self.phase_2 / 180)]
+        components_3 = [(self.amplitude_3, self.frequency_3, np.pi * self.phase_3 / 180)]
+        components = self._multiply_sine_components(components, components_2)
+        return self._multiply_sine_components(components, components_3)
+
 
 class Chirp(SamplingBase):
     """
@@ -26,6 +26,7 @@ import sys
 import inspect
 import copy
 import logging
+import numpy as np
 from collections import OrderedDict
 
 
@@ -35,6 +36,10 @@ class SamplingBase:
     """
     params = OrderedDict()
     log = logging.getLogger(__name__)
+    # Flag indicating that each returned sample only depends on the corresponding time value and
+    # not on the time array as a whole (e.g. its length or first/last value). Elementwise sampling
+    # functions can be sampled for several PulseBlockElements with a single call of get_samples.
+    is_elementwise = False
 
     def __repr__(self):
         kwargs = []
@@ -67,6 +72,36 @@ class SamplingBase:
         hash_other = hash(tuple(hash_list))
         return hash_self == hash_other
 
+    def get_sine_components(self):
+        """
+        Optional decomposition of the sampling function into a sum of sine waves
+            sum_i(amplitude_i * sin(2*pi*frequency_i*t + phase_i))
+        Sampling functions providing this decomposition can be sampled by the lookup table based
+        fast sampling mode of EnsembleSampler without calling get_samples.
+
+        @return list: list of tuples (amplitude, frequency, phase) with phase in radians.
+                      None if the sampling function can not be decomposed.
+        """
+        return None
+
+    @staticmethod
+    def _multiply_sine_components(components_1, components_2):
+        """
+        Helper method to calculate the sine decomposition of the product of two sums of sines using
+            sin(a) * sin(b) = (sin(a - b + pi/2) + sin(a + b - pi/2)) / 2
+
+        @param list components_1: list of tuples (amplitude, frequency, phase)
+        @param list components_2: list of tuples (amplitude, frequency, phase)
+        @return list: list of tuples (amplitude, frequency, phase) of the product
+        """
+        components = list()
+        for amp_1, freq_1, phase_1 in components_1:
+            for amp_2, freq_2, phase_2 in components_2:
+                amplitude = amp_1 * amp_2 / 2
+                components.append((amplitude, freq_1 - freq_2, phase_1 - phase_2 + np.pi / 2))
+                components.append((amplitude, freq_1 + freq_2, phase_1 + phase_2 - np.pi / 2))
+        return components
+
     def get_dict_representation(self):
         dict_repr = dict()
         dict_repr['name'] = type(self).__name__
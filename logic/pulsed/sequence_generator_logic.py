@@ -25,6 +25,9 @@ import os
 import pickle
 import time
 import copy
+import json
+import shutil
+import hashlib
 import traceback
 
 from qtpy import QtCore
@@ -39,6 +42,8 @@ from logic.generic_logic import GenericLogic
 from logic.pulsed.pulse_objects import PulseBlock, PulseBlockEnsemble, PulseSequence
 from logic.pulsed.pulse_objects import PulseObjectGenerator, PulseBlockElement
 from logic.pulsed.sampling_functions import SamplingFunctions
+from logic.pulsed.ensemble_sampler import EnsembleSampler, ParallelEnsembleSampler
+from logic.pulsed.ensemble_sampler import run_length_encode_ensemble
 from interface.pulser_interface import SequenceOption
 
 
@@ -65,6 +70,20 @@ class SequenceGeneratorLogic(GenericLogic):
                                        default=os.path.join(get_home_dir(), 'saved_pulsed_assets'),
                                        missing='warn')
     _overhead_bytes = ConfigOption(name='overhead_bytes', default=0, missing='nothing')
+    # Optional directory to store sampled waveforms in as memory-mapped files. Useful for devices
+    # losing their waveform memory on restart.
+    _sample_cache_path = ConfigOption(name='sample_cache_path', default=None, missing='nothing')
+    # Number of worker processes used to sample the ensembles of a PulseSequence concurrently.
+    # A value of 1 (default) samples all ensembles one after another in the logic thread.
+    _sampling_processes = ConfigOption(name='sampling_processes', default=1, missing='nothing')
+    # Sample sine-based sampling functions in the rotating frame using lookup tables. Faster but
+    # not bit-identical to evaluating the sampling functions for each sample.
+    _sampling_lookup_tables = ConfigOption(name='sampling_lookup_tables',
+                                           default=False,
+                                           missing='nothing')
+    # Write purely digital ensembles in run-length encoded form (without sampling them) if the
+    # pulse generator supports it (see PulserInterface.supports_run_length_waveforms).
+    _run_length_sampling = ConfigOption(name='run_length_sampling', default=True, missing='nothing')
     # Optional additional paths to import from
     _additional_methods_import_path = ConfigOption(name='additional_predefined_methods_path',
                                                    default=None,
@@ -130,6 +149,13 @@ class SequenceGeneratorLogic(GenericLogic):
         # A flag indicating if sampling of a sequence is in progress
         self.__sequence_generation_in_progress = False
 
+        # Waveforms sampled previously. Keys are waveform names (without channel suffix) and items
+        # are dicts containing the sampling fingerprint, the created waveform names and the
+        # directory of the on-disk sample cache (or None).
+        self._waveform_cache = dict()
+        # Process pool to sample the ensembles of a sequence concurrently (if enabled)
+        self._parallel_sampler = None
+
         # Get instance of PulseObjectGenerator which takes care of collecting all predefined methods
         self._pog = None
 
@@ -138,6 +164,9 @@ class SequenceGeneratorLogic(GenericLogic):
         self._saved_pulse_blocks = OrderedDict()
         self._saved_pulse_block_ensembles = OrderedDict()
         self._saved_pulse_sequences = OrderedDict()
+        # Memoized element parameters (values) of each PulseBlock (keys are the block names).
+        # See _get_block_analysis.
+        self._block_analysis_cache = dict()
         return
 
     def on_activate(self):
@@ -194,6 +223,10 @@ class SequenceGeneratorLogic(GenericLogic):
         self._update_blocks_from_file()
         self._update_ensembles_from_file()
         self._update_sequences_from_file()
+        self._load_waveform_cache_from_file()
+
+        if self._sampling_processes > 1:
+            self._parallel_sampler = ParallelEnsembleSampler(max_workers=self._sampling_processes)
 
         # Get instance of PulseObjectGenerator which takes care of collecting all predefined methods
         self._pog = PulseObjectGenerator(sequencegeneratorlogic=self)
@@ -204,6 +237,9 @@ class SequenceGeneratorLogic(GenericLogic):
     def on_deactivate(self):
         """ Deinitialisation performed during deactivation of the module.
         """
+        if self._parallel_sampler is not None:
+            self._parallel_sampler.shutdown()
+            self._parallel_sampler = None
         return
 
     # @_saved_pulse_blocks.constructor
@@ -708,6 +744,7 @@ class SequenceGeneratorLogic(GenericLogic):
         @param PulseBlock block: PulseBlock instance to save
         """
         self._saved_pulse_blocks[block.name] = block
+        self._block_analysis_cache.pop(block.name, None)
         self._save_block_to_file(block)
         self.sigBlockDictUpdated.emit(self._saved_pulse_blocks)
         return
@@ -731,6 +768,7 @@ class SequenceGeneratorLogic(GenericLogic):
         # Delete from dict
         if name in self.saved_pulse_blocks:
             del (self._saved_pulse_blocks[name])
+        self._block_analysis_cache.pop(name, None)
 
         # Delete from disk
         filepath = os.path.join(self._assets_storage_dir, '{0}.block'.format(name))
@@ -1252,100 +1290,135 @@ class SequenceGeneratorLogic(GenericLogic):
             self.log.error('Ensemble to analyze must either be of type PulseBlockEnsemble or the '
                            'name of the ensemble. Returning empty dict')
             return dict()
+        return self._analyze_ensemble_elements(self._get_ensemble_elements(ensemble))
 
-        # Determine the right laser channel to choose. For gated counting it should be the gate
-        # channel instead of the laser trigger.
-        laser_channel = self.generation_parameters['gate_channel'] if self.generation_parameters[
-            'gate_channel'] else self.generation_parameters['laser_channel']
+    def _get_ensemble_elements(self, ensemble):
+        """
+        Expands the (memoized) element parameters of each block in a PulseBlockEnsemble to all
+        repetitions in the order they are occuring in the waveform later on.
 
-        # memorize the digital channel state of the previous element
-        tmp_digital_high = dict()
-        # memorize the laser_on flag of the previous element (in case of non-digital laser channel)
-        tmp_laser_on = False
+        @param PulseBlockEnsemble ensemble: The ensemble to expand
+        @return dict: element parameters as consumed by _analyze_ensemble_elements
+        """
         # Set of used analog and digital channels
         digital_channels = set()
         analog_channels = set()
-        # check for active channels and initialize tmp_digital_high/tmp_laser_on with the state of
-        # the very last element in the ensemble
+        # Channel states of the very last element in the ensemble. Used as state preceding the very
+        # first element.
+        last_digital_high = dict()
+        last_laser_on = False
         if len(ensemble) > 0:
             block = self.get_block(ensemble[0][0])
             digital_channels = block.digital_channels
             analog_channels = block.analog_channels
             block = self.get_block(ensemble[-1][0])
             if len(block) > 0:
-                tmp_digital_high = block[-1].digital_high.copy()
-                tmp_laser_on = block[-1].laser_on
+                last_digital_high = block[-1].digital_high.copy()
+                last_laser_on = block[-1].laser_on
             else:
-                tmp_digital_high = {chnl: False for chnl in digital_channels}
-                tmp_laser_on = False
+                last_digital_high = {chnl: False for chnl in digital_channels}
 
-        # dicts containing the bins where the digital channels are rising/falling
-        digital_rising_bins = {chnl: list() for chnl in digital_channels}
-        digital_falling_bins = {chnl: list() for chnl in digital_channels}
-        laser_rising_bins = list()
-        laser_falling_bins = list()
-
-        # Array to store the length in bins for all elements including repetitions in the order
+        # Expand the (memoized) element parameters of each block to all repetitions in the order
         # they are occuring in the waveform later on.
-        elements_length_bins = list()
-
-        # variables to keep track of the current timeframe
-        current_end_time = 0.0
-        current_start_bin = 0
-
-        # Loop through all blocks in the ensemble
+        element_durations = list()
+        element_laser_on = list()
+        element_digital_high = {chnl: list() for chnl in digital_channels}
         for block_name, reps in ensemble:
-            # Get the stored PulseBlock instance
-            block = self.get_block(block_name)
-
-            # Iterate over all repetitions of the current block
-            for rep_no in range(reps + 1):
-                # Iterate over the Block_Elements inside the current block
-                for element in block:
-                    # save bin position if a transition from low to high or vice versa has occurred
-                    # in a digital channel
-                    if tmp_digital_high != element.digital_high:
-                        for chnl, state in element.digital_high.items():
-                            if not tmp_digital_high[chnl] and state:
-                                digital_rising_bins[chnl].append(current_start_bin)
-                            elif tmp_digital_high[chnl] and not state:
-                                digital_falling_bins[chnl].append(current_start_bin)
-                        tmp_digital_high = element.digital_high.copy()
-
-                    if not laser_channel.startswith('d') and tmp_laser_on != element.laser_on:
-                        if not tmp_laser_on and element.laser_on:
-                            laser_rising_bins.append(current_start_bin)
-                        else:
-                            laser_falling_bins.append(current_start_bin)
-                        tmp_laser_on = element.laser_on
-
-                    # Calculate length of the current element with current repetition count in sec
-                    # and add this to the ideal end time for the sequence up until this point.
-                    current_end_time += element.init_length_s + rep_no * element.increment_s
-
-                    # Nearest possible match including the discretization in bins
-                    current_end_bin = int(np.rint(current_end_time * self.__sample_rate))
-
-                    # append current element length in discrete bins to temporary array
-                    elements_length_bins.append(current_end_bin - current_start_bin)
-
-                    # advance bin offset for next element
-                    current_start_bin = current_end_bin
-
-        elements_length_bins = np.array(elements_length_bins, dtype='int64')
-
-        # convert rising/falling indices to numpy.ndarrays. Remove duplicates.
-        for chnl in digital_channels:
-            digital_rising_bins[chnl] = sorted(set(digital_rising_bins[chnl]))
-            digital_falling_bins[chnl] = sorted(set(digital_falling_bins[chnl]))
-            digital_rising_bins[chnl] = np.array(digital_rising_bins[chnl], dtype='int64')
-            digital_falling_bins[chnl] = np.array(digital_falling_bins[chnl], dtype='int64')
+            block_analysis = self._get_block_analysis(self.get_block(block_name))
+            if len(block_analysis['init_length_s']) == 0:
+                continue
+            rep_no = np.repeat(np.arange(reps + 1, dtype='float64'),
+                               len(block_analysis['init_length_s']))
+            element_durations.append(np.tile(block_analysis['init_length_s'], reps + 1) +
+                                     rep_no * np.tile(block_analysis['increment_s'], reps + 1))
+            element_laser_on.append(np.tile(block_analysis['laser_on'], reps + 1))
+            for chnl, state_list in element_digital_high.items():
+                state_list.append(np.tile(block_analysis['digital_high'][chnl], reps + 1))
+
+        elements = dict()
+        if element_durations:
+            elements['durations'] = np.concatenate(element_durations)
+            elements['laser_on'] = np.concatenate(element_laser_on)
+        else:
+            elements['durations'] = np.zeros(0, dtype='float64')
+            elements['laser_on'] = np.zeros(0, dtype=bool)
+        elements['digital_high'] = {
+            chnl: np.concatenate(state_list) if state_list else np.zeros(0, dtype=bool)
+            for chnl, state_list in element_digital_high.items()}
+        elements['last_digital_high'] = last_digital_high
+        elements['last_laser_on'] = last_laser_on
+        elements['analog_channels'] = analog_channels
+        elements['digital_channels'] = digital_channels
+        return elements
+
+    @staticmethod
+    def _append_idle_element(elements, duration):
+        """
+        Appends an idle element (all channels low, laser off) to the element parameters returned
+        by _get_ensemble_elements. Equivalent to expanding the ensemble again after appending a
+        block consisting of such an element.
+
+        @param dict elements: element parameters as returned by _get_ensemble_elements
+        @param float duration: length of the idle element in seconds
+        @return dict: the new element parameters
+        """
+        elements = elements.copy()
+        elements['durations'] = np.append(elements['durations'], duration)
+        elements['laser_on'] = np.append(elements['laser_on'], False)
+        elements['digital_high'] = {chnl: np.append(states, False) for chnl, states in
+                                    elements['digital_high'].items()}
+        # The idle element is the last one now, i.e. it precedes the very first element
+        elements['last_digital_high'] = {chnl: False for chnl in elements['digital_high']}
+        elements['last_laser_on'] = False
+        return elements
+
+    def _analyze_ensemble_elements(self, elements):
+        """
+        Creates the information returned by analyze_block_ensemble from the element parameters of
+        an ensemble (see _get_ensemble_elements).
+
+        @param dict elements: element parameters as returned by _get_ensemble_elements
+        @return dict: see analyze_block_ensemble
+        """
+        # Determine the right laser channel to choose. For gated counting it should be the gate
+        # channel instead of the laser trigger.
+        laser_channel = self.generation_parameters['gate_channel'] if self.generation_parameters[
+            'gate_channel'] else self.generation_parameters['laser_channel']
+        analog_channels = elements['analog_channels']
+        digital_channels = elements['digital_channels']
+
+        if len(elements['durations']) > 0:
+            # Ideal end time of each element. The cumulative sum adds up the element durations in
+            # the same order as a loop would, resulting in the very same rounding.
+            element_end_times = np.cumsum(elements['durations'])
+            current_end_time = float(element_end_times[-1])
+            # Nearest possible match including the discretization in bins
+            element_end_bins = np.rint(element_end_times * self.__sample_rate).astype('int64')
+            elements_length_bins = np.diff(element_end_bins, prepend=0)
+            element_start_bins = element_end_bins - elements_length_bins
+        else:
+            current_end_time = 0.0
+            elements_length_bins = np.zeros(0, dtype='int64')
+            element_start_bins = np.zeros(0, dtype='int64')
+
+        # Determine the bins where the digital channels are rising/falling. Remove duplicates.
+        digital_rising_bins = dict()
+        digital_falling_bins = dict()
+        for chnl, states in elements['digital_high'].items():
+            rising_bins, falling_bins = self._get_flank_bins(
+                states=states,
+                initial_state=elements['last_digital_high'][chnl],
+                start_bins=element_start_bins)
+            digital_rising_bins[chnl] = rising_bins
+            digital_falling_bins[chnl] = falling_bins
         if laser_channel.startswith('d'):
             laser_rising_bins = digital_rising_bins[laser_channel]
             laser_falling_bins = digital_falling_bins[laser_channel]
         else:
-            laser_rising_bins = np.array(sorted(set(laser_rising_bins)), dtype='int64')
-            laser_falling_bins = np.array(sorted(set(laser_falling_bins)), dtype='int64')
+            laser_rising_bins, laser_falling_bins = self._get_flank_bins(
+                states=elements['laser_on'],
+                initial_state=elements['last_laser_on'],
+                start_bins=element_start_bins)
 
         return_dict = dict()
         return_dict['number_of_samples'] = np.sum(elements_length_bins)
@@ -1362,6 +1435,110 @@ class SequenceGeneratorLogic(GenericLogic):
         return_dict['laser_falling_bins'] = laser_falling_bins
         return return_dict
 
+    def _get_block_analysis(self, block):
+        """
+        Extracts the parameters of all PulseBlockElements in a PulseBlock as numpy arrays.
+        The result is memoized for each block and invalidated when the block is saved or deleted.
+
+        @param PulseBlock block: The PulseBlock instance to analyze
+        @return dict: arrays of init_length_s, increment_s and laser_on for each element and dict
+                      of digital_high arrays for each digital channel (keys)
+        """
+        block_analysis = self._block_analysis_cache.get(block.name)
+        if block_analysis is not None and block_analysis['block'] is block:
+            return block_analysis
+
+        block_analysis = dict()
+        block_analysis['block'] = block
+        block_analysis['init_length_s'] = np.array([elem.init_length_s for elem in block],
+                                                   dtype='float64')
+        block_analysis['increment_s'] = np.array([elem.increment_s for elem in block],
+                                                 dtype='float64')
+        block_analysis['laser_on'] = np.array([elem.laser_on for elem in block], dtype=bool)
+        block_analysis['digital_high'] = {
+            chnl: np.array([elem.digital_high[chnl] for elem in block], dtype=bool) for chnl in
+            block.digital_channels}
+        self._block_analysis_cache[block.name] = block_analysis
+        return block_analysis
+
+    def _get_flank_bins(self, states, initial_state, start_bins):
+        """
+        Determines the rising and falling flank positions of a channel from the channel state of
+        each element.
+
+        @param numpy.ndarray states: boolean channel state of each element in chronological order
+        @param bool initial_state: channel state before the first element
+        @param numpy.ndarray start_bins: start bin of each element in chronological order
+        @return (numpy.ndarray, numpy.ndarray): sorted unique rising and falling flank bins
+        """
+        previous_states = np.empty(len(states), dtype=bool)
+        if len(states) > 0:
+            previous_states[0] = initial_state
+            previous_states[1:] = states[:-1]
+        rising_bins = self._sorted_unique(start_bins[states & ~previous_states])
+        falling_bins = self._sorted_unique(start_bins[~states & previous_states])
+        return rising_bins, falling_bins
+
+    @staticmethod
+    def _sorted_unique(bins):
+        """
+        Sorts an integer array and removes duplicates. Equivalent to numpy.unique but considerably
+        faster for the large, almost sorted flank arrays of long sequences.
+
+        @param numpy.ndarray bins: 1D integer array
+        @return numpy.ndarray: sorted array without duplicates
+        """
+        bins = np.sort(bins, kind='stable')
+        if len(bins) < 2:
+            return bins
+        unique_mask = np.empty(len(bins), dtype=bool)
+        unique_mask[0] = True
+        np.not_equal(bins[1:], bins[:-1], out=unique_mask[1:])
+        return bins[unique_mask]
+
+    @staticmethod
+    def _repeat_step_flank_bins(rising_bins, falling_bins, repetitions, ensemble_bins,
+                                starting_bin, previous_state, first_state, last_state):
+        """
+        Expands the rising and falling flank positions of a single ensemble to all repetitions of a
+        sequence step. Transitions from the previous sequence step into the first repetition are
+        taken into account.
+
+        @param numpy.ndarray rising_bins: rising flank bins of the ensemble
+        @param numpy.ndarray falling_bins: falling flank bins of the ensemble
+        @param int repetitions: number of times the ensemble is played in this step
+        @param int ensemble_bins: number of samples of the ensemble
+        @param int starting_bin: bin offset of the sequence step
+        @param bool previous_state: channel state at the end of the previous sequence step
+        @param bool first_state: channel state of the first element in the ensemble
+        @param bool last_state: channel state of the last element in the ensemble
+        @return (numpy.ndarray, numpy.ndarray): rising and falling flank bins of the step
+        """
+        if repetitions < 1:
+            return np.empty(0, dtype='int64'), np.empty(0, dtype='int64')
+
+        # First repetition. Pay special attention to the transition from the previous step.
+        first_rising_bins = rising_bins + starting_bin
+        first_falling_bins = falling_bins + starting_bin
+        if previous_state != last_state:
+            if previous_state and not first_state:
+                first_falling_bins = np.append(starting_bin, first_falling_bins)
+            elif not previous_state and first_state:
+                first_rising_bins = np.append(starting_bin, first_rising_bins)
+            elif previous_state == first_state:
+                if last_state:
+                    first_falling_bins = first_falling_bins[1:]
+                else:
+                    first_rising_bins = first_rising_bins[1:]
+
+        # All other repetitions are just shifted copies
+        bin_offsets = starting_bin + ensemble_bins * np.arange(1, repetitions, dtype='int64')
+        step_rising_bins = np.concatenate(
+            (first_rising_bins, (bin_offsets[:, np.newaxis] + rising_bins).ravel()))
+        step_falling_bins = np.concatenate(
+            (first_falling_bins, (bin_offsets[:, np.newaxis] + falling_bins).ravel()))
+        return step_rising_bins, step_falling_bins
+
     def analyze_sequence(self, sequence):
         """
         This helper method runs through each step of a PulseSequence object and extracts
@@ -1439,6 +1616,8 @@ class SequenceGeneratorLogic(GenericLogic):
         digital_rising_bins = {chnl: list() for chnl in digital_channels}
         digital_falling_bins = {chnl: list() for chnl in digital_channels}
         ensemble_name_set = set()
+        # Analysis results (values) of each ensemble (keys) used in the sequence
+        ensemble_infos = dict()
         # Initialize the last channel state of the first sequence step as last channel state in the
         # entire sequence.
         step_last_digital_state = last_digital_channel_state
@@ -1448,8 +1627,11 @@ class SequenceGeneratorLogic(GenericLogic):
             is_finite = seq_step.repetitions >= 0
             # Get the PulseBlockEnsemble instance associated with this sequence step
             ensemble = self.get_ensemble(seq_step.ensemble)
-            # Get information about the current PulseBlockEnsemble instance
-            info_dict = self.analyze_block_ensemble(ensemble=ensemble)
+            # Get information about the current PulseBlockEnsemble instance. Sequences usually
+            # re-use the same ensembles in many steps, so analyze each ensemble only once.
+            if ensemble.name not in ensemble_infos:
+                ensemble_infos[ensemble.name] = self.analyze_block_ensemble(ensemble=ensemble)
+            info_dict = ensemble_infos[ensemble.name]
             # Set tmp helper variables
             ensemble_name_set.add(ensemble.name)
             reps = seq_step.repetitions + 1
@@ -1480,44 +1662,32 @@ class SequenceGeneratorLogic(GenericLogic):
                     # Append rising/falling bin arrays for each step to a list in order to merge
                     # them all later on into a single array. This is more efficient than having
                     # an intermediate array.
-                    # Pay special attention to transitions from one sequence step to another.
-                    for iteration in range(reps):
-                        bin_offset = iteration * ens_bins + starting_bin
-                        rising_bins = info_dict['digital_rising_bins'][chnl] + bin_offset
-                        falling_bins = info_dict['digital_falling_bins'][chnl] + bin_offset
-                        if iteration == 0 and prev_step_digital_state[chnl] != step_last_digital_state[chnl]:
-                            if prev_step_digital_state[chnl] and not step_first_digital_state[chnl]:
-                                falling_bins = np.append(bin_offset, falling_bins)
-                            elif not prev_step_digital_state[chnl] and step_first_digital_state[chnl]:
-                                rising_bins = np.append(bin_offset, rising_bins)
-                            elif prev_step_digital_state[chnl] == step_first_digital_state[chnl]:
-                                if step_last_digital_state[chnl]:
-                                    falling_bins = falling_bins[1:]
-                                else:
-                                    rising_bins = rising_bins[1:]
-
-                        digital_rising_bins[chnl].append(rising_bins)
-                        digital_falling_bins[chnl].append(falling_bins)
+                    rising_bins, falling_bins = self._repeat_step_flank_bins(
+                        rising_bins=info_dict['digital_rising_bins'][chnl],
+                        falling_bins=info_dict['digital_falling_bins'][chnl],
+                        repetitions=reps,
+                        ensemble_bins=ens_bins,
+                        starting_bin=starting_bin,
+                        previous_state=prev_step_digital_state[chnl],
+                        first_state=step_first_digital_state[chnl],
+                        last_state=step_last_digital_state[chnl])
+                    digital_rising_bins[chnl].append(rising_bins)
+                    digital_falling_bins[chnl].append(falling_bins)
 
                 # Append laser_bins arrays with bin offsets for each repetition analogous to the
                 # digital channels above.
                 if not laser_channel.startswith('d'):
-                    for iteration in range(reps):
-                        bin_offset = iteration * ens_bins + starting_bin
-                        rising_bins = info_dict['laser_rising_bins'] + bin_offset
-                        falling_bins = info_dict['laser_falling_bins'] + bin_offset
-                        if iteration == 0 and prev_step_laser_on_state != step_last_laser_on_state:
-                            if prev_step_laser_on_state and not step_first_laser_on_state:
-                                falling_bins = np.append(bin_offset, falling_bins)
-                            elif not prev_step_laser_on_state and step_first_laser_on_state:
-                                rising_bins = np.append(bin_offset, rising_bins)
-                            elif prev_step_laser_on_state == step_first_laser_on_state:
-                                if step_last_laser_on_state:
-                                    falling_bins = falling_bins[1:]
-                                else:
-                                    rising_bins = rising_bins[1:]
-                        laser_rising_bins.append(rising_bins)
-                        laser_falling_bins.append(falling_bins)
+                    rising_bins, falling_bins = self._repeat_step_flank_bins(
+                        rising_bins=info_dict['laser_rising_bins'],
+                        falling_bins=info_dict['laser_falling_bins'],
+                        repetitions=reps,
+                        ensemble_bins=ens_bins,
+                        starting_bin=starting_bin,
+                        previous_state=prev_step_laser_on_state,
+                        first_state=step_first_laser_on_state,
+                        last_state=step_last_laser_on_state)
+                    laser_rising_bins.append(rising_bins)
+                    laser_falling_bins.append(falling_bins)
 
                 # Increment the current starting bin offset for the next sequence step
                 starting_bin += ens_bins * reps
@@ -1525,11 +1695,11 @@ class SequenceGeneratorLogic(GenericLogic):
         # Concatenate all bin arrays in the respective lists to a single large array.
         for channel in digital_channels:
             if digital_rising_bins[channel]:
-                digital_rising_bins[channel] = np.unique(np.concatenate(digital_rising_bins[channel]))
+                digital_rising_bins[channel] = self._sorted_unique(np.concatenate(digital_rising_bins[channel]))
             else:
                 digital_rising_bins[channel] = np.empty(0, dtype='int64')
             if digital_falling_bins[channel]:
-                digital_falling_bins[channel] = np.unique(np.concatenate(digital_falling_bins[channel]))
+                digital_falling_bins[channel] = self._sorted_unique(np.concatenate(digital_falling_bins[channel]))
             else:
                 digital_falling_bins[channel] = np.empty(0, dtype='int64')
 
@@ -1537,8 +1707,8 @@ class SequenceGeneratorLogic(GenericLogic):
             laser_rising_bins = digital_rising_bins[laser_channel]
             laser_falling_bins = digital_falling_bins[laser_channel]
         else:
-            laser_rising_bins = np.unique(np.concatenate(laser_rising_bins)) if laser_rising_bins else np.empty(0, dtype='int64')
-            laser_falling_bins = np.unique(np.concatenate(laser_falling_bins)) if laser_falling_bins else np.empty(0, dtype='int64')
+            laser_rising_bins = self._sorted_unique(np.concatenate(laser_rising_bins)) if laser_rising_bins else np.empty(0, dtype='int64')
+            laser_falling_bins = self._sorted_unique(np.concatenate(laser_falling_bins)) if laser_falling_bins else np.empty(0, dtype='int64')
 
         # Sort out trailing or leading incomplete laser pulse
         while len(laser_rising_bins) != len(laser_falling_bins):
@@ -1647,9 +1817,10 @@ class SequenceGeneratorLogic(GenericLogic):
 
         This method is creating the actual samples (voltages and logic states) for each time step
         of the analog and digital channels specified in the PulseBlockEnsemble.
-        Therefore it iterates through all blocks, repetitions and elements of the ensemble and
-        calculates the exact voltages (float64) according to the specified math_function. The
-        samples are later on stored inside a float32 array.
+        Therefore all blocks, repetitions and elements of the ensemble are flattened into an
+        EnsembleSampler which calculates the exact voltages (float64) according to the specified
+        math_function. Elements sharing the same math_function are sampled together in a single
+        vectorized call. The samples are later on stored inside a float32 array.
         So each element is calculated with high precision (float64) and then down-converted to
         float32 to be stored.
 
@@ -1662,6 +1833,15 @@ class SequenceGeneratorLogic(GenericLogic):
         In other words: The whole sample arrays are never created at any time. This results in more
         function calls and general overhead causing much longer time to complete.
 
+        Sampling and writing is skipped if the same waveform has already been created from an
+        identical ensemble with identical pulse generator settings and is still present on the
+        device. If the ConfigOption "sample_cache_path" is set, the samples are also stored on disk
+        and are written from there instead of being sampled again (e.g. after a device restart).
+
+        Purely digital ensembles are not sampled at all if the pulse generator accepts run-length
+        encoded waveforms (edge based devices, see PulserInterface.supports_run_length_waveforms).
+        Instead the runs of constant channel states are created directly from the elements.
+
         In addition the pulse_block_ensemble gets analyzed and important parameters used during
         sampling get stored in the ensemble object "sampling_information" attribute.
         It is a dictionary containing:
@@ -1690,14 +1870,108 @@ class SequenceGeneratorLogic(GenericLogic):
         # Set the waveform name (excluding the device specific channel naming suffix, i.e. '_ch1')
         waveform_name = name_tag if name_tag else ensemble.name
 
-        # check for old waveforms associated with the ensemble and delete them from pulse generator.
-        self._delete_waveform_by_nametag(waveform_name)
-
         # Take current time
         start_time = time.time()
 
+        # get important parameters from the ensemble and extend it to match the waveform
+        # granularity if necessary
+        ensemble_info = self._prepare_ensemble_for_sampling(ensemble)
+
+        # Check if the very same waveform has already been sampled with identical settings and is
+        # still present on the device. If so, skip sampling and writing altogether.
+        fingerprint = self._get_sampling_fingerprint(ensemble, offset_bin)
+        cache_entry = self._waveform_cache.get(waveform_name)
+        if cache_entry is not None and cache_entry['fingerprint'] != fingerprint:
+            self._remove_sample_cache(waveform_name)
+            cache_entry = None
+
+        if cache_entry is not None and set(cache_entry['waveforms']).issubset(
+                self.sampled_waveforms):
+            self.log.debug('Waveform "{0}" already present on device. Sampling skipped.'
+                           ''.format(waveform_name))
+            written_waveforms = set(cache_entry['waveforms'])
+        else:
+            # check for old waveforms associated with the ensemble and delete them from pulse
+            # generator.
+            self._delete_waveform_by_nametag(waveform_name)
+
+            # Write the samples from the on-disk sample cache if possible. Sample otherwise.
+            written_waveforms = None
+            if cache_entry is not None and cache_entry['sample_cache_dir']:
+                self.log.debug('Writing waveform "{0}" from sample cache.'.format(waveform_name))
+                written_waveforms = self._write_waveform_from_sample_cache(
+                    waveform_name=waveform_name,
+                    ensemble_info=ensemble_info,
+                    sample_cache_dir=cache_entry['sample_cache_dir'])
+                if written_waveforms is None:
+                    self._remove_sample_cache(waveform_name)
+                    self._delete_waveform_by_nametag(waveform_name)
+                    cache_entry = None
+            if written_waveforms is None:
+                written_waveforms = self._sample_ensemble_to_device(
+                    ensemble=ensemble,
+                    ensemble_info=ensemble_info,
+                    waveform_name=waveform_name,
+                    offset_bin=offset_bin,
+                    fingerprint=fingerprint)
+
+            if written_waveforms is None:
+                self._remove_sample_cache(waveform_name)
+                if not self.__sequence_generation_in_progress:
+                    self.module_state.unlock()
+                self.sigAvailableWaveformsUpdated.emit(self.sampled_waveforms)
+                self.sigSampleEnsembleComplete.emit(None)
+                return -1, list(), dict()
+
+            # Remember the created waveforms in the cache
+            if cache_entry is None:
+                sample_cache_dir = self._get_sample_cache_dir(fingerprint)
+                if sample_cache_dir is not None and not os.path.isdir(sample_cache_dir):
+                    sample_cache_dir = None
+                cache_entry = {'fingerprint': fingerprint, 'sample_cache_dir': sample_cache_dir}
+            cache_entry['waveforms'] = natural_sort(written_waveforms)
+            self._waveform_cache[waveform_name] = cache_entry
+            self._save_waveform_cache_to_file()
+
+        # if the rotating frame should be preserved (default) increment the offset counter for the
+        # next ensemble.
+        if ensemble.rotating_frame:
+            offset_bin += ensemble_info['number_of_samples']
+
+        # Save sampling related parameters to the sampling_information container within the
+        # PulseBlockEnsemble.
+        # This step is only performed if the resulting waveforms are named by the PulseBlockEnsemble
+        # and not by a sequence nametag
+        if waveform_name == ensemble.name:
+            ensemble.sampling_information = dict()
+            ensemble.sampling_information.update(ensemble_info)
+            ensemble.sampling_information['pulse_generator_settings'] = self.pulse_generator_settings
+            ensemble.sampling_information['waveforms'] = natural_sort(written_waveforms)
+            self.save_ensemble(ensemble)
+
+        self.log.info('Time needed for sampling and writing PulseBlockEnsemble {0} to device: {1} sec'
+                      ''.format(ensemble.name, int(np.rint(time.time() - start_time))))
+        if ensemble_info['number_of_samples'] == 0:
+            self.log.warning('Empty waveform (0 samples) created from PulseBlockEnsemble "{0}".'
+                             ''.format(ensemble.name))
+        if not self.__sequence_generation_in_progress:
+            self.module_state.unlock()
+        self.sigAvailableWaveformsUpdated.emit(self.sampled_waveforms)
+        self.sigSampleEnsembleComplete.emit(ensemble)
+        return offset_bin, natural_sort(written_waveforms), ensemble_info
+
+    def _prepare_ensemble_for_sampling(self, ensemble):
+        """
+        Analyzes a PulseBlockEnsemble prior to sampling. If the number of samples does not fulfil
+        the waveform length step constraint of the pulse generator, an idle block is appended to
+        the ensemble.
+
+        @param PulseBlockEnsemble ensemble: The ensemble to prepare for sampling
+        @return dict: information about the ensemble returned by analyze_block_ensemble
+        """
         # get important parameters from the ensemble
-        ensemble_info = self.analyze_block_ensemble(ensemble)
+        elements = self._get_ensemble_elements(ensemble)
+        ensemble_info = self._analyze_ensemble_elements(elements)
 
         # Make sure the length of the channel is a multiple of the step size.
         # This is done by appending an idle block
@@ -1726,8 +2000,9 @@ class SequenceGeneratorLogic(GenericLogic):
             self.save_block(idle_extension)
             self.save_ensemble(ensemble)
 
-            # get important parameters from the ensemble
-            ensemble_info = self.analyze_block_ensemble(ensemble)
+            # Parameters of the extended ensemble without expanding all blocks again
+            elements = self._append_idle_element(elements, pb_element.init_length_s)
+            ensemble_info = self._analyze_ensemble_elements(elements)
             if ensemble_info['number_of_samples'] != target_total_samples:
                 self.log.error('Expanding the PulseBlockEnsemble to match the waveform granularity '
                                'has failed.\nTarget number of samples was {0:d}.\nfinal number of '
@@ -1737,7 +2012,327 @@ class SequenceGeneratorLogic(GenericLogic):
             else:
                 self.log.warn('Extending waveform {0} by {2} bins. New length {1}.'.format(
                     ensemble.name, ensemble_info['number_of_samples'], extension_samples))
+        return ensemble_info
+
+    def _sample_ensemble_to_device(self, ensemble, ensemble_info, waveform_name, offset_bin,
+                                   fingerprint):
+        """
+        Samples a PulseBlockEnsemble chunk by chunk and writes the samples to the pulse generator.
+        If a sample cache directory is configured, the samples are also stored on disk.
+
+        @param PulseBlockEnsemble ensemble: The ensemble to sample
+        @param dict ensemble_info: information about the ensemble returned by analyze_block_ensemble
+        @param str waveform_name: name of the waveform to create (without channel suffix)
+        @param int offset_bin: time offset in bins to start sampling at (rotating frame)
+        @param str fingerprint: sampling fingerprint of the ensemble
+
+        @return set: set of created waveform names. None if sampling or writing has failed.
+        """
+        # Edge based pulse generators get purely digital ensembles without sampling them
+        if self._use_run_length_sampling(ensemble_info):
+            return self._write_run_length_waveform(ensemble=ensemble,
+                                                   ensemble_info=ensemble_info,
+                                                   waveform_name=waveform_name)
+
+        # Use the samples calculated in a worker process if this ensemble has been scheduled for
+        # parallel sampling (see sample_pulse_sequence).
+        if self._parallel_sampler is not None and self._parallel_sampler.has_job(fingerprint):
+            written_waveforms = self._write_waveform_from_parallel_sampler(
+                ensemble=ensemble,
+                ensemble_info=ensemble_info,
+                waveform_name=waveform_name,
+                fingerprint=fingerprint)
+            if written_waveforms is not None:
+                return written_waveforms
+            self._delete_waveform_by_nametag(waveform_name)
+
+        # Determine the size of the sample arrays to be written as a whole.
+        chunk_length = self._get_chunk_length(ensemble_info)
+
+        # Memory-mapped sample files to store the samples on disk (if enabled)
+        sample_cache_files = self._create_sample_cache(fingerprint, ensemble_info)
+
+        # Flatten the ensemble into the vectorized sampling engine
+        sampler = EnsembleSampler(**self._get_sampler_kwargs(ensemble, ensemble_info, offset_bin))
+
+        # set of written waveform names on the device
+        written_waveforms = set()
+        # Sample and write the ensemble chunk by chunk. The sampler re-uses two preallocated sets
+        # of sample arrays and samples the next chunk in a background thread while the current
+        # chunk is written to the device.
+        chunks = sampler.iterate_chunks(chunk_length=chunk_length,
+                                        analog_channels=ensemble_info['analog_channels'],
+                                        digital_channels=ensemble_info['digital_channels'],
+                                        prefetch=True)
+        try:
+            for start_bin, analog_samples, digital_samples in chunks:
+                array_length = min(chunk_length, ensemble_info['number_of_samples'] - start_bin)
+                if sample_cache_files:
+                    for chnl, samples in analog_samples.items():
+                        sample_cache_files[chnl][start_bin:start_bin + array_length] = samples
+                    for chnl, samples in digital_samples.items():
+                        sample_cache_files[chnl][start_bin:start_bin + array_length] = samples
+
+                # Set first/last chunk flags
+                is_first_chunk = start_bin == 0
+                is_last_chunk = start_bin + array_length == ensemble_info['number_of_samples']
+                written_samples, wfm_list = self.pulsegenerator().write_waveform(
+                    name=waveform_name,
+                    analog_samples=analog_samples,
+                    digital_samples=digital_samples,
+                    is_first_chunk=is_first_chunk,
+                    is_last_chunk=is_last_chunk,
+                    total_number_of_samples=ensemble_info['number_of_samples'])
+
+                # Update written waveforms set
+                written_waveforms.update(wfm_list)
+
+                # check if write process was successful
+                if written_samples != array_length:
+                    self.log.error('Sampling of ensemble "{0}" failed. Write to device was '
+                                   'unsuccessful.\nThe number of actually written samples ({1:d}) '
+                                   'does not match the number of samples staged to write ({2:d}).'
+                                   ''.format(ensemble.name, written_samples, array_length))
+                    written_waveforms = None
+                    break
+        except MemoryError:
+            self.log.error('Sampling of PulseBlockEnsemble "{0}" failed due to a MemoryError.\n'
+                           'The sample array needed is too large to allocate in memory.\n'
+                           'Try using the overhead_bytes ConfigOption to limit memory usage.'
+                           ''.format(ensemble.name))
+            written_waveforms = None
+        finally:
+            # Stop the sampling thread
+            chunks.close()
+
+        if written_waveforms is None:
+            if sample_cache_files:
+                # Release the memory maps before removing the incomplete files
+                sample_cache_files.clear()
+                self._discard_sample_cache_dir(self._get_sample_cache_dir(fingerprint))
+            return None
+
+        if sample_cache_files:
+            for samples in sample_cache_files.values():
+                samples.flush()
+        return written_waveforms
+
+    def _use_run_length_sampling(self, ensemble_info):
+        """
+        Checks if an ensemble is written in run-length encoded form instead of being sampled.
+        This is the case for purely digital ensembles if the pulse generator supports it and the
+        ConfigOption run_length_sampling is not set to False.
+
+        @param dict ensemble_info: information about the ensemble returned by analyze_block_ensemble
+        @return bool: True if write_run_length_waveform of the pulse generator is to be used
+        """
+        if not self._run_length_sampling or ensemble_info['analog_channels']:
+            return False
+        if ensemble_info['number_of_samples'] == 0:
+            return False
+        return bool(self.pulsegenerator().supports_run_length_waveforms())
+
+    def _write_run_length_waveform(self, ensemble, ensemble_info, waveform_name):
+        """
+        Writes a purely digital PulseBlockEnsemble to the pulse generator as runs of constant
+        channel states created directly from the PulseBlockElements (no samples are created).
+
+        @param PulseBlockEnsemble ensemble: The ensemble to write
+        @param dict ensemble_info: information about the ensemble returned by analyze_block_ensemble
+        @param str waveform_name: name of the waveform to create (without channel suffix)
+
+        @return set: set of created waveform names. None if writing has failed.
+        """
+        durations, states = run_length_encode_ensemble(
+            block_list=[(self.get_block(block_name).element_list, reps) for block_name, reps in
+                        ensemble.block_list],
+            elements_length_bins=ensemble_info['elements_length_bins'],
+            digital_channels=ensemble_info['digital_channels'])
+        self.log.debug('Writing waveform "{0}" as {1:d} runs of constant digital states.'
+                       ''.format(waveform_name, len(durations)))
+
+        written_samples, wfm_list = self.pulsegenerator().write_run_length_waveform(
+            name=waveform_name,
+            durations=durations,
+            states=states,
+            digital_channels=natural_sort(ensemble_info['digital_channels']))
+        if written_samples != ensemble_info['number_of_samples']:
+            self.log.error('Writing PulseBlockEnsemble "{0}" in run-length encoded form was '
+                           'unsuccessful.\nThe number of actually written samples ({1:d}) does '
+                           'not match the number of samples of the ensemble ({2:d}).'
+                           ''.format(ensemble.name, written_samples,
+                                     ensemble_info['number_of_samples']))
+            return None
+        return set(wfm_list)
+
+    def _write_waveform_from_parallel_sampler(self, ensemble, ensemble_info, waveform_name,
+                                              fingerprint):
+        """
+        Waits for the samples of an ensemble calculated by a worker process and writes them to the
+        pulse generator (and to the on-disk sample cache if enabled).
+
+        @param PulseBlockEnsemble ensemble: The sampled ensemble
+        @param dict ensemble_info: information about the ensemble returned by analyze_block_ensemble
+        @param str waveform_name: name of the waveform to create (without channel suffix)
+        @param str fingerprint: sampling fingerprint of the ensemble (job identifier)
+
+        @return set: set of created waveform names. None if sampling or writing has failed.
+        """
+        try:
+            samples = self._parallel_sampler.get_samples(fingerprint)
+        except Exception:
+            self.log.warning('Parallel sampling of PulseBlockEnsemble "{0}" failed. Sampling it '
+                             'in the logic thread instead.'.format(ensemble.name))
+            self.log.debug('{0!s}'.format(traceback.format_exc()))
+            self._parallel_sampler.release(fingerprint)
+            return None
+
+        sample_cache_files = self._create_sample_cache(fingerprint, ensemble_info)
+        for chnl, cache_file in sample_cache_files.items():
+            cache_file[:] = samples[chnl]
+            cache_file.flush()
+        sample_cache_files.clear()
+
+        written_waveforms = self._write_waveform_from_samples(waveform_name=waveform_name,
+                                                              ensemble_info=ensemble_info,
+                                                              samples=samples)
+        # Drop all references to the shared memory before releasing it
+        del samples
+        self._parallel_sampler.release(fingerprint)
+        return written_waveforms
+
+    def _get_sampler_kwargs(self, ensemble, ensemble_info, offset_bin):
+        """
+        Collects all parameters needed to create an EnsembleSampler instance for the given
+        ensemble. The returned dict can be pickled in order to sample in another process.
+
+        @param PulseBlockEnsemble ensemble: The ensemble to sample
+        @param dict ensemble_info: information about the ensemble returned by analyze_block_ensemble
+        @param int offset_bin: time offset in bins to start sampling at (rotating frame)
+        @return dict: keyword arguments for EnsembleSampler
+        """
+        return {'block_list': [(self.get_block(block_name).element_list, reps) for
+                               block_name, reps in ensemble.block_list],
+                'elements_length_bins': ensemble_info['elements_length_bins'],
+                'analog_amplitudes': dict(self.__analog_levels[0]),
+                'sample_rate': self.__sample_rate,
+                'rotating_frame': ensemble.rotating_frame,
+                'offset_bin': offset_bin,
+                'use_lookup_tables': self._sampling_lookup_tables}
+
+    def _schedule_parallel_sampling(self, sequence):
+        """
+        Registers all ensembles of a PulseSequence that need to be sampled as jobs of the parallel
+        sampler and starts sampling them in the worker processes. The time offsets (offset_bin) of
+        each sequence step are determined in advance in the same way sample_pulse_sequence does.
+
+        @param PulseSequence sequence: The sequence that is about to be sampled
+        """
+        sampled_waveforms = set(self.sampled_waveforms)
+        offset_bin = 0
+        for step_index, seq_step in enumerate(sequence):
+            ensemble = self.get_ensemble(seq_step.ensemble)
+            if sequence.rotating_frame:
+                name_tag = seq_step.ensemble + '_' + str(step_index).zfill(3)
+            else:
+                name_tag = seq_step.ensemble
+                offset_bin = 0
+                # Ensembles already sampled will be skipped by sample_pulse_sequence
+                if ensemble.sampling_information and ensemble.sampling_information[
+                        'pulse_generator_settings'] == self.pulse_generator_settings:
+                    continue
+
+            ensemble_info = self._prepare_ensemble_for_sampling(ensemble)
+            fingerprint = self._get_sampling_fingerprint(ensemble, offset_bin)
+            cache_entry = self._waveform_cache.get(name_tag)
+            if self._use_run_length_sampling(ensemble_info):
+                # Nothing to sample in advance
+                pass
+            elif cache_entry is None or cache_entry['fingerprint'] != fingerprint or not (
+                    cache_entry['sample_cache_dir'] or
+                    sampled_waveforms.issuperset(cache_entry['waveforms'])):
+                self._parallel_sampler.add_job(
+                    job_id=fingerprint,
+                    sampler_kwargs=self._get_sampler_kwargs(ensemble, ensemble_info, offset_bin),
+                    channels=ensemble_info['channel_set'],
+                    number_of_samples=ensemble_info['number_of_samples'],
+                    chunk_length=self._get_chunk_length(ensemble_info))
+
+            if ensemble.rotating_frame:
+                offset_bin += ensemble_info['number_of_samples']
+        self._parallel_sampler.start()
+        return
+
+    def _write_waveform_from_sample_cache(self, waveform_name, ensemble_info, sample_cache_dir):
+        """
+        Writes a waveform to the pulse generator from samples stored on disk by a previous call of
+        _sample_ensemble_to_device.
+
+        @param str waveform_name: name of the waveform to create (without channel suffix)
+        @param dict ensemble_info: information about the ensemble returned by analyze_block_ensemble
+        @param str sample_cache_dir: directory containing the memory-mapped sample files
+
+        @return set: set of created waveform names. None if writing has failed.
+        """
+        try:
+            cached_samples = {chnl: np.load(os.path.join(sample_cache_dir, '{0}.npy'.format(chnl)),
+                                            mmap_mode='r')
+                              for chnl in ensemble_info['channel_set']}
+        except (OSError, ValueError):
+            self.log.error('Unable to read cached samples of waveform "{0}" from "{1}".'
+                           ''.format(waveform_name, sample_cache_dir))
+            return None
+
+        return self._write_waveform_from_samples(waveform_name=waveform_name,
+                                                 ensemble_info=ensemble_info,
+                                                 samples=cached_samples)
+
+    def _write_waveform_from_samples(self, waveform_name, ensemble_info, samples):
+        """
+        Writes a waveform to the pulse generator from already sampled arrays (e.g. memory-mapped
+        files or shared memory). The write is split into chunks according to the ConfigOption
+        overhead_bytes.
 
+        @param str waveform_name: name of the waveform to create (without channel suffix)
+        @param dict ensemble_info: information about the ensemble returned by analyze_block_ensemble
+        @param dict samples: sample arrays (values) for each channel (keys)
+
+        @return set: set of created waveform names. None if writing has failed.
+        """
+        number_of_samples = ensemble_info['number_of_samples']
+        array_length = self._get_chunk_length(ensemble_info)
+        written_waveforms = set()
+        processed_samples = 0
+        while processed_samples < number_of_samples:
+            array_length = min(array_length, number_of_samples - processed_samples)
+            chunk = slice(processed_samples, processed_samples + array_length)
+            written_samples, wfm_list = self.pulsegenerator().write_waveform(
+                name=waveform_name,
+                analog_samples={chnl: samples[chnl][chunk] for chnl in
+                                ensemble_info['analog_channels']},
+                digital_samples={chnl: samples[chnl][chunk] for chnl in
+                                 ensemble_info['digital_channels']},
+                is_first_chunk=processed_samples == 0,
+                is_last_chunk=processed_samples + array_length == number_of_samples,
+                total_number_of_samples=number_of_samples)
+            written_waveforms.update(wfm_list)
+            if written_samples != array_length:
+                self.log.error('Writing waveform "{0}" to device was unsuccessful.\nThe '
+                               'number of actually written samples ({1:d}) does not match the '
+                               'number of samples staged to write ({2:d}).'
+                               ''.format(waveform_name, written_samples, array_length))
+                return None
+            processed_samples += array_length
+        return written_waveforms
+
+    def _get_chunk_length(self, ensemble_info):
+        """
+        Determines the number of samples per channel to write to the pulse generator at once
+        according to the ConfigOption overhead_bytes.
+
+        @param dict ensemble_info: information about the ensemble returned by analyze_block_ensemble
+        @return int: number of samples per write command
+        """
         # Calculate the byte size per sample.
         # One analog sample per channel is 4 bytes (np.float32) and one digital sample per channel
         # is 1 byte (np.bool).
@@ -1747,151 +2342,129 @@ class SequenceGeneratorLogic(GenericLogic):
         # Calculate the bytes estimate for the entire ensemble
         bytes_per_ensemble = bytes_per_sample * ensemble_info['number_of_samples']
 
-        # Determine the size of the sample arrays to be written as a whole.
         if bytes_per_ensemble <= self._overhead_bytes or self._overhead_bytes == 0:
-            array_length = ensemble_info['number_of_samples']
-        else:
-            array_length = self._overhead_bytes // bytes_per_sample
+            return ensemble_info['number_of_samples']
+        return self._overhead_bytes // bytes_per_sample
 
-        # Allocate the sample arrays that are used for a single write command
-        analog_samples = dict()
-        digital_samples = dict()
+    def _get_sampling_fingerprint(self, ensemble, offset_bin):
+        """
+        Calculates a hash of everything that determines the samples of a PulseBlockEnsemble, i.e.
+        the ensemble and block definitions, the time offset and the pulse generator settings.
+
+        @param PulseBlockEnsemble ensemble: The ensemble to calculate the fingerprint for
+        @param int offset_bin: time offset in bins the sampling starts at
+        @return str: hexadecimal SHA-1 digest
+        """
+        fingerprint_dict = dict()
+        fingerprint_dict['rotating_frame'] = ensemble.rotating_frame
+        fingerprint_dict['offset_bin'] = int(offset_bin)
+        fingerprint_dict['lookup_tables'] = bool(self._sampling_lookup_tables)
+        fingerprint_dict['block_list'] = [
+            (self.get_block(block_name).get_dict_representation(), reps) for block_name, reps in
+            ensemble.block_list]
+        fingerprint_dict['pulse_generator_settings'] = self.pulse_generator_settings
+        fingerprint_str = json.dumps(fingerprint_dict,
+                                     sort_keys=True,
+                                     default=lambda obj: sorted(obj) if isinstance(obj, set) else str(obj))
+        return hashlib.sha1(fingerprint_str.encode('utf-8')).hexdigest()
+
+    def _get_sample_cache_dir(self, fingerprint):
+        """
+        Returns the directory to store the samples with the given fingerprint in or None if the
+        on-disk sample cache is disabled.
+        """
+        if not self._sample_cache_path:
+            return None
+        return os.path.join(self._sample_cache_path, fingerprint)
+
+    def _create_sample_cache(self, fingerprint, ensemble_info):
+        """
+        Creates memory-mapped .npy files for each channel to store the samples of a waveform in.
+
+        @return dict: memory-mapped sample arrays (values) for each channel (keys). Empty if the
+                      on-disk sample cache is disabled or the files could not be created.
+        """
+        sample_cache_dir = self._get_sample_cache_dir(fingerprint)
+        if sample_cache_dir is None or ensemble_info['number_of_samples'] == 0:
+            return dict()
+
+        sample_files = dict()
         try:
-            for chnl in ensemble_info['analog_channels']:
-                analog_samples[chnl] = np.empty(array_length, dtype='float32')
-            for chnl in ensemble_info['digital_channels']:
-                digital_samples[chnl] = np.empty(array_length, dtype=bool)
-        except MemoryError:
-            self.log.error('Sampling of PulseBlockEnsemble "{0}" failed due to a MemoryError.\n'
-                           'The sample array needed is too large to allocate in memory.\n'
-                           'Try using the overhead_bytes ConfigOption to limit memory usage.'
-                           ''.format(ensemble.name))
-            if not self.__sequence_generation_in_progress:
-                self.module_state.unlock()
-            self.sigSampleEnsembleComplete.emit(None)
-            return -1, list(), dict()
+            os.makedirs(sample_cache_dir, exist_ok=True)
+            for chnl in ensemble_info['channel_set']:
+                sample_files[chnl] = np.lib.format.open_memmap(
+                    os.path.join(sample_cache_dir, '{0}.npy'.format(chnl)),
+                    mode='w+',
+                    dtype='float32' if chnl.startswith('a') else bool,
+                    shape=(ensemble_info['number_of_samples'],))
+        except OSError:
+            self.log.warning('Unable to create sample cache files in "{0}". Samples will not be '
+                             'cached on disk.'.format(sample_cache_dir))
+            sample_files = dict()
+            self._discard_sample_cache_dir(sample_cache_dir)
+        return sample_files
+
+    def _remove_sample_cache(self, waveform_name):
+        """
+        Removes the waveform cache entry for waveform_name together with the cached samples on disk.
+
+        @param str waveform_name: name of the waveform (without channel suffix)
+        """
+        cache_entry = self._waveform_cache.pop(waveform_name, None)
+        if cache_entry is None:
+            return
+        self._discard_sample_cache_dir(cache_entry.get('sample_cache_dir'))
+        self._save_waveform_cache_to_file()
+        return
 
-        # integer to keep track of the sampls already processed
-        processed_samples = 0
-        # Index to keep track of the samples written into the preallocated samples array
-        array_write_index = 0
-        # Keep track of the number of elements already written
-        element_count = 0
-        # set of written waveform names on the device
-        written_waveforms = set()
-        # Iterate over all blocks within the PulseBlockEnsemble object
-        for block_name, reps in ensemble.block_list:
-            block = self.get_block(block_name)
-            # Iterate over all repetitions of the current block
-            for rep_no in range(reps + 1):
-                # Iterate over the PulseBlockElement instances inside the current block
-                for element in block.element_list:
-                    digital_high = element.digital_high
-                    pulse_function = element.pulse_function
-                    element_length_bins = ensemble_info['elements_length_bins'][element_count]
-
-                    # Indicator on how many samples of this element have been written already
-                    element_samples_written = 0
-
-                    while element_samples_written != element_length_bins:
-                        samples_to_add = min(array_length - array_write_index,
-                                             element_length_bins - element_samples_written)
-                        # create floating point time array for the current element inside rotating
-                        # frame if analog samples are to be calculated.
-                        if pulse_function:
-                            time_arr = (offset_bin + np.arange(
-                                samples_to_add, dtype='float64')) / self.__sample_rate
-
-                        # Calculate respective part of the sample arrays
-                        for chnl in digital_high:
-                            digital_samples[chnl][array_write_index:array_write_index + samples_to_add] = digital_high[
-                                chnl]
-                        for chnl in pulse_function:
-                            analog_samples[chnl][array_write_index:array_write_index + samples_to_add] = pulse_function[
-                                                                                                             chnl].get_samples(
-                                time_arr) / (self.__analog_levels[0][chnl] / 2)
-
-                        # Free memory
-                        if pulse_function:
-                            del time_arr
-
-                        element_samples_written += samples_to_add
-                        array_write_index += samples_to_add
-                        processed_samples += samples_to_add
-                        # if the rotating frame should be preserved (default) increment the offset
-                        # counter for the time array.
-                        if ensemble.rotating_frame:
-                            offset_bin += samples_to_add
-
-                        # Check if the temporary sample array is full and write to the device if so.
-                        if array_write_index == array_length:
-                            # Set first/last chunk flags
-                            is_first_chunk = array_write_index == processed_samples
-                            is_last_chunk = processed_samples == ensemble_info['number_of_samples']
-                            written_samples, wfm_list = self.pulsegenerator().write_waveform(
-                                name=waveform_name,
-                                analog_samples=analog_samples,
-                                digital_samples=digital_samples,
-                                is_first_chunk=is_first_chunk,
-                                is_last_chunk=is_last_chunk,
-                                total_number_of_samples=ensemble_info['number_of_samples'])
-
-                            # Update written waveforms set
-                            written_waveforms.update(wfm_list)
-
-                            # check if write process was successful
-                            if written_samples != array_length:
-                                self.log.error('Sampling of block "{0}" in ensemble "{1}" failed. '
-                                               'Write to device was unsuccessful.\nThe number of '
-                                               'actually written samples ({2:d}) does not match '
-                                               'the number of samples staged to write ({3:d}).'
-                                               ''.format(block_name, ensemble.name, written_samples,
-                                                         array_length))
-                                if not self.__sequence_generation_in_progress:
-                                    self.module_state.unlock()
-                                self.sigAvailableWaveformsUpdated.emit(self.sampled_waveforms)
-                                self.sigSampleEnsembleComplete.emit(None)
-                                return -1, list(), dict()
-
-                            # Reset array write start pointer
-                            array_write_index = 0
-
-                            # check if the temporary write array needs to be truncated for the next
-                            # part. (because it is the last part of the ensemble to write which can
-                            # be shorter than the previous chunks)
-                            if array_length > ensemble_info['number_of_samples'] - processed_samples:
-                                array_length = ensemble_info['number_of_samples'] - processed_samples
-                                analog_samples = dict()
-                                digital_samples = dict()
-                                for chnl in ensemble_info['analog_channels']:
-                                    analog_samples[chnl] = np.empty(array_length, dtype='float32')
-                                for chnl in ensemble_info['digital_channels']:
-                                    digital_samples[chnl] = np.empty(array_length, dtype=bool)
-
-                    # Increment element index
-                    element_count += 1
+    def _discard_sample_cache_dir(self, sample_cache_dir):
+        """
+        Deletes a directory of cached samples from disk unless it is still used by another entry
+        of the waveform cache (e.g. an ensemble sampled with identical settings under another name).
 
-        # Save sampling related parameters to the sampling_information container within the
-        # PulseBlockEnsemble.
-        # This step is only performed if the resulting waveforms are named by the PulseBlockEnsemble
-        # and not by a sequence nametag
-        if waveform_name == ensemble.name:
-            ensemble.sampling_information = dict()
-            ensemble.sampling_information.update(ensemble_info)
-            ensemble.sampling_information['pulse_generator_settings'] = self.pulse_generator_settings
-            ensemble.sampling_information['waveforms'] = natural_sort(written_waveforms)
-            self.save_ensemble(ensemble)
+        @param str sample_cache_dir: directory containing the memory-mapped sample files
+        """
+        if sample_cache_dir and os.path.isdir(sample_cache_dir) and not any(
+                entry['sample_cache_dir'] == sample_cache_dir for entry in
+                self._waveform_cache.values()):
+            shutil.rmtree(sample_cache_dir, ignore_errors=True)
+        return
 
-        self.log.info('Time needed for sampling and writing PulseBlockEnsemble {0} to device: {1} sec'
-                      ''.format(ensemble.name, int(np.rint(time.time() - start_time))))
-        if ensemble_info['number_of_samples'] == 0:
-            self.log.warning('Empty waveform (0 samples) created from PulseBlockEnsemble "{0}".'
-                             ''.format(ensemble.name))
-        if not self.__sequence_generation_in_progress:
-            self.module_state.unlock()
-        self.sigAvailableWaveformsUpdated.emit(self.sampled_waveforms)
-        self.sigSampleEnsembleComplete.emit(ensemble)
-        return offset_bin, natural_sort(written_waveforms), ensemble_info
+    def clear_waveform_cache(self):
+        """
+        Forgets about all previously sampled waveforms and deletes the on-disk sample cache. The
+        next call to sample_pulse_block_ensemble will sample and write all waveforms again.
+        """
+        for waveform_name in list(self._waveform_cache):
+            self._remove_sample_cache(waveform_name)
+        return
+
+    def _load_waveform_cache_from_file(self):
+        """
+        De-serializes the waveform cache from file.
+        """
+        self._waveform_cache = dict()
+        filepath = os.path.join(self._assets_storage_dir, 'waveform_cache.pickle')
+        if os.path.exists(filepath):
+            try:
+                with open(filepath, 'rb') as file:
+                    self._waveform_cache = pickle.load(file)
+            except pickle.UnpicklingError:
+                self.log.error('Failed to de-serialize waveform cache from file. '
+                               'Deleting broken file.')
+                os.remove(filepath)
+        return
+
+    def _save_waveform_cache_to_file(self):
+        """
+        Serializes the waveform cache to file using pickle.
+        """
+        try:
+            with open(os.path.join(self._assets_storage_dir, 'waveform_cache.pickle'), 'wb') as file:
+                pickle.dump(self._waveform_cache, file)
+        except:
+            self.log.error('Failed to serialize waveform cache to file.')
+        return
 
     @QtCore.Slot(str)
     def sample_pulse_sequence(self, sequence):
@@ -1909,6 +2482,10 @@ class SequenceGeneratorLogic(GenericLogic):
         ATTENTION: The phase preservation within a single PulseBlockEnsemble is NOT affected by
                    this method.
 
+        If the ConfigOption "sampling_processes" is larger than 1, the ensembles are sampled
+        concurrently in worker processes ahead of time while the actual writing to the device is
+        still performed step by step in the logic thread.
+
         More sophisticated sequence sampling method can be implemented here.
         """
         # Get PulseSequence from saved sequences if string has been passed as argument
@@ -1947,6 +2524,10 @@ class SequenceGeneratorLogic(GenericLogic):
         # Take current time
         start_time = time.time()
 
+        # Start sampling the ensembles concurrently in worker processes (if enabled)
+        if self._parallel_sampler is not None:
+            self._schedule_parallel_sampling(sequence)
+
         # Produce a set of created waveforms
         written_waveforms = set()
         # Keep track of generated PulseBlockEnsembles and their corresponding ensemble_info dict
@@ -1985,6 +2566,8 @@ class SequenceGeneratorLogic(GenericLogic):
                     self.log.error('Sampling of PulseBlockEnsemble "{0}" failed during sampling of '
                                    'PulseSequence "{1}".\nFailed to create waveforms on device.'
                                    ''.format(seq_step.ensemble, sequence.name))
+                    if self._parallel_sampler is not None:
+                        self._parallel_sampler.clear()
                     self.module_state.unlock()
                     self.__sequence_generation_in_progress = False
                     self.sigSampleSequenceComplete.emit(None)
@@ -2009,6 +2592,10 @@ class SequenceGeneratorLogic(GenericLogic):
             sequence_param_dict_list.append(
                 (tuple(generated_ensembles[name_tag]['waveforms']), seq_step))
 
+        # Free all remaining shared memory of the parallel sampling jobs
+        if self._parallel_sampler is not None:
+            self._parallel_sampler.clear()
+
         # pass the whole information to the sequence creation method:
         steps_written = self.pulsegenerator().write_sequence(sequence.name,
                                                              sequence_param_dict_list)
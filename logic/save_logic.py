@@ -19,14 +19,14 @@ Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
 top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
 """
 
+import concurrent.futures
 from cycler import cycler
 import datetime
-import inspect
 import logging
-import matplotlib.pyplot as plt
 import numpy as np
 import os
 import sys
+import threading
 import time
 
 from collections import OrderedDict
@@ -34,10 +34,14 @@ from core.configoption import ConfigOption
 from core.util import units
 from core.util.mutex import Mutex
 from core.util.network import netobtain
+from logic.figure_rendering import FigureRenderer, figure_metadata
 from logic.generic_logic import GenericLogic
-from matplotlib.backends.backend_pdf import PdfPages
-from PIL import Image
-from PIL import PngImagePlugin
+from qtpy import QtCore
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
 
 
 class DailyLogHandler(logging.FileHandler):
@@ -115,6 +119,71 @@ class FunctionImplementationError(Exception):
         return repr(self.value)
 
 
+class SaveProfiler:
+    """
+    Collects the time spent in each stage of SaveLogic.save_data:
+
+        caller: identification of the calling module
+        prepare: casting and checking of the data, file path and name
+        header: creation of the header/parameters
+        repack: merging of multiple data arrays into one array (text files)
+        write: writing of the data file
+        figure: saving the figure, or handing it over to the figure worker processes
+    """
+    stages = ('caller', 'prepare', 'header', 'repack', 'write', 'figure')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """ Discards all recorded save calls.
+        """
+        with self._lock:
+            self.calls = 0
+            self.total = dict.fromkeys(self.stages, 0.0)
+            self.maximum = dict.fromkeys(self.stages, 0.0)
+
+    def add(self, timings):
+        """ Records the stage durations of a save call.
+
+        @param dict timings: duration in seconds of each stage
+        """
+        with self._lock:
+            self.calls += 1
+            for stage, duration in timings.items():
+                self.total[stage] += duration
+                if duration > self.maximum[stage]:
+                    self.maximum[stage] = duration
+
+    def report(self):
+        """ Summary of the recorded save calls.
+
+        @return str: one line per stage with total, mean and maximum duration
+        """
+        with self._lock:
+            calls = self.calls
+            total = dict(self.total)
+            maximum = dict(self.maximum)
+        lines = ['save_data profile of {0:d} calls ({1:.3f}s in total):'.format(
+            calls, sum(total.values()))]
+        for stage in self.stages:
+            lines.append('    {0:8s} total {1:9.3f}s, mean {2:9.3f}ms, max {3:9.3f}ms'.format(
+                stage, total[stage], 1e3 * total[stage] / max(1, calls), 1e3 * maximum[stage]))
+        return '\n'.join(lines)
+
+    @staticmethod
+    def format_timings(timings):
+        """ One line summary of the stage durations of a single save call.
+
+        @param dict timings: duration in seconds of each stage
+
+        @return str: e.g. 'caller 0.01ms, prepare 0.20ms, ...'
+        """
+        return ', '.join('{0} {1:.2f}ms'.format(stage, 1e3 * duration)
+                         for stage, duration in timings.items())
+
+
 class SaveLogic(GenericLogic):
 
     """
@@ -129,6 +198,7 @@ class SaveLogic(GenericLogic):
         log_into_daily_directory: True
         save_pdf: True
         save_png: True
+        figure_render_processes: 1
     """
 
     _win_data_dir = ConfigOption('win_data_directory', 'C:/Data/')
@@ -136,6 +206,12 @@ class SaveLogic(GenericLogic):
     log_into_daily_directory = ConfigOption('log_into_daily_directory', False, missing='warn')
     save_pdf = ConfigOption('save_pdf', False)
     save_png = ConfigOption('save_png', True)
+    # Number of worker processes rendering the figures passed to save_data. With 0 the figures are
+    # rendered by save_data itself.
+    _figure_render_processes = ConfigOption('figure_render_processes', 0)
+
+    # Emitted with the list of saved figure files when the figure of a save_data call is saved
+    sigFigureSaved = QtCore.Signal(list)
 
     # Matplotlib style definition for saving plots
     mpl_qd_style = {
@@ -167,6 +243,10 @@ class SaveLogic(GenericLogic):
 
     _additional_parameters = {}
 
+    # HDF5 attributes are limited to 64 kB, larger parameters are saved as datasets in this group
+    _hdf5_max_attribute_bytes = 16384
+    _hdf5_parameter_group = '_parameters'
+
     def __init__(self, config, **kwargs):
         super().__init__(config=config, **kwargs)
 
@@ -201,6 +281,10 @@ class SaveLogic(GenericLogic):
                 self.log_into_daily_directory = False
 
         self._daily_loghandler = None
+        self._figure_renderer = None
+        self._pending_figures = set()
+        self._pending_figures_lock = Mutex()
+        self.save_profiler = SaveProfiler()
 
     def on_activate(self):
         """ Definition, configuration and initialisation of the SaveLogic.
@@ -216,8 +300,11 @@ class SaveLogic(GenericLogic):
             logging.getLogger().addHandler(self._daily_loghandler)
         else:
             self._daily_loghandler = None
+        self._figure_renderer = FigureRenderer(self._figure_render_processes)
 
     def on_deactivate(self):
+        # finish saving all figures before the worker processes are terminated
+        self._figure_renderer.shutdown(wait=True)
         if self._daily_loghandler is not None:
             # removes the log handler logging into the daily directory
             logging.getLogger().removeHandler(self._daily_loghandler)
@@ -238,7 +325,8 @@ class SaveLogic(GenericLogic):
         self._daily_loghandler.setLevel(level)
 
     def save_data(self, data, filepath=None, parameters=None, filename=None, filelabel=None,
-                  timestamp=None, filetype='text', fmt='%.15e', delimiter='\t', plotfig=None):
+                  timestamp=None, filetype='text', fmt='%.15e', delimiter='\t', plotfig=None,
+                  module_name=None):
         """
         General save routine for data.
 
@@ -284,7 +372,11 @@ class SaveLogic(GenericLogic):
                                    filename and a timestamp, because then the timestamp will be
                                    ignored.
         @param string filetype: optional, the file format the data should be saved in. Valid inputs
-                                are 'text', 'xml' and 'npz'. Default is 'text'.
+                                are 'text', 'xml', 'npz' and 'hdf5'. Default is 'text'.
+                                'hdf5' (requires h5py) stores each data item as chunked and
+                                compressed dataset and the parameters as file attributes. Data
+                                arrays with more than two dimensions can only be saved as 'hdf5'.
+                                See read_hdf5_data to load the file (partially).
         @param string or list of strings fmt: optional, format specifier for saved data. See python
                                               documentation for
                                               "Format Specification Mini-Language". If you want for
@@ -299,6 +391,15 @@ class SaveLogic(GenericLogic):
                                               behaviour or failure to save right away.
         @param string delimiter: optional, insert here the delimiter, like '\n' for new line, '\t'
                                  for tab, ',' for a comma ect.
+        @param plotfig: optional, a matplotlib.figure.Figure or a logic.figure_rendering.FigureSpec
+                        saved as <filename>_fig.pdf and/or <filename>_fig.png next to the data
+                        file. The figure is closed afterwards. With the config option
+                        figure_render_processes > 0 it is rendered in a worker process and
+                        save_data returns as soon as the data file is written; sigFigureSaved is
+                        emitted once the figure files are written.
+        @param string module_name: optional, name of the calling module used for the default
+                                   filepath, filelabel and header. If not given, it is the name of
+                                   the module (file) containing the calling function.
 
         1D data
         =======
@@ -329,11 +430,25 @@ class SaveLogic(GenericLogic):
         YOU ARE RESPONSIBLE FOR THE IDENTIFIER! DO NOT FORGET THE UNITS FOR THE SAVED TIME
         TRACE/MATRIX.
         """
-        start_time = time.time()
+        # Duration of each stage of this call, see SaveProfiler
+        timings = OrderedDict()
+        stage_start = time.perf_counter()
+
+        # trace back the functioncall to the module which was calling it.
+        if module_name is None:
+            module_name = self._get_caller_module_name()
+        stage_start = self._stage_done(timings, 'caller', stage_start)
+
         # Create timestamp if none is present
         if timestamp is None:
             timestamp = datetime.datetime.now()
 
+        if filetype == 'hdf5' and h5py is None:
+            self.log.error('Saving data as HDF5 file requires the package "h5py". Perform e.g.\n\n'
+                           '    pip install h5py\n\n'
+                           'in the console to install it. Saving as textfile.')
+            filetype = 'text'
+
         # Try to cast data array into numpy.ndarray if it is not already one
         # Also collect information on arrays in the process and do sanity checks
         found_1d = False
@@ -367,7 +482,7 @@ class SaveLogic(GenericLogic):
                 else:
                     found_1d = True
                     max_row_num += 1
-            else:
+            elif filetype != 'hdf5':
                 self.log.error('Found data array with dimension >2. Unable to save data.')
                 return -1
 
@@ -378,24 +493,12 @@ class SaveLogic(GenericLogic):
             arr_dtype.append(data[keyname].dtype)
 
         # Raise error if data contains a mixture of 1D and 2D arrays
-        if found_2d and found_1d:
+        if found_2d and found_1d and filetype != 'hdf5':
             self.log.error('Passed data dictionary contains 1D AND 2D arrays. This is not allowed. '
                            'Either fit all data arrays into a single 2D array or pass multiple 1D '
                            'arrays only. Saving data failed!')
             return -1
 
-        # try to trace back the functioncall to the class which was calling it.
-        try:
-            frm = inspect.stack()[1]
-            # this will get the object, which called the save_data function.
-            mod = inspect.getmodule(frm[0])
-            # that will extract the name of the class.
-            module_name = mod.__name__.split('.')[-1]
-        except:
-            # Sometimes it is not possible to get the object which called the save_data function
-            # (such as when calling this from the console).
-            module_name = 'UNSPECIFIED'
-
         # determine proper file path
         if filepath is None:
             filepath = self.get_path_for_module(module_name)
@@ -420,6 +523,7 @@ class SaveLogic(GenericLogic):
                            'Saving not possible. Please pass exactly as many format specifiers as '
                            'data arrays.')
             return -1
+        stage_start = self._stage_done(timings, 'prepare', stage_start)
 
         # Create header string for the file
         header = 'Saved Data from the class {0} on {1}.\n' \
@@ -445,6 +549,7 @@ class SaveLogic(GenericLogic):
                                'try to save the parameters nevertheless.')
                 header += 'not specified parameters: {0}\n'.format(parameters)
         header += '\nData:\n=====\n'
+        stage_start = self._stage_done(timings, 'header', stage_start)
 
         # write data to file
         # FIXME: Implement other file formats
@@ -488,9 +593,25 @@ class SaveLogic(GenericLogic):
             else:
                 identifier_str = list(data)[0]
             header += list(data)[0]
+            stage_start = self._stage_done(timings, 'repack', stage_start)
             self.save_array_as_text(data=data[identifier_str], filename=filename, filepath=filepath,
                                     fmt=fmt, header=header, delimiter=delimiter, comments='#',
                                     append=False)
+        # write HDF5 file with the parameters as attributes
+        elif filetype == 'hdf5':
+            if not filename.endswith(('.h5', '.hdf5')):
+                filename = os.path.splitext(filename)[0] + '.h5'
+            attributes = {'module_name': module_name, 'timestamp': timestamp.isoformat()}
+            if self.active_poi_name != '':
+                attributes['Measured at POI'] = self.active_poi_name
+            if isinstance(parameters, dict):
+                if isinstance(self._additional_parameters, dict):
+                    parameters = {**self._additional_parameters, **parameters}
+                attributes.update(parameters)
+            elif parameters is not None:
+                attributes['not specified parameters'] = parameters
+            self.save_array_as_hdf5(data=data, filename=filename, filepath=filepath,
+                                    attributes=attributes)
         # write npz file and save parameters in textfile
         elif filetype == 'npz':
             header += str(list(data.keys()))[1:-1]
@@ -505,66 +626,109 @@ class SaveLogic(GenericLogic):
                                     fmt=fmt, header=header, delimiter=delimiter, comments='#',
                                     append=False)
 
+        timings.setdefault('repack', 0.0)
+        stage_start = self._stage_done(timings, 'write', stage_start)
+
         #--------------------------------------------------------------------------------------------
         # Save thumbnail figure of plot
         if plotfig is not None:
-            # create Metadata
-            metadata = dict()
-            metadata['Title'] = 'Image produced by qudi: ' + module_name
-            metadata['Author'] = 'qudi - Software Suite'
-            metadata['Subject'] = 'Find more information on: https://github.com/Ulm-IQO/qudi'
-            metadata['Keywords'] = 'Python 3, Qt, experiment control, automation, measurement, software, framework, modular'
-            metadata['Producer'] = 'qudi - Software Suite'
-            if timestamp is not None:
-                metadata['CreationDate'] = timestamp
-                metadata['ModDate'] = timestamp
-            else:
-                metadata['CreationDate'] = time
-                metadata['ModDate'] = time
-            
-            if self.save_pdf:
-                # determine the PDF-Filename
-                fig_fname_vector = os.path.join(filepath, filename)[:-4] + '_fig.pdf'
-
-                # Create the PdfPages object to which we will save the pages:
-                # The with statement makes sure that the PdfPages object is closed properly at
-                # the end of the block, even if an Exception occurs.
-                with PdfPages(fig_fname_vector) as pdf:
-                    pdf.savefig(plotfig, bbox_inches='tight', pad_inches=0.05)
-
-                    # We can also set the file's metadata via the PdfPages object:
-                    pdf_metadata = pdf.infodict()
-                    for x in metadata:
-                        pdf_metadata[x] = metadata[x]
-
-            if self.save_png:
-                # determine the PNG-Filename and save the plain PNG
-                fig_fname_image = os.path.join(filepath, filename)[:-4] + '_fig.png'
-                plotfig.savefig(fig_fname_image, bbox_inches='tight', pad_inches=0.05)
-
-                # Use Pillow (an fork for PIL) to attach metadata to the PNG
-                png_image = Image.open(fig_fname_image)
-                png_metadata = PngImagePlugin.PngInfo()
-
-                # PIL can only handle Strings, so let's convert our times
-                metadata['CreationDate'] = metadata['CreationDate'].strftime('%Y%m%d-%H%M-%S')
-                metadata['ModDate'] = metadata['ModDate'].strftime('%Y%m%d-%H%M-%S')
-
-                for x in metadata:
-                    # make sure every value of the metadata is a string
-                    if not isinstance(metadata[x], str):
-                        metadata[x] = str(metadata[x])
-
-                    # add the metadata to the picture
-                    png_metadata.add_text(x, metadata[x])
-
-                # save the picture again, this time including the metadata
-                png_image.save(fig_fname_image, "png", pnginfo=png_metadata)
-
-            # close matplotlib figure
-            plt.close(plotfig)
-            self.log.debug('Time needed to save data: {0:.2f}s'.format(time.time()-start_time))
-            #----------------------------------------------------------------------------------
+            # The data file is already written, the figure is saved in the background (if
+            # figure_render_processes > 0) and sigFigureSaved is emitted when it is done.
+            self._save_figure(plotfig,
+                              os.path.splitext(os.path.join(filepath, filename))[0] + '_fig',
+                              figure_metadata(module_name, timestamp))
+        self._stage_done(timings, 'figure', stage_start)
+        #--------------------------------------------------------------------------------------------
+
+        self.save_profiler.add(timings)
+        self.log.debug('Time needed to save data: {0:.2f}s ({1})'.format(
+            sum(timings.values()), self.save_profiler.format_timings(timings)))
+
+    @staticmethod
+    def _stage_done(timings, stage, stage_start):
+        """ Adds the duration of a save_data stage to timings.
+
+        @param dict timings: stage durations of the current save_data call
+        @param str stage: name of the finished stage
+        @param float stage_start: time.perf_counter() at the start of the stage
+
+        @return float: time.perf_counter() at the end of the stage
+        """
+        now = time.perf_counter()
+        timings[stage] = now - stage_start
+        return now
+
+    @staticmethod
+    def _get_caller_module_name():
+        """ Name of the module containing the function which called save_data.
+
+        Only looks at the globals of the calling frame instead of building the whole call stack
+        with inspect.stack(), which is slow in deep (Qt) call chains.
+
+        @return str: last part of the module name, 'UNSPECIFIED' if the caller is not part of an
+                     imported module (e.g. when calling save_data from the console)
+        """
+        try:
+            # frame 0 is this method, frame 1 is save_data
+            caller_globals = sys._getframe(2).f_globals
+            name = caller_globals['__name__']
+            # like inspect.getmodule, only accept real modules
+            if sys.modules[name].__dict__ is not caller_globals:
+                return 'UNSPECIFIED'
+        except (ValueError, KeyError, AttributeError):
+            return 'UNSPECIFIED'
+        return name.split('.')[-1]
+
+    def save_profile_report(self, reset=False):
+        """
+        Debug report of the time spent in each stage of all save_data calls, see SaveProfiler.
+
+        @param bool reset: optional, discard the recorded calls after creating the report
+
+        @return str: the report
+        """
+        report = self.save_profiler.report()
+        if reset:
+            self.save_profiler.reset()
+        return report
+
+    def _save_figure(self, figure, fig_basename, metadata):
+        """ Hands a figure over to the figure renderer.
+
+        @param matplotlib.figure.Figure|FigureSpec figure: the figure to save
+        @param str fig_basename: path of the figure files without the extension
+        @param dict metadata: metadata of the figure files
+        """
+        future = self._figure_renderer.submit(figure, fig_basename, metadata,
+                                              save_pdf=self.save_pdf, save_png=self.save_png)
+        with self._pending_figures_lock:
+            self._pending_figures.add(future)
+        future.add_done_callback(self._figure_saved)
+
+    def _figure_saved(self, future):
+        """ Done callback of the figure rendering, called from the thread finishing the future.
+        """
+        with self._pending_figures_lock:
+            self._pending_figures.discard(future)
+        try:
+            saved_files = future.result()
+        except Exception:
+            self.log.exception('Saving figure failed:')
+            return
+        self.sigFigureSaved.emit(saved_files)
+
+    def wait_for_saved_figures(self, timeout=None):
+        """
+        Blocks until all figures passed to save_data are saved.
+
+        @param float timeout: optional, maximum time to wait in seconds
+
+        @return bool: True if all figures are saved, False if the timeout was reached
+        """
+        with self._pending_figures_lock:
+            pending = list(self._pending_figures)
+        done, not_done = concurrent.futures.wait(pending, timeout=timeout)
+        return len(not_done) == 0
 
     def save_array_as_text(self, data, filename, filepath='', fmt='%.15e', header='',
                            delimiter='\t', comments='#', append=False):
@@ -583,6 +747,131 @@ class SaveLogic(GenericLogic):
                            comments=comments)
         return
 
+    def save_array_as_hdf5(self, data, filename, filepath='', attributes=None, compression=4):
+        """
+        An independent method, which saves numpy.ndarrays as chunked and compressed datasets into a
+        HDF5 file. The datasets can be loaded (partially) later on via read_hdf5_data.
+
+        @param dict data: numpy.ndarrays (values) to save as datasets named by the keys. Since "/"
+                          is the HDF5 group separator, it is replaced by "|" in the dataset name.
+                          The original key is stored in the dataset attribute "name".
+        @param str filename: name of the file to create (including file extension)
+        @param str filepath: directory to save the file in
+        @param dict attributes: optional, parameters to store as file attributes. Values that can
+                                not be stored as HDF5 attribute are converted to str. Values too
+                                large for an attribute (e.g. long frequency lists) are stored as
+                                datasets in the group "_parameters" instead.
+        @param int compression: gzip compression level (0-9)
+        """
+        with h5py.File(os.path.join(filepath, filename), 'w', track_order=True) as file:
+            if attributes is not None:
+                for key, value in attributes.items():
+                    value = self._get_hdf5_attribute(value)
+                    if np.asarray(value).nbytes <= self._hdf5_max_attribute_bytes:
+                        try:
+                            file.attrs[str(key)] = value
+                            continue
+                        except (ValueError, RuntimeError, OSError):
+                            # attribute too large for the object header, store as dataset below
+                            pass
+                    if self._hdf5_parameter_group not in file:
+                        file.create_group(self._hdf5_parameter_group, track_order=True)
+                    value = np.asarray(value, dtype=object if isinstance(value, str) else None)
+                    dtype = h5py.string_dtype() if value.dtype == object else value.dtype
+                    dataset = file[self._hdf5_parameter_group].create_dataset(
+                        str(key).replace('/', '|'), data=value, dtype=dtype)
+                    dataset.attrs['name'] = str(key)
+            for key, arr in data.items():
+                arr = np.asarray(arr)
+                if arr.dtype.kind == 'U':
+                    arr = arr.astype(object)
+                    dtype = h5py.string_dtype()
+                else:
+                    dtype = arr.dtype
+                if arr.ndim > 0 and arr.size > 0:
+                    # let h5py choose an appropriate chunk shape
+                    dataset = file.create_dataset(str(key).replace('/', '|'),
+                                                  data=arr,
+                                                  dtype=dtype,
+                                                  chunks=True,
+                                                  compression='gzip',
+                                                  compression_opts=compression,
+                                                  shuffle=True)
+                else:
+                    dataset = file.create_dataset(str(key).replace('/', '|'), data=arr, dtype=dtype)
+                dataset.attrs['name'] = str(key)
+        return
+
+    @staticmethod
+    def _get_hdf5_attribute(value):
+        """
+        Converts a parameter value into a type that can be stored as HDF5 attribute.
+        """
+        if isinstance(value, (str, bool, int, float, complex, np.number, np.bool_)):
+            return value
+        if isinstance(value, (list, tuple, np.ndarray)):
+            arr = np.asarray(value)
+            if arr.dtype.kind in 'biufc':
+                return arr
+            if arr.dtype.kind == 'U':
+                return arr.astype(object)
+        return str(value)
+
+    @staticmethod
+    def read_hdf5_data(filename, names=None, selection=None):
+        """
+        Loads data and parameters from a HDF5 file created by save_data (filetype 'hdf5').
+        Datasets can be loaded partially without reading the entire file.
+
+        @param str filename: full path of the HDF5 file to load
+        @param list names: optional, names (data dict keys) of the datasets to load.
+                           Loads all datasets if None.
+        @param dict selection: optional, index expression (values), e.g. numpy.s_[100:200, ::2],
+                               to load only parts of the dataset for each name (keys).
+
+        @return (dict, dict): data arrays (values) for each name (keys) and the parameters saved
+                              with the data.
+        """
+        if h5py is None:
+            raise ImportError('Reading HDF5 files requires the package "h5py".')
+        if selection is None:
+            selection = dict()
+        data = OrderedDict()
+        with h5py.File(filename, 'r') as file:
+            parameters = {key: value for key, value in file.attrs.items()}
+            if SaveLogic._hdf5_parameter_group in file:
+                for dataset in file[SaveLogic._hdf5_parameter_group].values():
+                    value = dataset[()]
+                    if h5py.check_string_dtype(dataset.dtype) is not None:
+                        value = SaveLogic._decode_hdf5_strings(value)
+                    parameters[dataset.attrs.get('name', dataset.name.split('/')[-1])] = value
+            for dataset in file.values():
+                if not isinstance(dataset, h5py.Dataset):
+                    continue
+                name = dataset.attrs.get('name', dataset.name.lstrip('/'))
+                if names is not None and name not in names:
+                    continue
+                if name in selection:
+                    data[name] = dataset[selection[name]]
+                else:
+                    data[name] = dataset[()]
+                if h5py.check_string_dtype(dataset.dtype) is not None:
+                    data[name] = SaveLogic._decode_hdf5_strings(data[name])
+        return data, parameters
+
+    @staticmethod
+    def _decode_hdf5_strings(value):
+        """
+        Converts the bytes read from a HDF5 string dataset into str (or a numpy.ndarray of str).
+        """
+        if isinstance(value, bytes):
+            return value.decode()
+        if isinstance(value, str):
+            return value
+        value = np.asarray(value, dtype=object)
+        return np.array([item.decode() if isinstance(item, bytes) else str(item)
+                         for item in value.flat], dtype=str).reshape(value.shape)
+
     def get_daily_directory(self):
         """ Gets or creates daily save directory.
 
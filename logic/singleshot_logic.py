@@ -33,6 +33,142 @@ from logic.generic_logic import GenericLogic
 from qtpy import QtCore
 
 
+def binned_sums(signal, width, cumulative=None):
+    """ Sums of consecutive, non-overlapping groups of rows of a signal.
+
+    An incomplete group at the end of the signal is dropped. If the cumulative sums of an integer
+    signal are given, each group sum is the difference of two of them. Otherwise the groups are
+    summed directly, which gives the same floating point result as summing each group on its own.
+
+    @param np.array signal: 2D array with one row per readout and one column per laser pulse
+    @param int width: number of rows added up in each group
+    @param np.array cumulative: optional, cumulative sums of the integer signal as returned by
+                                cumulative_sums
+
+    @return np.array: 2D array with the sums of the len(signal) // width groups
+    """
+    count = len(signal) // width
+    if cumulative is not None:
+        return cumulative[width:count * width + 1:width] - cumulative[0:count * width:width]
+    # sum along the contiguous last axis, like np.sum on the rows of each group per column
+    columns = np.ascontiguousarray(signal[:count * width].T)
+    sums = columns.reshape(columns.shape[0], count, width).sum(axis=2)
+    return np.ascontiguousarray(sums.T)
+
+
+def cumulative_sums(signal):
+    """ Cumulative sums of the rows of a signal with a leading row of zeros.
+
+    @param np.array signal: 2D array with one row per readout and one column per laser pulse
+
+    @return np.array: 2D array with len(signal) + 1 rows, row i is the sum of the first i rows
+    """
+    sums = np.cumsum(signal, axis=0)
+    return np.concatenate((np.zeros((1, sums.shape[1]), dtype=sums.dtype), sums))
+
+
+def ragged_array(arrays):
+    """ Combine a list of arrays into one array, or into an object array if their shapes differ.
+
+    @param list arrays: list of numpy arrays
+
+    @return np.array: the combined array
+    """
+    if len({array.shape for array in arrays}) <= 1:
+        return np.array(arrays)
+    combined = np.empty(len(arrays), dtype=object)
+    for index, array in enumerate(arrays):
+        combined[index] = array
+    return combined
+
+
+class BinningAccumulator:
+    """ All binnings of a single shot signal which grows while new data is pulled.
+
+    The rows of the signal (one per readout, one column per laser pulse) are appended chunk by
+    chunk. For integer counts the cumulative sums are updated with each chunk, so every binning
+    of the complete signal costs only one subtraction per group.
+    """
+
+    def __init__(self, signal=None):
+        self._chunks = list()
+        self._signal = None
+        self._cumulative = None
+        if signal is not None:
+            self.append(signal)
+
+    def reset(self):
+        """ Discard all rows appended so far. """
+        self._chunks = list()
+        self._signal = None
+        self._cumulative = None
+
+    def append(self, rows):
+        """ Append new rows to the signal.
+
+        @param np.array rows: 2D array with one row per readout and one column per laser pulse
+        """
+        rows = np.asarray(rows)
+        if rows.size == 0:
+            return
+        if self._chunks and rows.dtype != self._chunks[0].dtype:
+            # mixed data types, fall back to summing the groups directly
+            self._cumulative = None
+        elif np.issubdtype(rows.dtype, np.integer):
+            sums = cumulative_sums(rows)
+            if self._cumulative is None and not self._chunks:
+                self._cumulative = sums
+            elif self._cumulative is not None:
+                self._cumulative = np.concatenate(
+                    (self._cumulative, self._cumulative[-1] + sums[1:]))
+        self._chunks.append(rows)
+        self._signal = None
+
+    @property
+    def signal(self):
+        """ 2D array of all rows appended so far. """
+        if self._signal is None:
+            if not self._chunks:
+                return np.empty((0, 0))
+            self._signal = np.concatenate(self._chunks)
+            self._chunks = [self._signal]
+        return self._signal
+
+    @property
+    def n_rows(self):
+        """ Number of rows appended so far. """
+        return sum(len(chunk) for chunk in self._chunks)
+
+    def binning(self, width):
+        """ Sums of consecutive groups of width rows, see binned_sums.
+
+        @param int width: number of rows added up in each group
+
+        @return np.array: 2D array with one row per group and one column per laser pulse
+        """
+        return binned_sums(self.signal, width, self._cumulative)
+
+    def iter_binnings(self, num_bins=100):
+        """ Generator of the binnings 1, 2, ... up to (but excluding) n_rows // num_bins.
+
+        @param int num_bins: minimal number of groups a binning has
+
+        @return generator: 2D arrays of the binnings, see binning
+        """
+        for width in range(1, self.n_rows // num_bins):
+            yield self.binning(width)
+
+    def iter_normalized_binnings(self, num_bins=100):
+        """ Generator of the normalized binnings (a - b) / (a + b) of a signal with two columns.
+
+        @param int num_bins: minimal number of groups a binning has
+
+        @return generator: 1D arrays of the normalized binnings
+        """
+        for binning in self.iter_binnings(num_bins):
+            yield (binning[:, 0] - binning[:, 1]) / (binning[:, 0] + binning[:, 1])
+
+
 class SingleShotLogic(GenericLogic):
     """ This class brings raw data coming from fastcounter measurements (gated or ungated)
         into trace form processable by the trace_analysis_logic.
@@ -75,6 +211,7 @@ class SingleShotLogic(GenericLogic):
         self._hist_num_bins = None
 
         self.data_dict = None
+        self.binning_accumulator = BinningAccumulator()
 
     def on_activate(self):
         """ Initialisation performed during activation of the module.
@@ -231,39 +368,16 @@ class SingleShotLogic(GenericLogic):
                                initial binning given by the measurement and then going up.
         """
 
-        if self.data_dict:
-            data = self.data_dict
-        else:
+        if not self.data_dict:
             self.log.error('Pull data from fastcounting device using get_data function '
                            'before trying to calc_all_binnings.')
+            return np.array([])
 
-        NN = data['n_rows']
         # this is just a guess value, at some point it doesn't make
-        # sense anymore to further decrease the number of bins
-        max_bin = NN // num_bins
-        count_var = 1
-        bin_list = []
-        temp_list = []
-        signal = self.sum_laserpulse()
-        while count_var <= max_bin:
-            # check if the the first run through loop was done
-            if temp_list:
-                app_arr = np.array(temp_list)
-                bin_list.append(app_arr)
-                temp_list = []
-            jj = 0
-            while jj < NN:
-                sum_ind = np.linspace(jj, jj + count_var - 1, count_var, dtype=np.int)
-                # make sure we don't try to adress not reserved memory
-                jj += count_var
-                if sum_ind[-1] < NN:
-                    # normalize
-                    temp_list.append(np.array([np.sum(signal[sum_ind, 0]), np.sum(signal[sum_ind, 1])]))
-                else:
-                    jj = NN
-            count_var += 1
-
-        return np.array(bin_list)
+        # sense anymore to further decrease the number of bins.
+        # The binnings go up to (excluding) n_rows // num_bins.
+        accumulator = BinningAccumulator(self.sum_laserpulse()[:self.data_dict['n_rows']])
+        return ragged_array(list(accumulator.iter_binnings(num_bins)))
 
     def calc_all_binnings_normalized(self, num_bins=100):
         """
@@ -274,14 +388,37 @@ class SingleShotLogic(GenericLogic):
                                           ( 1 to n values)
         """
 
-        bin_list = self.calc_all_binnings(num_bins=num_bins)
-        normalized_bin_list = []
-        for binning in bin_list:
-            normalized_binning = (binning[:, 0] - binning[:, 1])/(binning[:, 0] + binning[:, 1])
-            normalized_bin_list.append(normalized_binning)
+        if not self.data_dict:
+            self.log.error('Pull data from fastcounting device using get_data function '
+                           'before trying to calc_all_binnings_normalized.')
+            return np.array([])
 
-        return np.array(normalized_bin_list)
+        accumulator = BinningAccumulator(self.sum_laserpulse()[:self.data_dict['n_rows']])
+        return ragged_array(list(accumulator.iter_normalized_binnings(num_bins)))
 
+    def accumulate_binnings(self, num_bins=100):
+        """
+        Append the new readouts of the data pulled last by get_data to the accumulated signal
+        and calculate the normalized binnings of all readouts accumulated so far.
+        The fast counter returns the whole (growing) buffer of readouts, so only the rows after
+        the ones accumulated already (up to n_rows) are appended. Call reset_accumulated_binnings
+        before a new measurement.
+        @param integer num_bins: minimal number of data points of the binnings
+        @return list normalized_bin_list: see calc_all_binnings_normalized
+        """
+        if self.data_dict:
+            self.binning_accumulator.append(
+                self.sum_laserpulse()[self.binning_accumulator.n_rows:self.data_dict['n_rows']])
+        else:
+            self.log.error('Pull data from fastcounting device using get_data function '
+                           'before trying to accumulate_binnings.')
+        return ragged_array(list(self.binning_accumulator.iter_normalized_binnings(num_bins)))
+
+    def reset_accumulated_binnings(self):
+        """
+        Discard the readouts accumulated by accumulate_binnings.
+        """
+        self.binning_accumulator.reset()
 
     def get_timetrace(self):
         """
@@ -294,7 +431,7 @@ class SingleShotLogic(GenericLogic):
         # what needs to be done here now is the basic evaluation steps like fit, threshold
         # readout fidelity
 
-        bin_list = self.calc_all_binnings(self, num_bins=100)
+        bin_list = self.calc_all_binnings(num_bins=100)
 
         param_dict_list = []
         fidelity_list = []
@@ -515,7 +652,7 @@ class SingleShotLogic(GenericLogic):
         @param record_length:
         @return:
         """
-        normalized_bin_list = self.calc_all_binnings_normalized(self, num_bins=100)
+        normalized_bin_list = self.calc_all_binnings_normalized(num_bins=100)
 
         # for now take only the initial binning
         data = normalized_bin_list[0]
@@ -27,6 +27,94 @@ from core.connector import Connector
 from logic.generic_logic import GenericLogic
 
 
+def count_flips(trace, init_threshold, ana_threshold, analyze_mode='full'):
+    """ Count how often consecutive data points of a trace indicate a flip of the state.
+
+    A data point above init_threshold[1] (below init_threshold[0]) initializes the bright (dark)
+    state, the following data point analyzes the state: above ana_threshold[1] is bright, below
+    ana_threshold[0] is dark. Pairs where the analysis point is in between are not counted.
+
+    @param np.array trace: 1D trace of data
+    @param list init_threshold: [lower, upper] threshold for the initialization
+    @param list ana_threshold: [lower, upper] threshold for the analysis
+    @param str analyze_mode: 'full', 'bright' or 'dark' initialization states to analyze
+
+    @return tuple(int, int): number of flips and number of pairs without a flip
+    """
+    trace = np.asarray(trace)
+    next_high = trace[1:] > ana_threshold[1]
+    next_low = ~next_high & (trace[1:] < ana_threshold[0])
+    flip = 0
+    no_flip = 0
+    if analyze_mode == 'bright' or analyze_mode == 'full':
+        init_high = trace[:-1] > init_threshold[1]
+        no_flip += np.count_nonzero(init_high & next_high)
+        flip += np.count_nonzero(init_high & next_low)
+    if analyze_mode == 'dark' or analyze_mode == 'full':
+        init_low = trace[:-1] < init_threshold[0]
+        flip += np.count_nonzero(init_low & next_high)
+        no_flip += np.count_nonzero(init_low & next_low)
+    return flip, no_flip
+
+
+class FlipStatistics:
+    """ Flip statistics of a trace which is updated chunk by chunk (e.g. during a measurement).
+
+    The flips are counted like in TraceAnalysisLogic.analyze_flip_prob3. Only the new chunk (and
+    the last data point of the previous one) is analyzed on each update, so the result after
+    several updates is the same as analyzing the complete trace at once.
+    """
+
+    def __init__(self, init_threshold=None, ana_threshold=None, analyze_mode='full'):
+        self.init_threshold = init_threshold if init_threshold is not None else [1, 1]
+        self.ana_threshold = ana_threshold if ana_threshold is not None else [1, 1]
+        self.analyze_mode = analyze_mode
+        self.flips = 0
+        self.no_flips = 0
+        self.length = 0
+        self._last_value = None
+
+    def reset(self):
+        """ Discard all data analyzed so far. """
+        self.flips = 0
+        self.no_flips = 0
+        self.length = 0
+        self._last_value = None
+
+    def update(self, trace_chunk):
+        """ Add the next chunk of the trace to the statistics.
+
+        @param np.array trace_chunk: 1D array with the new data points of the trace
+
+        @return tuple(flip_prob, lost_events): see probability and lost_events
+        """
+        trace_chunk = np.asarray(trace_chunk).ravel()
+        if trace_chunk.size > 0:
+            if self._last_value is None:
+                trace = trace_chunk
+            else:
+                trace = np.concatenate(([self._last_value], trace_chunk))
+            flip, no_flip = count_flips(
+                trace, self.init_threshold, self.ana_threshold, self.analyze_mode)
+            self.flips += flip
+            self.no_flips += no_flip
+            self.length += trace_chunk.size
+            self._last_value = trace_chunk[-1]
+        return self.probability, self.lost_events
+
+    @property
+    def probability(self):
+        """ Number of flips divided by the number of analyzed pairs (NaN if none). """
+        if self.flips + self.no_flips == 0:
+            return np.nan
+        return self.flips / (self.flips + self.no_flips)
+
+    @property
+    def lost_events(self):
+        """ Number of data points which were not analyzed. """
+        return float(self.length - (self.flips + self.no_flips))
+
+
 class TraceAnalysisLogic(GenericLogic):
     """ Perform a gated counting measurement with the hardware.  """
 
@@ -232,36 +320,25 @@ class TraceAnalysisLogic(GenericLogic):
                       float lifetime_dark: the lifetime in the dark state in s
                       float lifetime_bright: lifetime in the bright state in s
         """
-        no_flip = 0.0
+        trace = np.asarray(trace)
+        above = trace > threshold
+        below = trace < threshold
 
         if analyze_mode == 'full':
-            for ii in range(len(trace) - 1):
-                if trace[ii] > threshold and trace[ii + 1] > threshold:
-                    no_flip = no_flip + 1
-
-                elif trace[ii] < threshold and trace[ii + 1] < threshold:
-                    no_flip = no_flip + 1
-
+            no_flip = float(np.count_nonzero(above[:-1] & above[1:])
+                            + np.count_nonzero(below[:-1] & below[1:]))
             probability = 1.0 - (no_flip / len(trace))
             lost_events = 0.0
 
         if analyze_mode == 'dark':
-            dark_counter = 0.0
-            for ii in range(len(trace) - 1):
-                if trace[ii] < threshold:
-                    dark_counter = dark_counter + 1
-                    if trace[ii + 1] < threshold:
-                        no_flip = no_flip + 1
+            dark_counter = float(np.count_nonzero(below[:-1]))
+            no_flip = float(np.count_nonzero(below[:-1] & below[1:]))
             probability = 1.0 - (no_flip / dark_counter)
             lost_events = (1.0 - (dark_counter / len(trace))) * 100
 
         if analyze_mode == 'bright':
-            bright_counter = 0.0
-            for ii in range(len(trace) - 1):
-                if trace[ii] > threshold:
-                    bright_counter = bright_counter + 1
-                    if trace[ii + 1] > threshold:
-                        no_flip = no_flip + 1
+            bright_counter = float(np.count_nonzero(above[:-1]))
+            no_flip = float(np.count_nonzero(above[:-1] & above[1:]))
             probability = 1.0 - (no_flip / bright_counter)
             lost_events = (1.0 - (bright_counter / len(trace))) * 100
 
@@ -284,35 +361,10 @@ class TraceAnalysisLogic(GenericLogic):
         """
         init_threshold = init_threshold if init_threshold is not None else [1, 1]
         ana_threshold = ana_threshold if ana_threshold is not None else [1, 1]
-        no_flip = 0.0
-        flip = 0.0
-
-        # find all indices in the trace-array, where the value is above init_threshold[1]
-        init_high = np.where(trace[:-1] > init_threshold[1])[0]
-        # find all indices in the trace-array, where the value is below init_threshold[0]
-        init_low = np.where(trace[:-1] < init_threshold[0])[0]
-        # find all indices in the trace-array, where the value is above ana_threshold[1]
-        ana_high = np.where(trace > ana_threshold[1])[0]
-        # find all indices in the trace-array, where the value is below ana_threshold[0]
-        ana_low = np.where(trace < ana_threshold[0])[0]
-
-        if analyze_mode == 'bright' or analyze_mode == 'full':
-            # analyze the trace where the data were the nuclear was initalized into one direction
-            for index in init_high:
-                # check if the following data point is in the analysis array
-                if index + 1 in ana_high:
-                    no_flip = no_flip + 1
-                elif index + 1 in ana_low:
-                    flip = flip + 1
-
-        if analyze_mode == 'dark' or analyze_mode == 'full':
-            # repeat the same if the nucleus was initalized into the other array
-            for index in init_low:
-                # check if the following data point is in the analysis array
-                if index + 1 in ana_high:
-                    flip = flip + 1
-                elif index + 1 in ana_low:
-                    no_flip = no_flip + 1
+        flip, no_flip = count_flips(trace, init_threshold, ana_threshold, analyze_mode)
+        flip = float(flip)
+        no_flip = float(no_flip)
+        probability = np.nan
 
         # the flip probability is given by the number of flips divided by the total number of analyzed data points
         if (flip + no_flip) == 0:
@@ -366,33 +418,9 @@ class TraceAnalysisLogic(GenericLogic):
             self.log.warning('Not enough data points yet!')
 
         # calculate the flip probability
-        no_flip = 0.0
-        flip = 0.0
-        # find all indices in the trace-array, where the value is above init_threshold[1]
-        init_high = np.where(trace[:-1] > init_threshold[1])[0]
-        # find all indices in the trace-array, where the value is below init_threshold[0]
-        init_low = np.where(trace[:-1] < init_threshold[0])[0]
-        # find all indices in the trace-array, where the value is above ana_threshold[1]
-        ana_high = np.where(trace > ana_threshold[1])[0]
-        # find all indices in the trace-array, where the value is below ana_threshold[0]
-        ana_low = np.where(trace < ana_threshold[0])[0]
-
-        if analyze_mode == 'bright' or analyze_mode == 'full':
-            # analyze the trace where the data were the nuclear was initalized into one direction
-            for index in init_high:
-                # check if the following data point is in the analysis array
-                if index + 1 in ana_high:
-                    no_flip = no_flip + 1
-                elif index + 1 in ana_low:
-                    flip = flip + 1
-        if analyze_mode == 'dark' or analyze_mode == 'full':
-            # repeat the same if the nucleus was initalized into the other array
-            for index in init_low:
-                # check if the following data point is in the analysis array
-                if index + 1 in ana_high:
-                    flip = flip + 1
-                elif index + 1 in ana_low:
-                    no_flip = no_flip + 1
+        flip, no_flip = count_flips(trace, init_threshold, ana_threshold, analyze_mode)
+        flip = float(flip)
+        no_flip = float(no_flip)
 
         # the flip probability is given by the number of flips divided by the total number of analyzed data points
         if (flip + no_flip) == 0:
@@ -1055,7 +1083,7 @@ class TraceAnalysisLogic(GenericLogic):
         @return np.array: 1D trace of the length(trace) but now with boolean
                           entries
         """
-        return trace <= threshold
+        return np.asarray(trace) <= threshold
 
     def extract_filtered_values(self, trace, threshold, below=True):
         """ Extract only those values, which are below or equal a certain Threshold.
@@ -352,22 +352,16 @@ class WavemeterLoggerLogic(GenericLogic):
         # The end of the recent_wavelength_window is the time of the latest wavelength data
         self._recent_wavelength_window[1] = self._wavelength_data[-1][0]
 
-        # (speed-up) We only need to worry about "recent" counts, because as the count data gets
-        # very long all the earlier points will already be attached to wavelength values.
-        count_recentness = 100  # TODO: calculate this from count_freq and wavemeter refresh rate
-
         # TODO: Does this depend on things, or do we loop fast enough to get every wavelength value?
         wavelength_recentness = np.min([5, len(self._wavelength_data)])
 
-        recent_counts = np.array(self._counter_logic._data_to_save[-count_recentness:])
         recent_wavelengths = np.array(self._wavelength_data[-wavelength_recentness:])
 
-        # The latest counts are those recorded during the recent_wavelength_window
-        count_idx = [0, 0]
-        count_idx[0] = np.searchsorted(recent_counts[:, 0], self._recent_wavelength_window[0])
-        count_idx[1] = np.searchsorted(recent_counts[:, 0], self._recent_wavelength_window[1])
-
-        latest_counts = recent_counts[count_idx[0]:count_idx[1]]
+        # The latest counts are those recorded during the recent_wavelength_window. Only this time
+        # range is read from the counter recording, all earlier points are already attached to
+        # wavelength values.
+        latest_counts = self._counter_logic._data_to_save.get_time_range(
+            *self._recent_wavelength_window)
 
         # Interpolate to obtain wavelength values at the times of each count
         interpolated_wavelengths = np.interp(latest_counts[:, 0],
@@ -424,7 +418,7 @@ class WavemeterLoggerLogic(GenericLogic):
             self.sig_update_histogram_next.emit(False)
             return
 
-        temp = np.array(self._counter_logic._data_to_save[-count_window:])
+        temp = self._counter_logic._data_to_save[-count_window:]
 
         # only do something if there is wavelength data to work with
         if len(self._wavelength_data) > 0:
@@ -534,7 +528,7 @@ class WavemeterLoggerLogic(GenericLogic):
 
         # prepare the data in a dict or in an OrderedDict:
         data = OrderedDict()
-        data['Time (s),Signal (counts/s)'] = self._counter_logic._data_to_save
+        data['Time (s),Signal (counts/s)'] = self._counter_logic._data_to_save[:]
 
         # write the parameters:
         parameters = OrderedDict()
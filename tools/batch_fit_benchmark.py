@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput benchmark of the batch fitting used by FitLogic.batch_fit.
+
+Fits a stack of synthetic ODMR spectra (one Lorentzian dip each) one after another like
+FitContainer.do_fit does, with fit_stack (optionally with warm start) and in a pool of worker
+processes. Run from the qudi directory with:
+
+    python -m tools.batch_fit_benchmark
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import time
+import numpy as np
+
+from core.util.modules import get_main_dir
+from logic.batch_fitting import FitMethodCollection, ParallelStackFitter, fit_stack
+
+
+def synthetic_spectra(count, points=100, seed=0):
+    """ ODMR spectra with a slowly drifting Lorentzian dip, like neighbouring pixels of a map.
+
+    @return tuple: frequencies, float[count][points] spectra and the true dip positions
+    """
+    rng = np.random.RandomState(seed)
+    x_data = np.linspace(2.82e9, 2.92e9, points)
+    centers = 2.87e9 + 5e6 * np.sin(np.linspace(0, 4 * np.pi, count))
+    fwhm = 5e6
+    dips = 0.2 / (1 + ((x_data[np.newaxis, :] - centers[:, np.newaxis]) / (fwhm / 2))**2)
+    spectra = 1e5 * (1 - dips) + rng.normal(0, 1e3, (count, points))
+    return x_data, spectra, centers
+
+
+def run(count, processes=os.cpu_count()):
+    path_list = [os.path.join(get_main_dir(), 'logic', 'fitmethods')]
+    fit_methods = FitMethodCollection(path_list)
+    fit_method, estimator = fit_methods.get_fit_methods('lorentzian', 'dip')
+    x_data, spectra, centers = synthetic_spectra(count)
+    print('{0:d} spectra with {1:d} points:'.format(*spectra.shape))
+
+    start = time.perf_counter()
+    for y_data in spectra:
+        fit_method(x_axis=x_data, data=y_data, estimator=estimator)
+    print('    sequential make_fit:   {0:8.3f} s'.format(time.perf_counter() - start))
+
+    for warm_start in (False, True):
+        start = time.perf_counter()
+        names, values, errors, success = fit_stack(
+            fit_method, estimator, x_data, spectra, warm_start=warm_start)
+        deviation = np.abs(values[:, names.index('center')] - centers).max()
+        print('    fit_stack (warm {0!s:5}): {1:8.3f} s, {2:d} succeeded, max. center deviation '
+              '{3:.3e} Hz'.format(warm_start, time.perf_counter() - start,
+                                  np.count_nonzero(success), deviation))
+
+    fitter = ParallelStackFitter(processes, path_list)
+    # Start up the worker processes before timing
+    fitter.fit('lorentzian', 'dip', x_data, spectra[:processes])
+    start = time.perf_counter()
+    names, values, errors, success = fitter.fit('lorentzian', 'dip', x_data, spectra)
+    print('    {0:d} worker processes:  {1:8.3f} s, {2:d} succeeded'.format(
+        processes, time.perf_counter() - start, np.count_nonzero(success)))
+    fitter.shutdown()
+
+
+if __name__ == '__main__':
+    run(1000)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the spot detection used by PoiManagerLogic.auto_catch_poi.
+
+Compares core.util.filters.find_spots with the former pure Python implementation of the
+PoiManagerLogic (sliding window over every pixel) on synthetic confocal images.
+Run from the qudi directory with:
+
+    python -m tools.poi_detection_benchmark
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import time
+import numpy as np
+
+from core.util.filters import find_spots
+
+
+def synthetic_image(pixels, spot_count, spot_sigma, seed=0):
+    """ Image with gaussian spots of random brightness on a noisy background.
+
+    @return tuple: the image and the float[n][2] pixel indices of the spots
+    """
+    rng = np.random.RandomState(seed)
+    margin = 4 * spot_sigma
+    spots = rng.uniform(margin, pixels - margin, (spot_count, 2))
+    image = rng.poisson(20, (pixels, pixels)).astype(float)
+    rows, columns = np.indices(image.shape)
+    for (row, column), amplitude in zip(spots, rng.uniform(200, 400, spot_count)):
+        window = (slice(int(row - margin), int(row + margin) + 1),
+                  slice(int(column - margin), int(column + margin) + 1))
+        image[window] += amplitude * np.exp(
+            -((rows[window] - row)**2 + (columns[window] - column)**2) / (2 * spot_sigma**2))
+    return image, spots
+
+
+def legacy_is_spot_shape(local_arr):
+    unspot_e = 0
+    ensem_e = 0
+    len_arr = len(local_arr)
+    mid_f = int(0.5 * len_arr)
+    hm_local_arr = local_arr[mid_f].mean()
+    vm_local_arr = local_arr[:, mid_f].mean()
+    for i in range(0, len_arr):
+        if local_arr[i].mean() > hm_local_arr:
+            ensem_e += 1
+        if local_arr[:, i].mean() > vm_local_arr:
+            ensem_e += 1
+        if hm_local_arr > vm_local_arr * 1.2:
+            unspot_e += 1
+        if vm_local_arr > hm_local_arr * 1.2:
+            unspot_e += 1
+    return ensem_e <= 4 and unspot_e <= 1
+
+
+def legacy_find_spots(scan, filter_size, poi_threshold):
+    """ Former implementation of PoiManagerLogic._local_max and auto_catch_poi. """
+    scan_m = scan.mean()
+    threshold = scan_m * poi_threshold
+    mid_f = int(filter_size / 2)
+    spots = list()
+    for i in range(0, len(scan) - filter_size):
+        for j in range(0, len(scan[i]) - filter_size):
+            local_arr = scan[i:i + filter_size, j:j + filter_size]
+            if scan[i + mid_f][j + mid_f] == local_arr.max() and \
+                    legacy_is_spot_shape(local_arr) and local_arr.mean() > threshold * 0.5 and \
+                    scan[i + mid_f, j + mid_f] > threshold:
+                spots.append((i + mid_f, j + mid_f))
+    return np.array(spots, dtype=float).reshape(-1, 2)
+
+
+def match(found, expected, max_distance):
+    """ Number of expected spots with a found spot closer than max_distance. """
+    if len(found) == 0:
+        return 0
+    distances = np.linalg.norm(expected[:, np.newaxis, :] - found[np.newaxis, :, :], axis=-1)
+    return int(np.count_nonzero(distances.min(axis=1) < max_distance))
+
+
+def run(pixels, spot_count, spot_sigma=2., poi_threshold=5, legacy=True):
+    image, spots = synthetic_image(pixels, spot_count, spot_sigma)
+    filter_size = int(4 * spot_sigma)
+    start = time.perf_counter()
+    found = find_spots(image, filter_size, image.mean() * poi_threshold)
+    duration = time.perf_counter() - start
+    print('{0:d}x{0:d} pixels, {1:d} spots:'.format(pixels, spot_count))
+    print('    find_spots: {0:8.3f} s, {1:d} found, {2:d} matched'.format(
+        duration, len(found), match(found, spots, spot_sigma)))
+    if legacy:
+        start = time.perf_counter()
+        found = legacy_find_spots(image, filter_size, poi_threshold)
+        duration = time.perf_counter() - start
+        print('    legacy:     {0:8.3f} s, {1:d} found, {2:d} matched'.format(
+            duration, len(found), match(found, spots, spot_sigma)))
+
+
+if __name__ == '__main__':
+    run(100, 20)
+    run(400, 300)
+    run(1000, 2000, legacy=False)
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Regression check of the pulse extraction method ungated_conv_deriv.
+
+Extracts the laser pulses of synthetic ungated timetraces with the current implementation of
+BasicPulseExtractor.ungated_conv_deriv and with the former implementation (flank by flank search
+over the whole trace) and checks that the rising/falling flank indices and the laser arrays are
+identical. Also compares the runtime. Run from the qudi directory with:
+
+    python -m tools.pulse_extraction_check
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import logging
+import time
+import numpy as np
+from scipy import ndimage
+
+from logic.pulsed.pulse_extraction_methods.basic_extraction_methods import BasicPulseExtractor
+
+
+class MeasurementSettings:
+    """ Provides the attributes of PulsedMeasurementLogic read by the pulse extractors. """
+
+    def __init__(self, number_of_lasers):
+        self.log = logging.getLogger(__name__)
+        self.measurement_settings = {'number_of_lasers': number_of_lasers}
+        self.fast_counter_settings = {'is_gated': False}
+        self.sampling_information = dict()
+
+
+def synthetic_timetrace(number_of_lasers, period=3000, laser_length=1000, jitter=0, seed=0):
+    """ Poissonian ungated timetrace with laser pulses of a polarization-like shape.
+
+    @return numpy.ndarray: the int64 timetrace
+    """
+    rng = np.random.RandomState(seed)
+    rate = np.full(number_of_lasers * period, 0.5)
+    starts = period // 4 + period * np.arange(number_of_lasers)
+    if jitter > 0:
+        starts += rng.randint(-jitter, jitter + 1, number_of_lasers)
+    pulse = 20 + 10 * np.exp(-np.arange(laser_length) / (laser_length / 5))
+    for start in starts:
+        rate[start:start + laser_length] += pulse
+    return rng.poisson(rate).astype('int64')
+
+
+def legacy_ungated_conv_deriv(count_data, number_of_lasers, conv_std_dev=20.0):
+    """ Former implementation of BasicPulseExtractor.ungated_conv_deriv. """
+    return_dict = {'laser_counts_arr': np.empty(0, dtype='int64'),
+                   'laser_indices_rising': np.empty(0, dtype='int64'),
+                   'laser_indices_falling': np.empty(0, dtype='int64')}
+
+    try:
+        conv = ndimage.filters.gaussian_filter1d(count_data.astype(float), conv_std_dev)
+    except:
+        conv = np.zeros(count_data.size)
+    try:
+        conv_deriv = np.gradient(conv)
+    except:
+        conv_deriv = np.zeros(conv.size)
+
+    if len(conv_deriv.nonzero()[0]) == 0:
+        return_dict['laser_counts_arr'] = np.zeros((number_of_lasers, 10), dtype='int64')
+        return return_dict
+
+    try:
+        conv = ndimage.filters.gaussian_filter1d(count_data.astype(float), 10)
+    except:
+        conv = np.zeros(count_data.size)
+    try:
+        conv_deriv_ref = np.gradient(conv)
+    except:
+        conv_deriv_ref = np.zeros(conv.size)
+
+    rising_ind = np.empty(number_of_lasers, dtype='int64')
+    falling_ind = np.empty(number_of_lasers, dtype='int64')
+
+    for i in range(number_of_lasers):
+        rising_ind[i] = np.argmax(conv_deriv)
+
+        start_ind = int(rising_ind[i] - conv_std_dev)
+        if start_ind < 0:
+            start_ind = 0
+        stop_ind = int(rising_ind[i] + conv_std_dev)
+        if stop_ind > len(conv_deriv):
+            stop_ind = len(conv_deriv)
+        if start_ind == stop_ind:
+            stop_ind = start_ind + 1
+        rising_ind[i] = start_ind + np.argmax(conv_deriv_ref[start_ind:stop_ind])
+
+        if rising_ind[i] < 2 * conv_std_dev:
+            del_ind_start = 0
+        else:
+            del_ind_start = rising_ind[i] - int(2 * conv_std_dev)
+        if (conv_deriv.size - rising_ind[i]) < 2 * conv_std_dev:
+            del_ind_stop = conv_deriv.size - 1
+        else:
+            del_ind_stop = rising_ind[i] + int(2 * conv_std_dev)
+            conv_deriv[del_ind_start:del_ind_stop] = 0
+
+        falling_ind[i] = np.argmin(conv_deriv)
+
+        start_ind = int(falling_ind[i] - conv_std_dev)
+        if start_ind < 0:
+            start_ind = 0
+        stop_ind = int(falling_ind[i] + conv_std_dev)
+        if stop_ind > len(conv_deriv):
+            stop_ind = len(conv_deriv)
+        if start_ind == stop_ind:
+            stop_ind = start_ind + 1
+        falling_ind[i] = start_ind + np.argmin(conv_deriv_ref[start_ind:stop_ind])
+
+        if falling_ind[i] < 2 * conv_std_dev:
+            del_ind_start = 0
+        else:
+            del_ind_start = falling_ind[i] - int(2 * conv_std_dev)
+        if (conv_deriv.size - falling_ind[i]) < 2 * conv_std_dev:
+            del_ind_stop = conv_deriv.size - 1
+        else:
+            del_ind_stop = falling_ind[i] + int(2 * conv_std_dev)
+        conv_deriv[del_ind_start:del_ind_stop] = 0
+
+    rising_ind.sort()
+    falling_ind.sort()
+
+    laser_length = np.max(falling_ind - rising_ind)
+    laser_arr = np.zeros((number_of_lasers, laser_length), dtype='int64')
+    for i in range(number_of_lasers):
+        if rising_ind[i] + laser_length > count_data.size:
+            lenarr = count_data[rising_ind[i]:].size
+            laser_arr[i, 0:lenarr] = count_data[rising_ind[i]:]
+        else:
+            laser_arr[i] = count_data[rising_ind[i]:rising_ind[i] + laser_length]
+
+    return_dict['laser_counts_arr'] = laser_arr.astype('int64')
+    return_dict['laser_indices_rising'] = rising_ind
+    return_dict['laser_indices_falling'] = falling_ind
+    return return_dict
+
+
+def run(number_of_lasers, period=3000, jitter=0, seeds=range(5)):
+    extractor = BasicPulseExtractor(MeasurementSettings(number_of_lasers))
+    durations = np.zeros(2)
+    for seed in seeds:
+        count_data = synthetic_timetrace(number_of_lasers, period, period // 3, jitter, seed)
+        start = time.perf_counter()
+        result = extractor.ungated_conv_deriv(count_data.copy())
+        durations[0] += time.perf_counter() - start
+        start = time.perf_counter()
+        expected = legacy_ungated_conv_deriv(count_data.copy(), number_of_lasers)
+        durations[1] += time.perf_counter() - start
+        for key, value in expected.items():
+            assert np.array_equal(result[key], value), \
+                '{0} differs ({1:d} lasers, period {2:d}, jitter {3:d}, seed {4:d})'.format(
+                    key, number_of_lasers, period, jitter, seed)
+    print('    {0:4d} lasers, period {1:6d}, jitter {2:3d}: identical, {3:8.3f} s (legacy '
+          '{4:8.3f} s)'.format(number_of_lasers, period, jitter, *durations))
+
+
+if __name__ == '__main__':
+    print('ungated_conv_deriv compared with the former implementation:')
+    for lasers in (10, 100, 500):
+        for jitter in (0, 50):
+            run(lasers, jitter=jitter)
+    run(500, period=30000, seeds=range(1))
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the file formats written by tools/samples_write_methods.py.
+
+Writes a waveform chunk by chunk in each file format and compares the throughput with writing the
+same number of bytes to disk without any encoding. If the encoding keeps up with the disk, both
+numbers are about the same. The default waveform has 1 GSample, which needs about 5 GB of free
+disk space (the files are written one after another into a temporary directory created in the
+output directory). Run from the qudi directory with:
+
+    python -m tools.samples_write_benchmark [number_of_samples] [output_directory]
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+from tools.samples_write_methods import SamplesWriteMethods
+
+
+class BenchmarkWriter(SamplesWriteMethods):
+    """ SamplesWriteMethods with the attributes usually provided by the pulser module. """
+
+    def __init__(self, directory, sample_rate=1e9):
+        super().__init__()
+        self.log = logging.getLogger(__name__)
+        self.waveform_dir = directory
+        self.temp_dir = directory
+        self.sample_rate = sample_rate
+
+
+def synthetic_chunk(chunk_length, analog_channels, digital_channels, seed=0):
+    """ Samples of one chunk: a sine on each analog channel and random pulses on the markers.
+
+    @return tuple: analog and digital samples dicts
+    """
+    rng = np.random.RandomState(seed)
+    analog_samples = {chnl: np.sin(np.linspace(0, 200 * np.pi, chunk_length)).astype('float32')
+                      for chnl in analog_channels}
+    # pulses of 1000 samples on average
+    digital_samples = {chnl: np.repeat(rng.rand(chunk_length // 1000 + 1) > 0.5,
+                                       1000)[:chunk_length] for chnl in digital_channels}
+    return analog_samples, digital_samples
+
+
+def write_file(writer, file_format, number_of_samples, chunk_length, analog_samples,
+               digital_samples):
+    """ Writes a waveform of number_of_samples with the same chunk over and over again.
+
+    @return float: duration in seconds
+    """
+    start = time.perf_counter()
+    for start_bin in range(0, number_of_samples, chunk_length):
+        length = min(chunk_length, number_of_samples - start_bin)
+        writer._write_to_file[file_format](
+            name='benchmark',
+            analog_samples={chnl: samples[:length] for chnl, samples in analog_samples.items()},
+            digital_samples={chnl: samples[:length] for chnl, samples in digital_samples.items()},
+            total_number_of_samples=number_of_samples,
+            is_first_chunk=start_bin == 0,
+            is_last_chunk=start_bin + length == number_of_samples)
+    return time.perf_counter() - start
+
+
+def write_raw(filepath, number_of_bytes, chunk_length):
+    """ Writes number_of_bytes without any encoding.
+
+    @return float: duration in seconds
+    """
+    data = np.ones(chunk_length, dtype='uint8')
+    start = time.perf_counter()
+    with open(filepath, 'wb') as file:
+        for start_byte in range(0, number_of_bytes, chunk_length):
+            file.write(data[:min(chunk_length, number_of_bytes - start_byte)])
+    return time.perf_counter() - start
+
+
+def remove_files(directory):
+    for filename in os.listdir(directory):
+        os.remove(os.path.join(directory, filename))
+
+
+def run(number_of_samples, directory, chunk_length=2**24):
+    writer = BenchmarkWriter(directory)
+    # bytes per sample, analog channels and digital channels of each format
+    formats = [('wfm', 5, ['a_ch1'], ['d_ch1', 'd_ch2']),
+               ('wfmx', 5, ['a_ch1'], ['d_ch1', 'd_ch2']),
+               ('fpga', 1, [], ['d_ch{0:d}'.format(chnl) for chnl in range(1, 9)]),
+               ('pstream', None, [], ['d_ch{0:d}'.format(chnl) for chnl in range(1, 9)])]
+    print('{0:d} samples in chunks of {1:d} samples:'.format(number_of_samples, chunk_length))
+    for file_format, bytes_per_sample, analog_channels, digital_channels in formats:
+        analog_samples, digital_samples = synthetic_chunk(chunk_length, analog_channels,
+                                                          digital_channels)
+        duration = write_file(writer, file_format, number_of_samples, chunk_length,
+                              analog_samples, digital_samples)
+        remove_files(directory)
+        line = '    {0:8s} {1:8.2f} s, {2:8.1f} MSamples/s'.format(
+            file_format, duration, number_of_samples / duration / 1e6)
+        if bytes_per_sample is not None:
+            raw_duration = write_raw(os.path.join(directory, 'raw'),
+                                     number_of_samples * bytes_per_sample,
+                                     chunk_length * bytes_per_sample)
+            remove_files(directory)
+            line += ' (unencoded write of the same size: {0:8.2f} s)'.format(raw_duration)
+        print(line)
+
+
+if __name__ == '__main__':
+    samples = int(float(sys.argv[1])) if len(sys.argv) > 1 else 10**9
+    # all files are written to (and removed from) a new temporary directory
+    with tempfile.TemporaryDirectory(dir=sys.argv[2] if len(sys.argv) > 2 else None) as temp_dir:
+        run(samples, temp_dir)
@@ -21,12 +21,123 @@ Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
 top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
 """
 
+import functools
 import os
+import shutil
 import numpy as np
 from collections import OrderedDict
 from lxml import etree as ET
 
 
+def encode_digital_samples(digital_samples, channel_bits, out, scratch=None):
+    """
+    Encodes the boolean samples of several digital channels into one bitmask per sample.
+
+    @param dict digital_samples: bool numpy arrays (values) of the digital channels (keys)
+    @param dict channel_bits: bit position (values) of each digital channel (keys) to encode.
+                              Channels not contained in digital_samples stay low.
+    @param numpy.ndarray out: uint8 array to write the encoded samples into. It is overwritten.
+    @param numpy.ndarray scratch: optional, uint8 array of the same length as out used as
+                                  temporary buffer
+
+    @return numpy.ndarray: out
+    """
+    out[:] = 0
+    if scratch is None:
+        scratch = np.empty(len(out), dtype='uint8')
+    for chnl, bit in channel_bits.items():
+        if chnl not in digital_samples:
+            continue
+        # bool samples are 0/1 bytes, so they can be shifted without converting them first
+        np.left_shift(np.asarray(digital_samples[chnl]).view('uint8'), bit, out=scratch)
+        np.bitwise_or(out, scratch, out=out)
+    return out
+
+
+class StreamingFileWriter:
+    """
+    Keeps files open while the chunks of a waveform are written to them. Small chunks are collected
+    in the write buffer of each file and written to disk in large blocks.
+    """
+    # Size of the write buffer of each file in bytes
+    buffer_size = 16 * 1024 * 1024
+
+    def __init__(self):
+        self._files = dict()
+
+    def open(self, filepath, mode='wb'):
+        """ Opens (or re-opens) a file for writing.
+
+        @param str filepath: path of the file
+        @param str mode: 'wb' to create a new file, 'ab' to append to an existing one
+        """
+        self.close(filepath)
+        self._files[filepath] = open(filepath, mode, buffering=self.buffer_size)
+
+    def is_open(self, filepath):
+        """ Whether a file is currently open in this writer. """
+        return filepath in self._files
+
+    def write(self, filepath, data):
+        """ Writes bytes or the raw content of a numpy array to a file. The file is opened for
+        appending if it is not open yet.
+
+        @param str filepath: path of the file
+        @param bytes|numpy.ndarray data: data to write
+        """
+        if filepath not in self._files:
+            self.open(filepath, 'ab')
+        if isinstance(data, np.ndarray):
+            data = np.ascontiguousarray(data)
+        self._files[filepath].write(data)
+
+    def copy_from(self, filepath, source_path):
+        """ Appends the content of another file to a file.
+
+        @param str filepath: path of the file to append to
+        @param str source_path: path of the file to copy
+        """
+        if filepath not in self._files:
+            self.open(filepath, 'ab')
+        with open(source_path, 'rb') as source:
+            shutil.copyfileobj(source, self._files[filepath], self.buffer_size)
+
+    def close(self, filepath):
+        """ Flushes and closes a file (if it is open).
+
+        @param str filepath: path of the file
+        """
+        file = self._files.pop(filepath, None)
+        if file is not None:
+            file.close()
+
+    def close_all(self):
+        """ Flushes and closes all open files. """
+        for filepath in list(self._files):
+            try:
+                self.close(filepath)
+            except OSError:
+                # the file is removed from the writer anyway, keep closing the others
+                pass
+
+
+def _close_files_on_error(write_method):
+    """
+    Decorator for the write methods of SamplesWriteMethods streaming chunks into open files.
+    If writing a chunk fails, all files kept open by the StreamingFileWriter are closed before the
+    exception is passed on, so no file handles are left behind.
+    """
+    @functools.wraps(write_method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return write_method(self, *args, **kwargs)
+        except BaseException:
+            self._file_writer.close_all()
+            self._pstream_pulses = list()
+            raise
+    return wrapper
+
+
 class SamplesWriteMethods:
     """
     Collection of write-to-file methods used to create hardware compatible files for the pulse
@@ -42,8 +153,47 @@ class SamplesWriteMethods:
         self._write_to_file['seqx'] = self._write_seqx
         self._write_to_file['fpga'] = self._write_fpga
         self._write_to_file['pstream'] = self._write_pstream
+
+        # Files kept open between the chunks of a waveform
+        self._file_writer = StreamingFileWriter()
+        # Reusable buffers for encoding the samples of a chunk
+        self._sample_buffers = dict()
+        # PulseStreamer pulses of the waveform currently written
+        self._pstream_pulses = list()
         return
 
+    def _get_sample_buffer(self, key, length, dtype='uint8'):
+        """
+        Returns a reusable array of the given length. The array is only reallocated if a longer
+        one is needed, so consecutive chunks of a waveform are encoded into the same memory.
+
+        @param str key: name of the buffer
+        @param int length: number of elements needed
+        @param str dtype: data type of the buffer
+        @return numpy.ndarray: array with length elements (content undefined)
+        """
+        buffer = self._sample_buffers.get(key)
+        if buffer is None or len(buffer) < length or buffer.dtype != np.dtype(dtype):
+            buffer = np.empty(length, dtype=dtype)
+            self._sample_buffers[key] = buffer
+        return buffer[:length]
+
+    def _encode_markers(self, markers, digital_samples, out):
+        """
+        Encodes the two markers of an analog channel into bytes (\x01 for marker 1, \x02 for
+        marker 2, \x03 for both).
+
+        @param list markers: the digital channel names of marker 1 and 2
+        @param dict digital_samples: bool numpy arrays (values) of the digital channels (keys)
+        @param numpy.ndarray out: uint8 array to write the encoded markers into
+        @return numpy.ndarray: out
+        """
+        return encode_digital_samples(digital_samples,
+                                      {markers[0]: 0, markers[1]: 1},
+                                      out=out,
+                                      scratch=self._get_sample_buffer('scratch', len(out)))
+
+    @_close_files_on_error
     def _write_wfmx(self, name, analog_samples, digital_samples, total_number_of_samples,
                     is_first_chunk, is_last_chunk):
         """
@@ -72,34 +222,28 @@ class SamplesWriteMethods:
         # record the name of the created files
         created_files = []
 
-        # The overhead of the write process in bytes.
-        # Making this value bigger will result in a faster write process
-        # but consumes more memory
-        write_overhead_bytes = 1024*1024*256 # 256 MB
-        # The overhead of the write process in number of samples
-        write_overhead_samples = write_overhead_bytes//4
-
         # if it is the first chunk, create the .WFMX file with header.
         if is_first_chunk:
             # create header
             self._create_xml_file(total_number_of_samples, self.temp_dir)
             # read back the header xml-file and delete it afterwards
             temp_file = os.path.join(self.temp_dir, 'header.xml')
-            with open(temp_file, 'r') as header:
-                header_lines = header.readlines()
+            with open(temp_file, 'rb') as header:
+                header_bytes = header.read()
             os.remove(temp_file)
 
-            # create wfmx-file for each analog channel
+            # create wfmx-file and temporary marker file for each analog channel. The files stay
+            # open until the last chunk has been written.
             for channel in analog_samples:
                 filename = name + channel[1:] + '.wfmx'
                 created_files.append(filename)
 
                 filepath = os.path.join(self.waveform_dir, filename)
-
-                with open(filepath, 'wb') as wfmxfile:
-                    # write header
-                    for line in header_lines:
-                        wfmxfile.write(bytes(line, 'UTF-8'))
+                self._file_writer.open(filepath, 'wb')
+                # write header
+                self._file_writer.write(filepath, header_bytes)
+                self._file_writer.open(
+                    os.path.join(self.temp_dir, name + channel[1:] + '_digi' + '.tmp'), 'wb')
 
         # append analog samples to the .WFMX files of each channel. Write
         # digital samples in temporary files.
@@ -108,66 +252,20 @@ class SamplesWriteMethods:
             a_chnl_number = int(channel.strip('a_ch'))
             # get marker string descriptors for this analog channel
             markers = ['d_ch'+str((a_chnl_number*2)-1), 'd_ch'+str(a_chnl_number*2)]
-            # append analog samples chunk to .WFMX file
+            # append analog samples in binary format. One sample is 4 bytes (np.float32).
             filepath = os.path.join(self.waveform_dir, name + channel[1:] + '.wfmx')
-            with open(filepath, 'ab') as wfmxfile:
-                # append analog samples in binary format. One sample is 4
-                # bytes (np.float32). Write in chunks if array is very big to
-                # avoid large temporary copys in memory
-                number_of_full_chunks = int(analog_samples[channel].size//write_overhead_samples)
-                for start_ind in np.arange(0, number_of_full_chunks * write_overhead_samples,
-                                           write_overhead_samples):
-                    stop_ind = start_ind+write_overhead_samples
-                    wfmxfile.write(analog_samples[channel][start_ind:stop_ind])
-                # write rest
-                rest_start_ind = number_of_full_chunks*write_overhead_samples
-                wfmxfile.write(analog_samples[channel][rest_start_ind:])
+            self._file_writer.write(filepath, analog_samples[channel])
 
             # create the byte values corresponding to the marker states
             # (\x01 for marker 1, \x02 for marker 2, \x03 for both)
             # and write them into a temporary file
             filepath = os.path.join(self.temp_dir, name + channel[1:] + '_digi' + '.tmp')
-            with open(filepath, 'ab') as tmpfile:
-                if markers[0] not in digital_samples and markers[1] not in digital_samples:
-                    # no digital channels to write for this analog channel
-                    pass
-                elif markers[0] in digital_samples and markers[1] not in digital_samples:
-                    # Only marker one is active for this channel
-                    for start_ind in np.arange(0, number_of_full_chunks * write_overhead_bytes,
-                                               write_overhead_bytes):
-                        stop_ind = start_ind + write_overhead_bytes
-                        # append digital samples in binary format. One sample is 1 byte (np.uint8).
-                        tmpfile.write(digital_samples[markers[0]][start_ind:stop_ind])
-                    # write rest of digital samples
-                    rest_start_ind = number_of_full_chunks * write_overhead_bytes
-                    tmpfile.write(digital_samples[markers[0]][rest_start_ind:])
-                elif markers[0] not in digital_samples and markers[1] in digital_samples:
-                    # Only marker two is active for this channel
-                    for start_ind in np.arange(0, number_of_full_chunks * write_overhead_bytes,
-                                               write_overhead_bytes):
-                        stop_ind = start_ind + write_overhead_bytes
-                        # append digital samples in binary format. One sample is 1 byte (np.uint8).
-                        tmpfile.write(np.left_shift(
-                            digital_samples[markers[1]][start_ind:stop_ind].astype('uint8'),
-                            1))
-                    # write rest of digital samples
-                    rest_start_ind = number_of_full_chunks * write_overhead_bytes
-                    tmpfile.write(np.left_shift(
-                        digital_samples[markers[1]][rest_start_ind:].astype('uint8'), 1))
-                else:
-                    # Both markers are active for this channel
-                    for start_ind in np.arange(0, number_of_full_chunks * write_overhead_bytes,
-                                               write_overhead_bytes):
-                        stop_ind = start_ind + write_overhead_bytes
-                        # append digital samples in binary format. One sample is 1 byte (np.uint8).
-                        tmpfile.write(np.add(np.left_shift(
-                            digital_samples[markers[1]][start_ind:stop_ind].astype('uint8'), 1),
-                            digital_samples[markers[0]][start_ind:stop_ind]))
-                    # write rest of digital samples
-                    rest_start_ind = number_of_full_chunks * write_overhead_bytes
-                    tmpfile.write(np.add(np.left_shift(
-                        digital_samples[markers[1]][rest_start_ind:].astype('uint8'), 1),
-                        digital_samples[markers[0]][rest_start_ind:]))
+            if markers[0] in digital_samples or markers[1] in digital_samples:
+                encoded_markers = self._encode_markers(
+                    markers,
+                    digital_samples,
+                    out=self._get_sample_buffer('markers', analog_samples[channel].size))
+                self._file_writer.write(filepath, encoded_markers)
 
         # append the digital sample tmp file to the .WFMX file and delete the
         # .tmp files if it was the last chunk to write.
@@ -175,19 +273,14 @@ class SamplesWriteMethods:
             for channel in analog_samples:
                 tmp_filepath = os.path.join(self.temp_dir, name + channel[1:] + '_digi' + '.tmp')
                 wfmx_filepath = os.path.join(self.waveform_dir, name + channel[1:] + '.wfmx')
-                with open(wfmx_filepath, 'ab') as wfmxfile:
-                    with open(tmp_filepath, 'rb') as tmpfile:
-                        # read and write files in max. write_overhead_bytes chunks to reduce
-                        # memory usage
-                        while True:
-                            tmp_data = tmpfile.read(write_overhead_bytes)
-                            if not tmp_data:
-                                break
-                            wfmxfile.write(tmp_data)
+                self._file_writer.close(tmp_filepath)
+                self._file_writer.copy_from(wfmx_filepath, tmp_filepath)
+                self._file_writer.close(wfmx_filepath)
                 # delete tmp file
                 os.remove(tmp_filepath)
         return created_files
 
+    @_close_files_on_error
     def _write_wfm(self, name, analog_samples, digital_samples, total_number_of_samples,
                     is_first_chunk, is_last_chunk):
         """
@@ -239,48 +332,39 @@ class SamplesWriteMethods:
             filepath = os.path.join(self.waveform_dir, filename)
 
             if is_first_chunk:
-                with open(filepath, 'wb') as wfm_file:
-                    # write the first line, which is the header file, if first chunk is passed:
-                    num_bytes = str(int(total_number_of_samples * 5))
-                    num_digits = str(len(num_bytes))
-                    header = str.encode('MAGIC 1000\r\n#' + num_digits + num_bytes)
-                    wfm_file.write(header)
+                # the file stays open until the last chunk has been written
+                self._file_writer.open(filepath, 'wb')
+                # write the first line, which is the header file, if first chunk is passed:
+                num_bytes = str(int(total_number_of_samples * 5))
+                num_digits = str(len(num_bytes))
+                header = str.encode('MAGIC 1000\r\n#' + num_digits + num_bytes)
+                self._file_writer.write(filepath, header)
 
             # now write the samples chunk in binary representation:
             # First we create a structured numpy array representing one byte (numpy uint8)
             # for the markers and 4 byte (numpy float32) for the analog samples.
-            write_array = np.empty(analog_samples[channel].size, dtype='float32, uint8')
+            # The array is reused for all chunks of the same size.
+            write_array = self._get_sample_buffer('wfm', analog_samples[channel].size,
+                                                  dtype='float32, uint8')
 
             # now we determine which markers are active for this channel and write them to
             # write_array.
-            if markers[0] in digital_samples and markers[1] in digital_samples:
-                # both markers active for this channel
-                write_array['f1'] = np.add(
-                    np.left_shift(digital_samples[markers[1]][:].astype('uint8'), 1),
-                    digital_samples[markers[0]][:].astype('uint8'))
-            elif markers[0] in digital_samples and markers[1] not in digital_samples:
-                # only marker 1 active for this channel
-                write_array['f1'] = digital_samples[markers[0]][:].astype('uint8')
-            elif markers[0] not in digital_samples and markers[1] in digital_samples:
-                # only marker 2 active for this channel
-                write_array['f1'] = np.left_shift(digital_samples[markers[1]][:].astype('uint8'), 1)
-            else:
-                # no markers active for this channel
-                write_array['f1'] = np.zeros(analog_samples[channel].size, dtype='uint8')
+            self._encode_markers(markers, digital_samples, out=write_array['f1'])
             # Write analog samples into the write_array
-            write_array['f0'] = analog_samples[channel][:]
+            write_array['f0'] = analog_samples[channel]
 
             # Write write_array to file
-            with open(filepath, 'ab') as wfm_file:
-                wfm_file.write(write_array)
-
-                # append footer if it's the last chunk to write
-                if is_last_chunk:
-                    # the footer encodes the sample rate, which was used for that file:
-                    footer = str.encode('CLOCK {0:16.10E}\r\n'.format(self.sample_rate))
-                    wfm_file.write(footer)
+            self._file_writer.write(filepath, write_array)
+
+            # append footer if it's the last chunk to write
+            if is_last_chunk:
+                # the footer encodes the sample rate, which was used for that file:
+                footer = str.encode('CLOCK {0:16.10E}\r\n'.format(self.sample_rate))
+                self._file_writer.write(filepath, footer)
+                self._file_writer.close(filepath)
         return created_files
 
+    @_close_files_on_error
     def _write_fpga(self, name, analog_samples, digital_samples, total_number_of_samples,
                     is_first_chunk, is_last_chunk):
         """
@@ -322,30 +406,34 @@ class SamplesWriteMethods:
         if is_last_chunk and (total_number_of_samples % 32 != 0):
             # calculate number of zero timeslots to append
             number_of_zeros = 32 - (total_number_of_samples % 32)
-            encoded_samples = np.zeros(chunk_length_bins + number_of_zeros, dtype='uint8')
             self.log.warning('FPGA pulse sequence length is no integer multiple of 32 samples. '
                              'Appending {0} zero-samples to the sequence.'.format(number_of_zeros))
         else:
-            encoded_samples = np.zeros(chunk_length_bins, dtype='uint8')
-
-        for chnl_num in range(1, 9):
-            chnl_str = 'd_ch' + str(chnl_num)
-            if chnl_str in digital_samples:
-                encoded_samples[:chunk_length_bins] += (2 ** chnl_num) * np.uint8(
-                    digital_samples[chnl_str])
+            number_of_zeros = 0
+        encoded_samples = self._get_sample_buffer('fpga', chunk_length_bins + number_of_zeros)
+        encoded_samples[chunk_length_bins:] = 0
 
-        del digital_samples  # no longer needed
+        # channel d_ch<n> is encoded in bit n-1 of the sample byte
+        encode_digital_samples(digital_samples,
+                               {'d_ch' + str(chnl_num): chnl_num - 1 for chnl_num in range(1, 9)},
+                               out=encoded_samples[:chunk_length_bins],
+                               scratch=self._get_sample_buffer('scratch', chunk_length_bins))
 
         # append samples to file
         filename = name + '.fpga'
         created_files.append(filename)
 
         filepath = os.path.join(self.waveform_dir, filename)
-        with open(filepath, 'wb') as fpgafile:
-            fpgafile.write(encoded_samples)
+        if is_first_chunk:
+            # the file stays open until the last chunk has been written
+            self._file_writer.open(filepath, 'wb')
+        self._file_writer.write(filepath, encoded_samples)
+        if is_last_chunk:
+            self._file_writer.close(filepath)
 
         return created_files
 
+    @_close_files_on_error
     def _write_pstream(self, name, analog_samples, digital_samples, total_number_of_samples,
                        is_first_chunk, is_last_chunk):
         """
@@ -383,9 +471,9 @@ class SamplesWriteMethods:
         channels are modified and compresses it down to a sequence of pulse elements each with 
         a bitmask and a length. The file is then written to disk. 
         
-        TODO: This is inefficient, as the original PulseElement representation inside Qudi is
-        first decompressed into a sample stream, then recompressed into the PulseStreamer 
-        representation. Work is required to enable the bypass of the interim stage. 
+        The bitmasks of all samples of a chunk are encoded at once and the pulses are found at
+        the positions where the bitmask changes. The pulses of all chunks are collected and the
+        file is written with the last chunk.
 
         @param name: string, represents the name of the sampled ensemble
         @param analog_samples: dict containing float32 numpy ndarrays, contains the
@@ -404,7 +492,6 @@ class SamplesWriteMethods:
         @return list: the list contains the string names of the created files for the passed
                       presampled arrays
         """
-        # FIXME: This method needs to be adapted to "digital_samples" now being a dictionary
         import dill
 
         # record the name of the created files
@@ -417,25 +504,36 @@ class SamplesWriteMethods:
                            ''.format(channel_number))
             return -1
 
-        # fetch locations where digital channel states change, and eliminate duplicates
-        new_channel_indices = np.where(digital_samples[:-1,:] != digital_samples[1:,:])[0]
-        new_channel_indices = np.unique(new_channel_indices)
+        chunk_length_bins = len(digital_samples[list(digital_samples)[0]])
+        # channel d_ch<n> is encoded in bit n-1 of the bitmask
+        bitmasks = encode_digital_samples(
+            digital_samples,
+            {'d_ch' + str(chnl_num): chnl_num - 1 for chnl_num in range(1, 9)},
+            out=self._get_sample_buffer('pstream', chunk_length_bins),
+            scratch=self._get_sample_buffer('scratch', chunk_length_bins))
 
-        # add in indices for the start and end of the sequence to simplify iteration
-        new_channel_indices = np.insert(new_channel_indices, 0, [-1])
-        new_channel_indices = np.insert(new_channel_indices, new_channel_indices.size, [digital_samples.shape[0]-1])
+        # fetch locations where digital channel states change, these are the pulse starts
+        pulse_starts = np.flatnonzero(np.concatenate(([True], bitmasks[1:] != bitmasks[:-1])))
+        durations = np.diff(np.append(pulse_starts, chunk_length_bins))
 
-        pulses = []
-        for new_channel_index in range(1, new_channel_indices.size):
-            pulse = [new_channel_indices[new_channel_index] - new_channel_indices[new_channel_index - 1], _convert_to_bitmask(digital_samples[new_channel_indices[new_channel_index - 1] + 1,:])]
-            pulses.append(pulse)
+        if is_first_chunk:
+            self._pstream_pulses = list()
+        pulses = [[int(duration), int(bitmask)] for duration, bitmask in
+                  zip(durations, bitmasks[pulse_starts])]
+        # merge the first pulse with the last one of the previous chunk if the state is the same
+        if pulses and self._pstream_pulses and self._pstream_pulses[-1][1] == pulses[0][1]:
+            self._pstream_pulses[-1][0] += pulses.pop(0)[0]
+        self._pstream_pulses.extend(pulses)
 
         # append samples to file
         filename = name + '.pstream'
         created_files.append(filename)
 
-        filepath = os.path.join(self.waveform_dir, filename)
-        dill.dump(pulses, open(filepath, 'wb'))
+        if is_last_chunk:
+            filepath = os.path.join(self.waveform_dir, filename)
+            with open(filepath, 'wb') as pstream_file:
+                dill.dump(self._pstream_pulses, pstream_file)
+            self._pstream_pulses = list()
 
         return created_files
 
@@ -595,40 +693,3 @@ class SamplesWriteMethods:
         f = open(filepath, "wb")
         f.write(text[39:-1])
         f.close()
-
-def _convert_to_bitmask(active_channels):
-    """ Convert a list of channels into a bitmask.
-    @param numpy.array active_channels: the list of active channels like
-                        e.g. [0,4,7]. Note that the channels start from 0.
-    @return int: The channel-list is converted into a bitmask (an sequence
-                 of 1 and 0). The returned integer corresponds to such a
-                 bitmask.
-    Note that you can get a binary representation of an integer in python
-    if you use the command bin(<integer-value>). All higher unneeded digits
-    will be dropped, i.e. 0b00100 is turned into 0b100. Examples are
-        bin(0) =    0b0
-        bin(1) =    0b1
-        bin(8) = 0b1000
-    Each bit value (read from right to left) corresponds to the fact that a
-    channel is on or off. I.e. if you have
-        0b001011
-    then it would mean that only channel 0, 1 and 3 are switched to on, the
-    others are off.
-    Helper method for write_pulse_form.
-    """
-    bits = 0  # that corresponds to: 0b0
-    active_channels = np.where(active_channels == True)
-    for channel in active_channels[0]:
-        # go through each list element and create the digital word out of
-        # 0 and 1 that represents the channel configuration. In order to do
-        # that a bitwise shift to the left (<< operator) is performed and
-        # the current channel configuration is compared with a bitwise OR
-        # to check whether the bit was already set. E.g.:
-        #   0b1001 | 0b0110: compare elementwise:
-        #           1 | 0 => 1
-        #           0 | 1 => 1
-        #           0 | 1 => 1
-        #           1 | 1 => 1
-        #                   => 0b1111
-        bits = bits | (1 << channel)
-    return bits
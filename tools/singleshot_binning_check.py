@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Checks the binnings of SingleShotLogic.accumulate_binnings against calc_all_binnings_normalized.
+
+The fast counter returns the whole buffer of readouts with each get_data call while the
+measurement is running. accumulate_binnings is called on such a growing buffer several times and
+has to give the same binnings as calculating them from the complete buffer at once. Run from the
+qudi directory with:
+
+    python -m tools.singleshot_binning_check
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import logging
+import numpy as np
+
+from logic.singleshot_logic import BinningAccumulator, SingleShotLogic
+
+
+class GrowingBufferLogic:
+    """ Provides the attributes of SingleShotLogic used by accumulate_binnings.
+
+    The laser pulses are already summed, sum_laserpulse returns the readouts of the buffer
+    filled so far (the remaining rows of the buffer are zero).
+    """
+
+    def __init__(self, readouts):
+        self.log = logging.getLogger(__name__)
+        self.binning_accumulator = BinningAccumulator()
+        self.data_dict = dict()
+        self._readouts = readouts
+        self._buffer = np.zeros_like(readouts)
+
+    def fill(self, n_rows):
+        self._buffer[:n_rows] = self._readouts[:n_rows]
+        self.data_dict = {'n_rows': n_rows}
+
+    def sum_laserpulse(self):
+        return self._buffer
+
+
+def run(total_rows=3000, num_bins=10, seed=0):
+    readouts = np.random.RandomState(seed).poisson(20, (total_rows, 2)).astype('int64')
+    logic = GrowingBufferLogic(readouts)
+    for n_rows in (total_rows // 3, total_rows // 2, total_rows // 2, total_rows):
+        logic.fill(n_rows)
+        binnings = SingleShotLogic.accumulate_binnings(logic, num_bins=num_bins)
+        expected = list(BinningAccumulator(readouts[:n_rows]).iter_normalized_binnings(num_bins))
+        assert logic.binning_accumulator.n_rows == n_rows, \
+            '{0:d} rows accumulated, expected {1:d}'.format(logic.binning_accumulator.n_rows,
+                                                             n_rows)
+        assert len(binnings) == len(expected)
+        for binning, expected_binning in zip(binnings, expected):
+            assert np.array_equal(binning, expected_binning)
+        print('    {0:5d} rows: {1:d} binnings ok'.format(n_rows, len(binnings)))
+    print('accumulate_binnings on a growing buffer: ok')
+
+
+if __name__ == '__main__':
+    run()